@@ -6,12 +6,14 @@ from dotenv import load_dotenv
 
 from app.extensions import csrf, limiter, talisman, db, migrate, babel
 from app.database import init_db
+from app.utils.geo import preload_translation_memory
 from app.blueprints.main import main_bp
 from app.blueprints.api import api_bp
 from app.blueprints.auth import auth_bp
 from app.blueprints.subscribe import subscribe_bp
 from app.blueprints.admin import admin_bp
-from app.tasks import check_weather_alerts, trigger_daily_forecast_webhooks
+from app.tasks import check_weather_alerts, trigger_daily_forecast_webhooks, ingest_news_feeds, deliver_outbox_emails
+from app.utils.outbox import EMAIL_OUTBOX_WORKERS
 
 def create_app():
     load_dotenv()
@@ -92,6 +94,7 @@ def create_app():
     with app.app_context():
         try:
             init_db()
+            preload_translation_memory()
         except Exception as e:
             app.logger.error(f"Database initialization failed: {e}")
             
@@ -108,6 +111,9 @@ def create_app():
     if not os.environ.get("WERKZEUG_RUN_MAIN") == "true": # Avoid double start in debug mode
         threading.Thread(target=check_weather_alerts, args=(app.app_context(),), daemon=True).start()
         threading.Thread(target=trigger_daily_forecast_webhooks, args=(app.app_context(),), daemon=True).start()
+        threading.Thread(target=ingest_news_feeds, args=(app.app_context(),), daemon=True).start()
+        for _ in range(EMAIL_OUTBOX_WORKERS):
+            threading.Thread(target=deliver_outbox_emails, args=(app.app_context(),), daemon=True).start()
 
     return app
 
@@ -40,8 +40,7 @@ document.addEventListener('DOMContentLoaded', function () {
         
         // Simple markdown-like parsing for bold text
         if (sender === 'bot') {
-            const formattedText = text.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
-            bubble.innerHTML = formattedText;
+            setBotText(bubble, text);
         } else {
             bubble.textContent = text;
         }
@@ -58,6 +57,59 @@ document.addEventListener('DOMContentLoaded', function () {
         }
         
         scrollToBottom();
+        return bubble;
+    }
+
+    function setBotText(bubble, text) {
+        bubble.innerHTML = text.replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>');
+    }
+
+    // Reads the SSE reply, growing one bot bubble as tokens arrive
+    async function readStreamedReply(response) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let bubble = null;
+
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+
+                let eventName = 'message';
+                let dataLine = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) dataLine += line.slice(6);
+                });
+                const data = dataLine ? JSON.parse(dataLine) : {};
+
+                if (eventName === 'token') {
+                    text += data.token;
+                    if (!bubble) {
+                        hideTyping();
+                        bubble = appendMessage('bot', text);
+                    } else {
+                        setBotText(bubble, text);
+                        scrollToBottom();
+                    }
+                } else if (eventName === 'error' && data.reply) {
+                    hideTyping();
+                    if (bubble) setBotText(bubble, text + ' ' + data.reply);
+                    else appendMessage('bot', data.reply);
+                    return;
+                }
+            }
+        }
+
+        hideTyping();
+        if (!bubble) appendMessage('bot', "Sorry, I couldn't answer that.");
     }
 
     function scrollToBottom() {
@@ -105,11 +157,18 @@ document.addEventListener('DOMContentLoaded', function () {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream',
                     'X-CSRFToken': SecurityUtils.getCsrfToken()
                 },
                 body: JSON.stringify(payload)
             });
 
+            const contentType = response.headers.get('Content-Type') || '';
+            if (contentType.startsWith('text/event-stream') && response.body) {
+                await readStreamedReply(response);
+                return;
+            }
+
             const data = await response.json();
             hideTyping();
 
@@ -11,6 +11,8 @@ document.addEventListener('DOMContentLoaded', function () {
         email: document.getElementById('page-email'),
         otp: document.getElementById('page-otp-input'),
         severity: document.getElementById('pref-severity'),
+        digest: document.getElementById('pref-digest'),
+        digestCritical: document.getElementById('pref-digest-critical'),
         checks: {
             severe: document.getElementById('pref-severe'),
             rain: document.getElementById('pref-rain'),
@@ -128,7 +130,9 @@ document.addEventListener('DOMContentLoaded', function () {
 
         return {
             severity: inputs.severity.value,
-            types: selectedTypes
+            types: selectedTypes,
+            digest: inputs.digest.checked,
+            digest_critical: inputs.digest.checked && inputs.digestCritical.checked
         };
     }
 
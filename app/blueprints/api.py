@@ -6,8 +6,7 @@ import concurrent.futures
 import sqlite3
 import re
 from datetime import datetime
-from flask import Blueprint, request, jsonify, abort, Response, current_app, session
-from google import genai
+from flask import Blueprint, request, jsonify, abort, Response, current_app, session, stream_with_context
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 from app import utils
@@ -17,6 +16,10 @@ from app.database import get_db
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
 from app.utils.geo import clean_urdu_text, clean_dict_values
+from app.utils.ai_gateway import ai_available, generate_text, stream_text
+from app.utils.chat import get_chat_weather_context, chat_cache_key, get_cached_chat_answer, store_chat_answer
+from app.utils.health import calculate_health_risks, enrich_health_risks, estimate_uv_index, pressure_trend
+from app.utils.packing import get_packing_list
 
 # Caches
 CITY_CACHE = {}
@@ -249,43 +252,9 @@ def api_travel_packing_list():
     if not destination:
         return jsonify({"error": "Missing destination"}), 400
 
-    gemini_key = os.environ.get("GEMINI_API_KEY")
-    if not gemini_key:
-        return jsonify({
-            "items": [
-                {"category": "essentials", "item": "Passport"},
-                {"category": "clothing", "item": "Jacket"},
-                {"category": "electronics", "item": "Power Bank"}
-            ]
-        })
-
-    try:
-        client = genai.Client(api_key=gemini_key.strip())
-        prompt = f"""
-        Generate a smart packing list for a {days}-day trip to {destination}.
-        Weather forecast: {weather_summary}.
-        
-        Return JSON with a list of items grouped by category.
-        Format:
-        {{
-            "items": [
-                {{"category": "Clothing", "item": "Raincoat (Heavy rain expected)", "icon": "fa-tshirt"}},
-                {{"category": "Gadgets", "item": "Universal Adapter", "icon": "fa-plug"}},
-                ...
-            ]
-        }}
-        Limit to 10-12 most important items.
-        """
-        
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=prompt,
-            config={'response_mime_type': 'application/json'}
-        )
-        return jsonify(json.loads(response.text))
-    except Exception as e:
-        current_app.logger.error(f"Packing List AI Error: {e}")
-        return jsonify({"items": []})
+    # Trips are bucketed by climate, duration and precipitation, so popular
+    # destinations are served from the cache or the rule list
+    return jsonify(get_packing_list(days, weather_summary))
 
 @api_bp.route('/learn/trivia')
 def api_learn_trivia():
@@ -527,76 +496,66 @@ def api_weather_health():
     cache_key = f"health_{round(float(lat), 1)}_{round(float(lon), 1)}"
     now_ts = datetime.utcnow().timestamp()
     
+    # Risk levels come from the local rule engine; the model only rewords them
+    # in the background, so the answer never waits on AI availability.
     if cache_key in WEATHER_CACHE:
         entry = WEATHER_CACHE[cache_key]
         if now_ts - entry['timestamp'] < 3600: 
-            return jsonify(entry['data'])
+            return jsonify(enrich_health_risks(entry['data']))
 
     try:
         api_key = os.environ.get("OPENWEATHER_API_KEY")
-        url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&units=metric&appid={api_key}"
-        w_res = requests.get(url, timeout=5)
-        if not w_res.ok:
-            return jsonify({"error": "Weather data unavailable"}), 502
-        w_data = w_res.json()
-        
-        weather_summary = (
-            f"Temp: {w_data['main']['temp']}C, Humidity: {w_data['main']['humidity']}%, "
-            f"Pressure: {w_data['main']['pressure']}hPa, Window: {w_data['wind']['speed']}m/s, "
-            f"Condition: {w_data['weather'][0]['description']}"
-        )
-        
-        prompt = f"""
-        Analyze this weather for health impacts: "{weather_summary}".
-        Return ONLY valid JSON (no markdown) with this structure:
-        {{
-            "migraine": {{"risk": "Low/Medium/High", "reason": "short explanation"}},
-            "arthritis": {{"risk": "Low/Medium/High", "reason": "short explanation"}},
-            "respiratory": {{"risk": "Low/Medium/High", "reason": "short explanation"}},
-            "uv_skin": {{"risk": "Low/Medium/High", "reason": "short explanation"}},
-            "general_advice": "One sentence summary."
-        }}
-        """
-        
-        gemini_key = os.environ.get("GEMINI_API_KEY")
-        if not gemini_key:
-             return jsonify({
-                 "migraine": {"risk": "Unknown", "reason": "AI unavailable"},
-                 "general_advice": "Stay safe!"
-             })
-
-        client = genai.Client(api_key=gemini_key.strip())
-        try:
-            response = client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=prompt,
-                config={'response_mime_type': 'application/json'}
-            )
-            analysis = json.loads(response.text)
-        except Exception as e:
-            current_app.logger.warning(f"Gemini 2.0 error: {e}. Trying fallback.")
+        current_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&units=metric&appid={api_key}"
+        forecast_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&units=metric&cnt=3&appid={api_key}"
+        pollution_url = f"https://api.openweathermap.org/data/2.5/air_pollution?lat={lat}&lon={lon}&appid={api_key}"
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+            future_current = executor.submit(http_session.get, current_url, timeout=5)
+            future_forecast = executor.submit(http_session.get, forecast_url, timeout=5)
+            future_pollution = executor.submit(http_session.get, pollution_url, timeout=5)
+
+            w_res = future_current.result()
+            if not w_res.ok:
+                return jsonify({"error": "Weather data unavailable"}), 502
+            w_data = w_res.json()
+
+            # Pressure trend and AQI sharpen the rules but are optional
+            forecast_list = []
+            try:
+                forecast_res = future_forecast.result()
+                forecast_res.raise_for_status()
+                forecast_list = forecast_res.json().get('list', [])
+            except Exception as e:
+                current_app.logger.warning(f"Health forecast fetch failed (non-critical): {e}")
+
+            aqi = None
             try:
-                response = client.models.generate_content(
-                    model="gemini-1.5-flash",
-                    contents=prompt,
-                    config={'response_mime_type': 'application/json'}
-                )
-                analysis = json.loads(response.text)
-            except Exception as e2:
-                 current_app.logger.error(f"All Gemini models failed: {e2}")
-                 return jsonify({
-                     "migraine": {"risk": "Unknown", "reason": "Service busy"},
-                     "arthritis": {"risk": "Unknown", "reason": "Service busy"},
-                     "respiratory": {"risk": "Unknown", "reason": "Service busy"},
-                     "uv_skin": {"risk": "Unknown", "reason": "Service busy"},
-                     "general_advice": "Health insights currently unavailable due to high demand. Please try again later."
-                 })
+                pollution_res = future_pollution.result()
+                pollution_res.raise_for_status()
+                components = pollution_res.json()['list'][0].get('components', {})
+                aqi = utils.calculate_aqi(components.get('pm2_5', 0), components.get('pm10', 0))['value']
+            except Exception as e:
+                current_app.logger.warning(f"Health air quality fetch failed (non-critical): {e}")
+
+        main = w_data['main']
+        risks = calculate_health_risks(
+            temperature=main['temp'],
+            humidity=main['humidity'],
+            pressure_change=pressure_trend(main.get('pressure'), forecast_list),
+            wind_speed=w_data.get('wind', {}).get('speed', 0),
+            uv_index=estimate_uv_index(
+                float(lat), w_data.get('dt', now_ts),
+                w_data.get('sys', {}).get('sunrise'), w_data.get('sys', {}).get('sunset'),
+                w_data.get('clouds', {}).get('all', 0)
+            ),
+            aqi=aqi
+        )
         
         WEATHER_CACHE[cache_key] = {
             "timestamp": now_ts,
-            "data": analysis
+            "data": risks
         }
-        return jsonify(analysis)
+        return jsonify(enrich_health_risks(risks))
 
     except Exception as e:
         current_app.logger.error(f"Health API error: {e}")
@@ -810,37 +769,7 @@ def api_leaderboard():
             
     return jsonify(leaders)
 
-@api_bp.route("/ai_chat", methods=["POST"])
-@csrf.exempt
-@limiter.limit("20 per minute")
-def api_ai_chat():
-    data = request.get_json()
-    message = data.get('message')
-    lat = data.get('lat')
-    lon = data.get('lon')
-
-    if not message:
-        return jsonify({"error": "Message is required"}), 400
-
-    # Context gathering
-    weather_context = "User location is unknown."
-    if lat and lon:
-        try:
-            api_key = os.environ.get("OPENWEATHER_API_KEY")
-            url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&units=metric&appid={api_key}"
-            w_res = requests.get(url, timeout=3)
-            if w_res.ok:
-                w_data = w_res.json()
-                weather_context = (
-                    f"User Location: {w_data.get('name', 'Unknown')}. "
-                    f"Current Weather: {w_data['main']['temp']}C, "
-                    f"{w_data['weather'][0]['description']}. "
-                    f"Humidity: {w_data['main']['humidity']}%. "
-                    f"Wind: {w_data['wind']['speed']} m/s."
-                )
-        except Exception as e:
-            current_app.logger.warning(f"Chat weather context failed: {e}")
-
+def _build_chat_prompt(message, weather_context):
     # Prompt Engineering
     system_instruction = (
         "You are SynoCast AI, a friendly and expert weather assistant. "
@@ -849,25 +778,79 @@ def api_ai_chat():
         "If asked about the website features, mention: 'I can help with Weather visuals, News, Travel packing, and Learning modules.' "
         "Available context: " + weather_context
     )
+    return f"{system_instruction}\nUser: {message}\nAssistant:"
+
+CHAT_OFFLINE_REPLY = "I'm currently offline (API Key missing). Please check back later!"
+CHAT_ERROR_REPLY = "I'm having trouble thinking right now. Please try again."
 
+def _sse_event(payload, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(payload)}\n\n"
+
+def _stream_chat_reply(prompt, cache_key):
+    """SSE body: a `token` event per chunk, then `done`, or `error` with a fallback reply."""
+    chunks = []
     try:
-        gemini_key = os.environ.get("GEMINI_API_KEY")
-        if not gemini_key:
-            return jsonify({"reply": "I'm currently offline (API Key missing). Please check back later!"})
+        for chunk in stream_text(prompt, "chat", cache=False):
+            chunks.append(chunk)
+            yield _sse_event({"token": chunk}, "token")
+        store_chat_answer(cache_key, "".join(chunks).strip())
+        yield _sse_event({}, "done")
+    except Exception as e:
+        current_app.logger.error(f"Chat AI stream error: {e}")
+        yield _sse_event({"reply": None if chunks else CHAT_ERROR_REPLY}, "error")
 
-        client = genai.Client(api_key=gemini_key.strip())
-        prompt = f"{system_instruction}\nUser: {message}\nAssistant:"
-        
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=prompt
+@api_bp.route("/ai_chat", methods=["POST"])
+@csrf.exempt
+@limiter.limit("20 per minute")
+def api_ai_chat():
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Invalid JSON body"}), 400
+    message = data.get('message')
+    lat = data.get('lat')
+    lon = data.get('lon')
+
+    if not message:
+        return jsonify({"error": "Message is required"}), 400
+    if not isinstance(message, str):
+        return jsonify({"error": "Message must be a string"}), 400
+
+    # Clients that accept SSE get tokens as they are generated; everyone else
+    # keeps the original single JSON reply.
+    wants_stream = request.accept_mimetypes.best_match(["application/json", "text/event-stream"]) == "text/event-stream"
+
+    if not ai_available():
+        if wants_stream:
+            return Response(_sse_event({"reply": CHAT_OFFLINE_REPLY}, "error"), mimetype="text/event-stream")
+        return jsonify({"reply": CHAT_OFFLINE_REPLY})
+
+    # Near-identical questions from the same area and weather share one answer;
+    # personal or long messages always get a fresh one.
+    weather_context, bucket = get_chat_weather_context(lat, lon)
+    cache_key = chat_cache_key(message, lat, lon, bucket)
+    cached = get_cached_chat_answer(cache_key)
+    if cached:
+        if wants_stream:
+            return Response(_sse_event({"token": cached}, "token") + _sse_event({}, "done"), mimetype="text/event-stream")
+        return jsonify({"reply": cached})
+
+    prompt = _build_chat_prompt(message, weather_context)
+
+    if wants_stream:
+        return Response(
+            stream_with_context(_stream_chat_reply(prompt, cache_key)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
         )
-        
-        return jsonify({"reply": response.text})
 
+    try:
+        reply = generate_text(prompt, "chat", cache=False)
+        store_chat_answer(cache_key, reply)
+        return jsonify({"reply": reply})
     except Exception as e:
         current_app.logger.error(f"Chat AI Error: {e}")
-        return jsonify({"reply": "I'm having trouble thinking right now. Please try again."})
+        return jsonify({"reply": CHAT_ERROR_REPLY})
 
 @api_bp.route("/user/badges")
 def api_user_badges():
@@ -1,8 +1,8 @@
 import os
 import json
 from app import utils
-from flask import Blueprint, render_template, jsonify, current_app, send_from_directory
-from flask_babel import gettext as _
+from flask import Blueprint, render_template, stream_template, jsonify, current_app, send_from_directory
+from flask_babel import gettext as _, get_locale
 
 main_bp = Blueprint('main', __name__)
 
@@ -57,62 +57,65 @@ def health_check():
 
 @main_bp.route("/")
 def home():
-    gemini_key = os.environ.get("GEMINI_API_KEY")
-    news_key = os.environ.get("NEWS_API_KEY")
-    gnews_key = os.environ.get("GNEWS_API_KEY")
-    
     seo_meta = {
         "description": "SynoCast provides AI-enhanced weather storytelling, hyper-local forecasts, and curated weather news using Gemini AI.",
         "keywords": "weather, AI weather, weather news, local forecast, SynoCast, climate events, severe weather alerts"
     }
     
-    # Latest Headlines - Specifcally Pakistan Weather via GNews
-    raw_latest = utils.fetch_gnews_weather(query="Pakistan weather", page_size=10, api_key=gnews_key)
-    if not raw_latest:
-        raw_latest = utils.fetch_weather_news(query="weather news headlines breaking", page_size=10, api_key=news_key)
-        
-    latest_news = utils.categorize_news_with_ai(raw_latest, gemini_key)
-    
-    # Around The World news
-    raw_world = utils.fetch_weather_news(query="global weather news headlines", page_size=10, api_key=news_key)
-    world_news = utils.categorize_news_with_ai(raw_world, gemini_key)
+    # Snapshots are kept fresh by the news ingestion worker. The page is streamed
+    # so the head and navigation flush before the news sections resolve; any
+    # section not ready in time renders as a placeholder. Card loops are served
+    # from the fragment cache until the next snapshot is published.
+    locale = str(get_locale())
+    page_data = utils.stream_page_data(
+        {
+            "latest_news": lambda: utils.render_news_fragments(
+                "latest", {"latest_news": ("news_latest_fragment.html", None)}, locale=locale
+            )["latest_news"],
+            "world_news": lambda: utils.render_news_fragments(
+                "world", {"world_news": ("news_cards_fragment.html", None)}, locale=locale
+            )["world_news"],
+        }
+    )
     
-    return render_template(
+    return stream_template(
         "home.html", 
         active_page="home", 
-        latest_news=latest_news,
-        world_news=world_news,
-        meta=seo_meta
+        meta=seo_meta,
+        **page_data
     )
 
 @main_bp.route("/news")
 def news():
-    gemini_key = os.environ.get("GEMINI_API_KEY")
-    news_key = os.environ.get("NEWS_API_KEY")
-    gnews_key = os.environ.get("GNEWS_API_KEY")
-    
     seo_meta = {
         "description": "Stay updated with SynoCast's AI-curated weather headlines, breaking alerts, and featured climate stories from around the globe.",
         "keywords": "breaking news, weather alerts, climate change stories, storm warnings, weather news today"
     }
     
-    raw_news = utils.fetch_gnews_weather(query="Pakistan weather", page_size=15, api_key=gnews_key)
-    if not raw_news or (raw_news and raw_news[0].get('source', {}).get('name') == 'SynoNews'):
-         raw_news = utils.fetch_weather_news(query="weather news headlines breaking global", page_size=20, api_key=news_key)
-    
-    all_categorized = utils.categorize_news_with_ai(raw_news, gemini_key)
-    
-    breaking_news = [a for a in all_categorized if a.get('urgency') in ['Critical', 'High']]
-    featured_news = [a for a in all_categorized if a.get('category') in ['Climate Events', 'Weather Impact News', 'Hydrological Updates']]
-    
-    if not breaking_news: breaking_news = all_categorized[:4]
-    if not featured_news: featured_news = all_categorized[4:8]
-
-    return render_template(
+    def pick_breaking(articles):
+        breaking = [a for a in articles if a.get('urgency') in ['Critical', 'High']]
+        return breaking or articles[:4]
+
+    def pick_featured(articles):
+        featured = [a for a in articles if a.get('category') in ['Climate Events', 'Weather Impact News', 'Hydrological Updates']]
+        return featured or articles[4:8]
+
+    locale = str(get_locale())
+    sections = utils.stream_page_data(
+        {"news": lambda: utils.render_news_fragments("news", {
+            "breaking_lead": ("news_breaking_fragment.html", pick_breaking),
+            "breaking_news": ("news_cards_fragment.html", pick_breaking),
+            "featured_news": ("news_cards_fragment.html", pick_featured),
+        }, locale=locale)},
+        placeholders={"news": {}}
+    )["news"]
+
+    return stream_template(
         "news.html", 
         active_page="news", 
-        breaking_news=breaking_news,
-        featured_news=featured_news,
+        breaking_lead=sections.derive(lambda s: s.get("breaking_lead")),
+        breaking_news=sections.derive(lambda s: s.get("breaking_news")),
+        featured_news=sections.derive(lambda s: s.get("featured_news")),
         meta=seo_meta
     )
 
@@ -182,22 +185,25 @@ def compare_cities():
 @main_bp.route("/weather")
 def weather():
     dt_info = utils.get_local_time_string()
-    gemini_key = os.environ.get("GEMINI_API_KEY")
-    news_key = os.environ.get("NEWS_API_KEY")
     
     seo_meta = {
         "description": "Get detailed local weather forecasts, interactive maps, and AI-driven weather insights with SynoCast.",
         "keywords": "local weather, hourly forecast, weather map, AI weather recommendations, humidity, wind speed"
     }
     
-    raw_weather = utils.fetch_weather_news(query="local weather forecast updates", country=dt_info.get('country'), page_size=10, api_key=news_key)
-    weather_news = utils.categorize_news_with_ai(raw_weather, gemini_key)
+    country = dt_info.get('country')
+    locale = str(get_locale())
+    page_data = utils.stream_page_data(
+        {"weather_news": lambda: utils.render_news_fragments(
+            "weather", {"weather_news": ("news_cards_fragment.html", None)}, country=country, locale=locale
+        )["weather_news"]}
+    )
     
-    return render_template(
+    return stream_template(
         "weather.html", 
         active_page="weather", 
-        weather_news=weather_news,
-        meta=seo_meta
+        meta=seo_meta,
+        **page_data
     )
 
 @main_bp.route("/subscribe")
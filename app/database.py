@@ -84,6 +84,36 @@ def init_db():
                 conn.execute("ALTER TABLE subscriptions ADD COLUMN lat REAL")
             if "lon" not in columns:
                 conn.execute("ALTER TABLE subscriptions ADD COLUMN lon REAL")
+
+            # Grid cells (0.1 degree) for indexed location lookups of push subscriptions,
+            # kept in sync by triggers so every writer (sqlite3 or SQLAlchemy) is covered
+            cursor.execute("PRAGMA table_info(push_subscriptions)")
+            push_columns = [column[1] for column in cursor.fetchall()]
+            if "cell_lat" not in push_columns:
+                conn.execute("ALTER TABLE push_subscriptions ADD COLUMN cell_lat INTEGER")
+            if "cell_lon" not in push_columns:
+                conn.execute("ALTER TABLE push_subscriptions ADD COLUMN cell_lon INTEGER")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_push_subscriptions_cell ON push_subscriptions(cell_lat, cell_lon)")
+            for event in ("INSERT", "UPDATE OF lat, lon"):
+                trigger = "push_subscriptions_cell_" + event.split()[0].lower()
+                conn.execute(
+                    f"""
+                    CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON push_subscriptions
+                    BEGIN
+                        UPDATE push_subscriptions
+                        SET cell_lat = CAST(round(NEW.lat * 10) AS INTEGER),
+                            cell_lon = CAST(round(NEW.lon * 10) AS INTEGER)
+                        WHERE id = NEW.id;
+                    END
+                    """
+                )
+            conn.execute(
+                """
+                UPDATE push_subscriptions
+                SET cell_lat = CAST(round(lat * 10) AS INTEGER), cell_lon = CAST(round(lon * 10) AS INTEGER)
+                WHERE lat IS NOT NULL AND cell_lat IS NULL
+                """
+            )
                 
             conn.commit()
             
@@ -206,6 +236,104 @@ def init_db():
                 """
             )
             
+            # Translation Memory (Urdu <-> English address strings)
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS translation_memory (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    source_text TEXT NOT NULL, -- normalized source string
+                    direction TEXT NOT NULL, -- 'ur-en' or 'en-ur'
+                    translated_text TEXT NOT NULL,
+                    origin TEXT, -- 'dictionary' or 'gemini'
+                    created_at TEXT NOT NULL,
+                    UNIQUE(source_text, direction)
+                )
+                """
+            )
+            
+            # Persistent AI response cache shared by all Gemini call sites
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS ai_response_cache (
+                    cache_key TEXT PRIMARY KEY, -- digest of (model, prompt, config)
+                    use_case TEXT,
+                    model TEXT,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_cache_expires ON ai_response_cache(expires_at)")
+
+            # Ledger of delivered weather alerts, so each cycle only sends new or updated ones
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS sent_alerts (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    subscriber TEXT NOT NULL, -- email address or push endpoint
+                    channel TEXT NOT NULL, -- 'email' or 'push'
+                    alert_key TEXT NOT NULL, -- identity: event, sender, start
+                    fingerprint TEXT NOT NULL, -- identity plus end time and wording
+                    sent_at REAL NOT NULL,
+                    alert_end REAL
+                )
+                """
+            )
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sent_alerts_delivery ON sent_alerts(subscriber, channel, alert_key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sent_alerts_end ON sent_alerts(alert_end)")
+
+            # Durable outbox drained by the email delivery workers
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS email_outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    to_email TEXT NOT NULL,
+                    subject TEXT NOT NULL,
+                    text_content TEXT,
+                    html_content TEXT,
+                    priority INTEGER DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'pending', -- pending, sending, sent, dead
+                    attempts INTEGER DEFAULT 0,
+                    next_attempt_at REAL NOT NULL,
+                    claimed_at REAL,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    sent_at REAL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)")
+
+            # Last significant forecast per 0.1 degree cell, diffed by the alert poller
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS forecast_fingerprints (
+                    cell TEXT PRIMARY KEY, -- "lat,lon"
+                    fingerprint TEXT NOT NULL,
+                    summary TEXT NOT NULL, -- JSON string
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+
+            # Alerts held back for a subscriber's next digest message
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS alert_digest_queue (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    subscriber TEXT NOT NULL, -- email address or push endpoint
+                    channel TEXT NOT NULL, -- email, push
+                    alert_key TEXT NOT NULL,
+                    alert TEXT NOT NULL, -- JSON string, latest version of the alert
+                    target TEXT, -- JSON string, push subscription info
+                    queued_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_alert_digest_entry ON alert_digest_queue(subscriber, channel, alert_key)")
+
             # Seed Badges
             conn.execute("INSERT OR IGNORE INTO badges (name, description, icon) VALUES ('Reliable Source', 'Submitted 5 accurate reports', 'fa-check-circle')")
 
@@ -1,4 +1,6 @@
+from sqlalchemy import event
 from app.extensions import db
+from app.utils.geo import grid_cell
 from datetime import datetime
 
 class Subscriber(db.Model):
@@ -57,7 +59,16 @@ class PushSubscription(db.Model):
     auth = db.Column(db.String(200))
     lat = db.Column(db.Float)
     lon = db.Column(db.Float)
+    # 0.1 degree grid cell, set on every write (and by triggers in the raw SQLite schema, see init_db)
+    cell_lat = db.Column(db.Integer)
+    cell_lon = db.Column(db.Integer)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
         return f'<PushSubscription {self.id}>'
+
+@event.listens_for(PushSubscription, "before_insert")
+@event.listens_for(PushSubscription, "before_update")
+def _set_push_subscription_cell(mapper, connection, target):
+    target.cell_lat = grid_cell(target.lat) if target.lat is not None else None
+    target.cell_lon = grid_cell(target.lon) if target.lon is not None else None
@@ -1,13 +1,44 @@
 import json
-import os
 import logging
-from pywebpush import webpush, WebPushException
 from app.models.user import PushSubscription
 from app.extensions import db
+from app.services.push_dispatcher import get_push_dispatcher
+from app.utils.geo import grid_cell_bounds, haversine_km
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_ALERT_RADIUS_KM = 50
+
+def _subscription_info(subscription):
+    if isinstance(subscription, PushSubscription):
+        return {
+            "endpoint": subscription.endpoint,
+            "keys": {
+                "p256dh": subscription.p256dh,
+                "auth": subscription.auth
+            }
+        }
+    return subscription
+
 class NotificationService:
+    @staticmethod
+    def _remove_dead_subscriptions(endpoints):
+        """Deletes dead subscriptions through the SQLAlchemy session the subscriptions came from."""
+        endpoints = list(endpoints)
+        if not endpoints:
+            return 0
+        try:
+            removed = PushSubscription.query.filter(
+                PushSubscription.endpoint.in_(endpoints)
+            ).delete(synchronize_session=False)
+            db.session.commit()
+            logger.info(f"Removed {removed} dead push subscriptions")
+            return removed
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error removing dead subscriptions: {e}")
+            return 0
+
     @staticmethod
     def send_push_notification(subscription_info, data):
         """
@@ -15,66 +46,58 @@ class NotificationService:
         subscription_info: dict or PushSubscription model containing endpoint, keys
         data: dict containing title, body, url, etc.
         """
-        
-        vapid_private_key = os.environ.get("VAPID_PRIVATE_KEY")
-        vapid_public_key = os.environ.get("VAPID_PUBLIC_KEY")
-        
-        if not vapid_private_key or not vapid_public_key:
+        dispatcher = get_push_dispatcher()
+        if not dispatcher:
             logger.error("VAPID keys not configured.")
             return False
 
-        # Handle both dict and Model object
-        if isinstance(subscription_info, PushSubscription):
-            sub_info = {
-                "endpoint": subscription_info.endpoint,
-                "keys": {
-                    "p256dh": subscription_info.p256dh,
-                    "auth": subscription_info.auth
-                }
-            }
-        else:
-            sub_info = subscription_info
-
-        try:
-            webpush(
-                subscription_info=sub_info,
-                data=json.dumps(data),
-                vapid_private_key=vapid_private_key,
-                vapid_claims={"sub": "mailto:admin@synocast.com"}
-            )
-            return True
-        except WebPushException as ex:
-            logger.error(f"WebPush Error: {ex}")
-            if ex.response and ex.response.status_code == 410:
-                # Subscription expired/gone, remove from DB
-                NotificationService._remove_dead_subscription(sub_info['endpoint'])
-            return False
-        except Exception as e:
-            logger.error(f"Notification Error: {e}")
-            return False
+        results, _ = dispatcher.dispatch(
+            [(_subscription_info(subscription_info), json.dumps(data))],
+            prune=NotificationService._remove_dead_subscriptions
+        )
+        return results[0]
 
     @staticmethod
-    def _remove_dead_subscription(endpoint):
-        try:
-            sub = PushSubscription.query.filter_by(endpoint=endpoint).first()
-            if sub:
-                db.session.delete(sub)
-                db.session.commit()
-                logger.info(f"Removed dead subscription: {endpoint}")
-        except Exception as e:
-            logger.error(f"Error removing dead subscription: {e}")
+    def subscriptions_near(lat, lon, radius_km):
+        """Push subscriptions within radius_km of a point, via the grid-cell index."""
+        min_lat, max_lat, min_lon, max_lon = grid_cell_bounds(lat, lon, radius_km)
+        candidates = PushSubscription.query.filter(
+            PushSubscription.cell_lat.between(min_lat, max_lat),
+            PushSubscription.cell_lon.between(min_lon, max_lon)
+        ).all()
+        return [sub for sub in candidates if haversine_km(lat, lon, sub.lat, sub.lon) <= radius_km]
 
     @staticmethod
-    def broadcast_weather_alert(alert_data, min_severity='High'):
+    def broadcast_weather_alert(alert_data, min_severity='High', lat=None, lon=None, radius_km=None):
         """
-        Broadcast alert to all subscribers (naive impl - ideally filter by location)
+        Broadcast alert to the subscribers inside its area: within radius_km of
+        (lat, lon). Each is taken from the arguments, else from alert_data
+        (radius defaults to DEFAULT_ALERT_RADIUS_KM). Without a location the
+        alert goes to every subscriber.
         """
-        subs = PushSubscription.query.all()
-        for sub in subs:
-            # TODO: Add location filtering here based on sub.lat/lon vs alert_data location
-            NotificationService.send_push_notification(sub, {
-                "title": f"Weather Alert: {alert_data.get('event')}",
-                "body": f"{alert_data.get('headline')}",
-                "url": "/weather",
-                "icon": "/assets/logo/logo-small.png"
-            })
+        dispatcher = get_push_dispatcher()
+        if not dispatcher:
+            logger.error("VAPID keys not configured.")
+            return None
+
+        lat = alert_data.get('lat') if lat is None else lat
+        lon = alert_data.get('lon') if lon is None else lon
+        if radius_km is None:
+            radius_km = alert_data.get('radius_km', DEFAULT_ALERT_RADIUS_KM)
+        if lat is not None and lon is not None:
+            subs = NotificationService.subscriptions_near(float(lat), float(lon), float(radius_km))
+        else:
+            subs = PushSubscription.query.all()
+
+        data = json.dumps({
+            "title": f"Weather Alert: {alert_data.get('event')}",
+            "body": f"{alert_data.get('headline')}",
+            "url": "/weather",
+            "icon": "/assets/logo/logo-small.png"
+        })
+        _, stats = dispatcher.dispatch(
+            [(_subscription_info(sub), data) for sub in subs],
+            prune=NotificationService._remove_dead_subscriptions
+        )
+        logger.info(f"Weather alert broadcast: {stats}")
+        return stats
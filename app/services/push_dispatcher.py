@@ -0,0 +1,148 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+import concurrent.futures
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from py_vapid import Vapid
+from pywebpush import WebPusher
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+PUSH_WORKERS = int(os.environ.get("PUSH_WORKERS", 32))
+PUSH_TTL = 24 * 3600 # seconds a push service keeps an undelivered message
+PUSH_TIMEOUT = 10
+VAPID_TOKEN_LIFETIME = 12 * 3600 # the maximum push services accept
+VAPID_REFRESH_MARGIN = 3600 # re-sign this long before a token expires
+
+# Push services answer these for subscriptions that will never work again
+DEAD_SUBSCRIPTION_STATUSES = (404, 410)
+
+class PushDispatcher:
+    """
+    Sends Web Push messages concurrently. Messages are grouped by push-service
+    origin, each origin gets one pooled HTTP session and one VAPID header that
+    is reused until shortly before it expires, and endpoints the push service
+    reports as gone are deleted in bulk after the run.
+    """
+    def __init__(self, vapid_private_key, subject, workers=PUSH_WORKERS):
+        self.vapid = Vapid.from_string(private_key=vapid_private_key)
+        self.subject = subject
+        self.workers = workers
+        self._headers = {} # {audience: (expires_at, headers)}
+        self._lock = threading.Lock()
+
+    def vapid_headers(self, audience):
+        with self._lock:
+            cached = self._headers.get(audience)
+            if cached and cached[0] - time.time() > VAPID_REFRESH_MARGIN:
+                return cached[1]
+            expires_at = int(time.time()) + VAPID_TOKEN_LIFETIME
+            headers = self.vapid.sign({"sub": self.subject, "aud": audience, "exp": expires_at})
+            self._headers[audience] = (expires_at, headers)
+            return headers
+
+    def dispatch(self, messages, prune=None):
+        """
+        Sends [(subscription_info, data)] and returns (results, stats), where
+        results[i] is True if message i was accepted by its push service.
+        Dead endpoints are removed with `prune(endpoints)`, which should use the
+        same database layer the subscriptions were read from (default: sqlite).
+        """
+        started = time.monotonic()
+        by_origin = {}
+        for index, (subscription_info, data) in enumerate(messages):
+            url = urlparse(subscription_info["endpoint"])
+            by_origin.setdefault(f"{url.scheme}://{url.netloc}", []).append(index)
+
+        sessions = {}
+        for origin in by_origin:
+            session = requests.Session()
+            session.mount(origin, HTTPAdapter(pool_connections=1, pool_maxsize=self.workers))
+            sessions[origin] = session
+
+        def send(index, origin):
+            subscription_info, data = messages[index]
+            response = WebPusher(subscription_info, requests_session=sessions[origin]).send(
+                data,
+                dict(self.vapid_headers(origin)),
+                ttl=PUSH_TTL,
+                content_encoding="aes128gcm",
+                timeout=PUSH_TIMEOUT
+            )
+            return response.status_code
+
+        results = [False] * len(messages)
+        dead_endpoints = set()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="push") as executor:
+            futures = {
+                executor.submit(send, index, origin): index
+                for origin, indexes in by_origin.items()
+                for index in indexes
+            }
+            for future in concurrent.futures.as_completed(futures):
+                index = futures[future]
+                try:
+                    status = future.result()
+                except Exception as e:
+                    logger.error(f"Push error: {e}")
+                    continue
+                if status <= 202:
+                    results[index] = True
+                elif status in DEAD_SUBSCRIPTION_STATUSES:
+                    dead_endpoints.add(messages[index][0]["endpoint"])
+                else:
+                    logger.warning(f"Push rejected with {status}")
+
+        for session in sessions.values():
+            session.close()
+        pruned = (prune or prune_push_subscriptions)(dead_endpoints)
+
+        stats = {
+            "messages": len(messages),
+            "sent": sum(results),
+            "pruned": pruned,
+            "origins": len(by_origin),
+            "seconds": round(time.monotonic() - started, 2),
+        }
+        return results, stats
+
+def prune_push_subscriptions(endpoints):
+    """Deletes dead subscriptions in one transaction. Returns how many were removed."""
+    endpoints = list(endpoints)
+    if not endpoints:
+        return 0
+    removed = 0
+    try:
+        with get_db() as conn:
+            for i in range(0, len(endpoints), 500):
+                chunk = endpoints[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                removed += conn.execute(
+                    f"DELETE FROM push_subscriptions WHERE endpoint IN ({placeholders})", chunk
+                ).rowcount
+            conn.commit()
+        logger.info(f"Removed {removed} dead push subscriptions")
+    except sqlite3.Error as e:
+        logger.error(f"Error removing dead subscriptions: {e}")
+    return removed
+
+_DISPATCHER = {"key": None, "dispatcher": None}
+_DISPATCHER_LOCK = threading.Lock()
+
+def get_push_dispatcher():
+    """Shared dispatcher (so signed VAPID headers survive between sends), or None without VAPID keys."""
+    private_key = os.environ.get("VAPID_PRIVATE_KEY")
+    if not private_key:
+        return None
+    with _DISPATCHER_LOCK:
+        if _DISPATCHER["dispatcher"] is None or _DISPATCHER["key"] != private_key:
+            # One contact for every sender; NotificationService used to sign as admin@synocast.com
+            subject = f"mailto:{os.environ.get('REPLY_TO_EMAIL', 'support@synocast.app')}"
+            _DISPATCHER["dispatcher"] = PushDispatcher(private_key, subject)
+            _DISPATCHER["key"] = private_key
+        return _DISPATCHER["dispatcher"]
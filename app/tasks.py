@@ -3,36 +3,188 @@ import json
 import time
 import requests
 import sqlite3
+import threading
+import concurrent.futures
+from collections import defaultdict
 from datetime import datetime, timedelta, timezone
-from pywebpush import webpush, WebPushException
+from requests.adapters import HTTPAdapter
 from app.database import get_db
+from app.services.push_dispatcher import get_push_dispatcher
 import app.utils as utils
 
-def send_push_notification(subscription_info, message_body, vapid_private_key, vapid_claims):
-    """Helper to send web push"""
-    try:
-        webpush(
-            subscription_info=subscription_info,
-            data=message_body,
-            vapid_private_key=vapid_private_key,
-            vapid_claims=vapid_claims
-        )
-        return True
-    except WebPushException as ex:
-        print(f"WebPush Error: {ex}")
-        return False
-    except Exception as e:
-        print(f"Push Error: {e}")
-        return False
+# Alert polling fans out over location cells; bounded so a wide subscriber
+# spread neither exhausts threads nor trips the OpenWeatherMap rate limit
+ALERT_POLL_WORKERS = int(os.environ.get("ALERT_POLL_WORKERS", 8))
+ALERT_POLL_MAX_RPS = float(os.environ.get("ALERT_POLL_MAX_RPS", 10))
+ALERT_POLL_TIMEOUT = 5
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across threads."""
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_slot = time.monotonic()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def fetch_cells(locations, build_url, parse, workers=None, max_rps=None):
+    """
+    Fetches one OpenWeatherMap URL per (lat, lon) cell on a bounded,
+    rate-limited pool. Returns ({"lat,lon": parse(json)}, stats); cells that
+    failed are left out.
+    """
+    workers = workers or ALERT_POLL_WORKERS
+    limiter = RateLimiter(max_rps if max_rps is not None else ALERT_POLL_MAX_RPS)
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+
+    def fetch(cell):
+        limiter.wait()
+        res = session.get(build_url(*cell), timeout=ALERT_POLL_TIMEOUT)
+        res.raise_for_status()
+        return parse(res.json())
+
+    started = time.monotonic()
+    results = {}
+    failed = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="alert-poll") as executor:
+        futures = {executor.submit(fetch, cell): cell for cell in locations}
+        for future in concurrent.futures.as_completed(futures):
+            lat_r, lon_r = futures[future]
+            loc_key = f"{lat_r},{lon_r}"
+            try:
+                results[loc_key] = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"Failed to fetch {loc_key}: {e}")
+    session.close()
+
+    stats = {
+        "locations": len(locations),
+        "fetched": len(results),
+        "failed": failed,
+        "seconds": round(time.monotonic() - started, 2),
+    }
+    return results, stats
+
+def fetch_location_alerts(locations, api_key, workers=None, max_rps=None):
+    """
+    Fetches One Call alerts and the hourly forecast for every (lat, lon) cell.
+    Returns ({"lat,lon": {"alerts": [...], "hourly": [...]}}, stats).
+    """
+    conditions, stats = fetch_cells(
+        locations,
+        lambda lat_r, lon_r: f"https://api.openweathermap.org/data/2.5/onecall?lat={lat_r}&lon={lon_r}&exclude=minutely,daily&units=metric&appid={api_key}",
+        lambda data: {"alerts": data.get('alerts', []), "hourly": data.get('hourly', [])},
+        workers, max_rps
+    )
+    stats["with_alerts"] = sum(1 for cell in conditions.values() if cell["alerts"])
+    return conditions, stats
+
+def fetch_location_forecasts(locations, api_key, workers=None, max_rps=None):
+    """
+    Fetches the next day of 3-hour forecast steps for every (lat, lon) cell.
+    Returns ({"lat,lon": {"steps": [...], "utc_offset": seconds}}, stats).
+    """
+    return fetch_cells(
+        locations,
+        lambda lat_r, lon_r: f"https://api.openweathermap.org/data/2.5/forecast?lat={lat_r}&lon={lon_r}&units=metric&cnt={utils.THRESHOLD_FORECAST_STEPS}&appid={api_key}",
+        lambda data: {"steps": data.get('list', []), "utc_offset": data.get('city', {}).get('timezone', 0)},
+        workers, max_rps
+    )
+
+def alert_push_payload(alerts):
+    """Push message for one alert, or a combined one for a digest."""
+    if len(alerts) == 1:
+        return json.dumps({
+            "title": f"⚠️ {alerts[0]['event']}",
+            "body": alerts[0].get('description', 'Severe weather alert in your area.'),
+            "url": "/weather"
+        })
+    return json.dumps({
+        "title": f"⚠️ {len(alerts)} weather alerts",
+        "body": ", ".join(alert.get('event', 'Weather alert') for alert in alerts),
+        "url": "/weather"
+    })
+
+def flush_alert_digests():
+    """
+    Sends every digest whose window has elapsed: one email and one push per
+    subscriber. Delivered alerts go to the sent-alert ledger; undelivered
+    digests stay queued for the next cycle.
+    """
+    emailed, delivered = [], []
+    for email, digest in utils.due_digests("email").items():
+        if digest["alerts"] and not utils.send_alert_digest_email(email, digest["alerts"]):
+            continue
+        emailed.extend((email, alert) for alert in digest["alerts"])
+        delivered.append(email)
+    utils.record_sent_alerts("email", emailed)
+    utils.clear_digests("email", delivered)
+
+    pushed, delivered = [], []
+    push_messages, push_digests = [], []
+    for endpoint, digest in utils.due_digests("push").items():
+        if digest["alerts"] and digest["target"]:
+            push_messages.append((digest["target"], alert_push_payload(digest["alerts"])))
+            push_digests.append((endpoint, digest["alerts"]))
+        else:
+            delivered.append(endpoint) # every queued alert has ended
+    dispatcher = get_push_dispatcher()
+    if push_messages and dispatcher:
+        results, _ = dispatcher.dispatch(push_messages)
+        for (endpoint, alerts), ok in zip(push_digests, results):
+            if ok:
+                pushed.extend((endpoint, alert) for alert in alerts)
+                delivered.append(endpoint)
+    utils.record_sent_alerts("push", pushed)
+    utils.clear_digests("push", delivered)
+
+    if emailed or pushed:
+        print(f"Alert digests: {len(emailed)} alerts emailed, {len(pushed)} pushed")
+
+def check_threshold_alerts(email_subscribers, api_key):
+    """
+    Evaluates the custom thresholds of every email subscriber that has some.
+    The forecast is fetched once per cell and all of its subscribers are
+    checked in one pass. Returns ({email: [alerts]}, {email: "lat,lon"}).
+    """
+    threshold_cells = {
+        email: f"{round(lat, 1)},{round(lon, 1)}"
+        for email, lat, lon, prefs_json in email_subscribers
+        if utils.stored_thresholds(prefs_json)
+    }
+    if not threshold_cells:
+        return {}, {}
+    threshold_subscribers = [
+        (email, threshold_cells[email], prefs_json)
+        for email, _, _, prefs_json in email_subscribers
+        if email in threshold_cells
+    ]
+    forecast_cells = {tuple(map(float, loc_key.split(","))) for loc_key in threshold_cells.values()}
+    forecasts, forecast_stats = fetch_location_forecasts(forecast_cells, api_key)
+    custom_alerts = utils.threshold_alerts(
+        threshold_subscribers,
+        {loc_key: cell["steps"] for loc_key, cell in forecasts.items()},
+        {loc_key: cell["utc_offset"] for loc_key, cell in forecasts.items()}
+    )
+    print(
+        f"Threshold check: {len(threshold_subscribers)} subscribers over "
+        f"{forecast_stats['fetched']}/{forecast_stats['locations']} cells, "
+        f"{len(custom_alerts)} with exceedances, {forecast_stats['seconds']}s"
+    )
+    return custom_alerts, threshold_cells
 
 def check_weather_alerts(app_context):
     """Background task to check for severe weather alerts for all subscribers."""
     with app_context:
         OPENWEATHER_API_KEY = os.environ.get("OPENWEATHER_API_KEY")
-        VAPID_PRIVATE_KEY = os.environ.get("VAPID_PRIVATE_KEY")
-        VAPID_CLAIMS = {
-            "sub": f"mailto:{os.environ.get('REPLY_TO_EMAIL', 'support@synocast.app')}"
-        }
         
         while True:
             try:
@@ -51,54 +203,125 @@ def check_weather_alerts(app_context):
                     cursor.execute("SELECT endpoint, p256dh, auth, lat, lon FROM push_subscriptions WHERE lat IS NOT NULL")
                     push_subscribers = cursor.fetchall()
                 
-                # Cache alerts by location to avoid rate limits
-                active_alerts_cache = {}
-                locations = set()
-                for _, lat, lon, _ in email_subscribers:
-                    locations.add((round(lat, 1), round(lon, 1)))
-                for _, _, _, lat, lon in push_subscribers:
-                    locations.add((round(lat, 1), round(lon, 1)))
-
-                for lat_r, lon_r in locations:
-                    loc_key = f"{lat_r},{lon_r}"
-                    alert_url = f"https://api.openweathermap.org/data/2.5/onecall?lat={lat_r}&lon={lon_r}&exclude=minutely,hourly,daily&appid={OPENWEATHER_API_KEY}"
-                    try:
-                        res = requests.get(alert_url, timeout=5)
-                        if res.ok:
-                            active_alerts_cache[loc_key] = res.json().get('alerts', [])
-                    except Exception as e:
-                        print(f"Failed to fetch alerts for {loc_key}: {e}")
+                # Digests whose window has elapsed go out whether or not anything changed
+                flush_alert_digests()
 
-                # Notify Email Subscribers
+                # Fetch alerts once per location cell, shared by all its subscribers
+                cell_subscribers = defaultdict(list)
                 for email, lat, lon, prefs_json in email_subscribers:
-                    loc_key = f"{round(lat, 1)},{round(lon, 1)}"
-                    alerts = active_alerts_cache.get(loc_key, [])
-                    if not alerts: continue
-                    
-                    prefs = json.loads(prefs_json) if prefs_json else {"types": ["severe", "rain", "temp", "air"]}
+                    cell_subscribers[f"{round(lat, 1)},{round(lon, 1)}"].append(("email", email, prefs_json or ""))
+                for endpoint, _, _, lat, lon in push_subscribers:
+                    cell_subscribers[f"{round(lat, 1)},{round(lon, 1)}"].append(("push", endpoint, ""))
+                locations = {tuple(map(float, loc_key.split(","))) for loc_key in cell_subscribers}
+
+                conditions, poll_stats = fetch_location_alerts(locations, OPENWEATHER_API_KEY)
+                active_alerts_cache = {loc_key: cell["alerts"] for loc_key, cell in conditions.items()}
+                coverage = 100 * poll_stats["fetched"] / poll_stats["locations"] if poll_stats["locations"] else 100
+                print(
+                    f"Alert poll: {poll_stats['fetched']}/{poll_stats['locations']} cells ({coverage:.0f}% coverage), "
+                    f"{poll_stats['failed']} failed, {poll_stats['with_alerts']} with alerts, {poll_stats['seconds']}s"
+                )
+
+                # Issued-alert fan-out only runs for cells whose alerts, forecast or subscribers
+                # changed meaningfully since the last notification; the rest are skipped
+                summaries = {
+                    loc_key: utils.forecast_summary(
+                        cell["alerts"], cell["hourly"], utils.stable_digest(sorted(cell_subscribers[loc_key]))
+                    )
+                    for loc_key, cell in conditions.items()
+                }
+                changed_cells, baselines = utils.detect_forecast_changes(summaries)
+                print(f"Forecast changes: {len(changed_cells)}/{len(summaries)} cells changed")
+
+                # Only alerts a subscriber hasn't received yet (or that were
+                # updated since) are sent; still-active ones are skipped
+                email_ledger = utils.load_sent_alerts("email")
+                push_ledger = utils.load_sent_alerts("push")
+                emailed, pushed = [], []
+
+                # Subscribers who opted into digests get low-priority alerts
+                # (or all of them, if they chose so) batched; the rest go out at once
+                email_prefs = {email: prefs_json for email, _, _, prefs_json in email_subscribers}
+                email_digest = []
+                # Cells with a failed delivery keep their old baseline so they are retried
+                failed_cells = set()
+
+                # Notify Email Subscribers: preferences are matched per cell as a
+                # bitwise AND of each alert's category mask with all subscriber masks
+                email_cells = utils.index_subscribers_by_cell(email_subscribers)
+                for loc_key, (emails, masks) in email_cells.items():
+                    if loc_key not in changed_cells: continue
+                    for alert in active_alerts_cache.get(loc_key, []):
+                        for email in utils.subscribers_for_alert(emails, masks, alert):
+                            if utils.is_alert_unsent(email_ledger, email, alert):
+                                if utils.should_digest_alert(alert, email_prefs[email]):
+                                    email_digest.append((email, alert, None))
+                                    continue
+                                advice = utils.get_ai_advice(alert)
+                                if utils.send_alert_email(email, alert, advice):
+                                    emailed.append((email, alert))
+                                else:
+                                    failed_cells.add(loc_key)
+
+                # Custom threshold alerts are evaluated for every cell each cycle: a
+                # limit can be crossed by hours rolling into the forecast window or a
+                # new local day without the cell's summary changing
+                custom_alerts, threshold_cells = check_threshold_alerts(email_subscribers, OPENWEATHER_API_KEY)
+                for email, alerts in custom_alerts.items():
                     for alert in alerts:
-                        if utils.is_alert_relevant(alert, prefs):
+                        if utils.is_alert_unsent(email_ledger, email, alert):
+                            if utils.should_digest_alert(alert, email_prefs[email]):
+                                email_digest.append((email, alert, None))
+                                continue
                             advice = utils.get_ai_advice(alert)
-                            utils.send_alert_email(email, alert, advice)
+                            if utils.send_alert_email(email, alert, advice):
+                                emailed.append((email, alert))
+                            else:
+                                failed_cells.add(threshold_cells[email])
 
-                # Notify Push Subscribers
+                # Notify Push Subscribers: collected first, then sent concurrently
+                push_messages, push_alerts = [], []
                 for endpoint, p256dh, auth, lat, lon in push_subscribers:
                     loc_key = f"{round(lat, 1)},{round(lon, 1)}"
-                    alerts = active_alerts_cache.get(loc_key, [])
+                    alerts = active_alerts_cache.get(loc_key, []) if loc_key in changed_cells else []
                     if not alerts: continue
 
                     for alert in alerts:
-                        if alert.get('event'):
-                            push_data = json.dumps({
-                                "title": f"⚠️ {alert['event']}",
-                                "body": alert.get('description', 'Severe weather alert in your area.'),
-                                "url": "/weather"
-                            })
+                        if alert.get('event') and utils.is_alert_unsent(push_ledger, endpoint, alert):
+                            # Push subscriptions store no preferences, so they never opt into digests
                             subscription_info = {
                                 "endpoint": endpoint,
                                 "keys": {"p256dh": p256dh, "auth": auth}
                             }
-                            send_push_notification(subscription_info, push_data, VAPID_PRIVATE_KEY, VAPID_CLAIMS)
+                            push_messages.append((subscription_info, alert_push_payload([alert])))
+                            push_alerts.append((endpoint, alert, loc_key))
+
+                dispatcher = get_push_dispatcher()
+                results = [False] * len(push_messages)
+                if push_messages and dispatcher:
+                    results, push_stats = dispatcher.dispatch(push_messages)
+                    print(
+                        f"Push fan-out: {push_stats['sent']}/{push_stats['messages']} sent to "
+                        f"{push_stats['origins']} push services, {push_stats['pruned']} dead subscriptions pruned, "
+                        f"{push_stats['seconds']}s"
+                    )
+                for (endpoint, alert, loc_key), ok in zip(push_alerts, results):
+                    if ok:
+                        pushed.append((endpoint, alert))
+                    else:
+                        failed_cells.add(loc_key)
+
+                utils.queue_digest_alerts("email", email_digest)
+                utils.record_sent_alerts("email", emailed)
+                utils.record_sent_alerts("push", pushed)
+                # Baselines only move once this cycle's notifications are recorded
+                utils.save_forecast_baselines({
+                    loc_key: baseline for loc_key, baseline in baselines.items() if loc_key not in failed_cells
+                })
+                print(
+                    f"Alert delivery: {len(emailed)} emails, {len(pushed)} pushes sent, "
+                    f"{len(email_digest)} alerts queued for digests"
+                )
 
                 time.sleep(3600)  # Check every hour
             except Exception as e:
@@ -182,3 +405,27 @@ def trigger_daily_forecast_webhooks(app_context):
             except Exception as e:
                 print(f"Daily forecast webhook task error: {e}")
                 time.sleep(60)
+
+def ingest_news_feeds(app_context):
+    """Background task that refreshes the news feed snapshots read by the page handlers."""
+    with app_context:
+        while True:
+            try:
+                started = time.monotonic()
+                utils.refresh_news_feeds()
+                print(f"News ingestion refreshed {len(utils.NEWS_SNAPSHOTS)} feeds in {time.monotonic() - started:.1f}s")
+                time.sleep(utils.NEWS_INGEST_INTERVAL)
+            except Exception as e:
+                print(f"News ingestion task error: {e}")
+                time.sleep(60)
+
+def deliver_outbox_emails(app_context):
+    """Background worker that drains the email outbox; several run side by side."""
+    with app_context:
+        while True:
+            try:
+                if not utils.process_email_outbox():
+                    utils.wait_for_outbox_work()
+            except Exception as e:
+                print(f"Email outbox worker error: {e}")
+                time.sleep(60)
@@ -6,3 +6,14 @@ from .impact import *
 from .economy import *
 from .notifications import *
 from .science import *
+from .ai_cache import *
+from .ai_gateway import *
+from .page_data import *
+from .chat import *
+from .health import *
+from .packing import *
+from .alerts import *
+from .outbox import *
+from .thresholds import *
+from .forecast_changes import *
+from .digest import *
@@ -0,0 +1,94 @@
+import json
+import random
+import hashlib
+import logging
+import sqlite3
+from datetime import datetime
+from app.database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Seconds each kind of AI answer stays valid in the persistent cache
+AI_CACHE_TTLS = {
+    "news_categorization": 6 * 3600,
+    "alert_advice": 6 * 3600,
+    "weather_health": 3600,
+    "packing_list": 7 * 86400,
+    "chat": 600,
+    "translation": 30 * 86400,
+}
+DEFAULT_AI_CACHE_TTL = 3600
+
+def stable_digest(*parts):
+    """
+    Deterministic BLAKE2 digest of JSON-serializable parts. Unlike the built-in
+    hash(), it is identical across processes and restarts, so it is safe for
+    keys shared between workers or persisted to the database.
+    """
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=20).hexdigest()
+
+def ai_cache_key(model, prompt, config=None):
+    """Stable digest of a model request."""
+    return stable_digest({"model": model, "prompt": prompt, "config": config or {}})
+
+def get_cached_ai_response(cache_key):
+    """Returns the cached response text, or None if missing or expired."""
+    try:
+        with get_db() as conn:
+            row = conn.execute(
+                "SELECT response FROM ai_response_cache WHERE cache_key = ? AND expires_at > ?",
+                (cache_key, datetime.utcnow().timestamp())
+            ).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logger.warning(f"AI cache read failed: {e}")
+        return None
+
+def get_cached_ai_responses(cache_keys):
+    """Bulk variant of get_cached_ai_response(): returns {cache_key: response} for live entries."""
+    results = {}
+    cache_keys = list(cache_keys)
+    now_ts = datetime.utcnow().timestamp()
+    try:
+        with get_db() as conn:
+            for i in range(0, len(cache_keys), 500):
+                chunk = cache_keys[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT cache_key, response FROM ai_response_cache "
+                    f"WHERE expires_at > ? AND cache_key IN ({placeholders})",
+                    [now_ts] + chunk
+                ).fetchall()
+                results.update(rows)
+    except sqlite3.Error as e:
+        logger.warning(f"AI cache read failed: {e}")
+    return results
+
+def set_cached_ai_response(cache_key, use_case, response, model=None, ttl=None):
+    set_cached_ai_responses({cache_key: response}, use_case, model=model, ttl=ttl)
+
+def set_cached_ai_responses(responses, use_case, model=None, ttl=None):
+    """Stores {cache_key: response} in one transaction."""
+    if not responses:
+        return
+    if ttl is None:
+        ttl = AI_CACHE_TTLS.get(use_case, DEFAULT_AI_CACHE_TTL)
+    now_ts = datetime.utcnow().timestamp()
+    rows = [(key, use_case, model, response, now_ts, now_ts + ttl) for key, response in responses.items()]
+    try:
+        with get_db() as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO ai_response_cache
+                    (cache_key, use_case, model, response, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            # Opportunistic cleanup keeps the table from growing without a cron job
+            if random.random() < 0.01:
+                conn.execute("DELETE FROM ai_response_cache WHERE expires_at <= ?", (now_ts,))
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.warning(f"AI cache write failed: {e}")
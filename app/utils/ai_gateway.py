@@ -0,0 +1,187 @@
+import os
+import re
+import json
+import time
+import queue
+import logging
+import threading
+from google import genai
+from app.utils.ai_cache import ai_cache_key, get_cached_ai_response, set_cached_ai_response
+
+logger = logging.getLogger(__name__)
+
+# Models are tried in this order until one answers within the deadline
+AI_MODELS = [m.strip() for m in os.environ.get("GEMINI_MODELS", "gemini-2.0-flash-exp,gemini-1.5-flash").split(",") if m.strip()]
+AI_TIMEOUT = float(os.environ.get("AI_TIMEOUT", 20))  # seconds, per call including fallbacks
+AI_MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", 4))
+
+_AI_SEMAPHORE = threading.BoundedSemaphore(AI_MAX_CONCURRENCY)
+_CLIENT_LOCK = threading.Lock()
+_CLIENT = {"key": None, "client": None}
+
+_JSON_FENCE_RE = re.compile(r"^```(?:json)?\s*(.*?)\s*```$", re.DOTALL)
+
+class AIGatewayError(RuntimeError):
+    """Raised when no model produced a usable answer (missing key, busy, timeout or bad output)."""
+
+def ai_available():
+    return bool(os.environ.get("GEMINI_API_KEY"))
+
+def get_ai_client():
+    """Returns the shared Gemini client, rebuilding it only if the API key changes."""
+    api_key = (os.environ.get("GEMINI_API_KEY") or "").strip()
+    if not api_key:
+        raise AIGatewayError("GEMINI_API_KEY not set")
+
+    with _CLIENT_LOCK:
+        if _CLIENT["client"] is None or _CLIENT["key"] != api_key:
+            _CLIENT["client"] = genai.Client(
+                api_key=api_key,
+                http_options={"timeout": int(AI_TIMEOUT * 1000)}
+            )
+            _CLIENT["key"] = api_key
+        return _CLIENT["client"]
+
+def parse_json_response(text):
+    """Parses a model JSON answer, tolerating a surrounding markdown code fence."""
+    text = (text or "").strip()
+    fenced = _JSON_FENCE_RE.match(text)
+    if fenced:
+        text = fenced.group(1)
+    return json.loads(text)
+
+def _generate(prompt, use_case, models, config, timeout, parse, cache, ttl):
+    models = models or AI_MODELS
+    # Keyed on the preferred model: a fallback answer stands in for it until expiry
+    cache_key = ai_cache_key(models[0], prompt, config) if cache else None
+    if cache_key:
+        cached = get_cached_ai_response(cache_key)
+        if cached is not None:
+            try:
+                return parse(cached) if parse else cached
+            except Exception:
+                logger.warning(f"Discarding unparsable cached {use_case} response")
+
+    client = get_ai_client()
+    deadline = time.monotonic() + (timeout or AI_TIMEOUT)
+    last_error = None
+
+    for model in models:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            last_error = last_error or TimeoutError("deadline exceeded")
+            break
+        if not _AI_SEMAPHORE.acquire(timeout=remaining):
+            last_error = TimeoutError("all AI slots busy")
+            break
+
+        try:
+            call_config = dict(config or {})
+            call_config["http_options"] = {"timeout": max(1, int(remaining * 1000))}
+            text = client.models.generate_content(model=model, contents=prompt, config=call_config).text
+            if not text:
+                raise ValueError("empty response")
+            result = parse(text) if parse else text.strip()
+        except Exception as e:
+            logger.warning(f"AI {use_case} call to {model} failed: {e}")
+            last_error = e
+            continue
+        finally:
+            _AI_SEMAPHORE.release()
+
+        if cache_key:
+            set_cached_ai_response(cache_key, use_case, text, model=model, ttl=ttl)
+        return result
+
+    raise AIGatewayError(f"AI {use_case} unavailable: {last_error}")
+
+def generate_text(prompt, use_case, models=None, config=None, timeout=None, cache=True, ttl=None):
+    """
+    Runs a prompt through the shared client with bounded concurrency, a deadline
+    and ordered model fallback. Answers are served from and stored in the
+    persistent AI response cache. Raises AIGatewayError if nothing answered.
+    """
+    return _generate(prompt, use_case, models, config, timeout, None, cache, ttl)
+
+def generate_json(prompt, use_case, models=None, config=None, timeout=None, cache=True, ttl=None):
+    """Like generate_text() but requests a JSON response and returns it parsed."""
+    config = dict(config or {})
+    config.setdefault("response_mime_type", "application/json")
+    return _generate(prompt, use_case, models, config, timeout, parse_json_response, cache, ttl)
+
+def _pump_stream(client, prompt, use_case, models, config, timeout, cache_key, ttl, events):
+    """
+    Reads the model stream into `events` as ("chunk", text), then ("done", None)
+    or ("error", exc). Runs on its own thread so an AI slot is only held while
+    the model is being read, never while a slow client consumes the chunks.
+    """
+    deadline = time.monotonic() + (timeout or AI_TIMEOUT)
+    last_error = None
+
+    for model in models:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            last_error = last_error or TimeoutError("deadline exceeded")
+            break
+        if not _AI_SEMAPHORE.acquire(timeout=remaining):
+            last_error = TimeoutError("all AI slots busy")
+            break
+
+        chunks = []
+        try:
+            call_config = dict(config or {})
+            call_config["http_options"] = {"timeout": max(1, int(remaining * 1000))}
+            for chunk in client.models.generate_content_stream(model=model, contents=prompt, config=call_config):
+                if chunk.text:
+                    chunks.append(chunk.text)
+                    events.put(("chunk", chunk.text))
+            if not chunks:
+                raise ValueError("empty response")
+        except Exception as e:
+            logger.warning(f"AI {use_case} stream from {model} failed: {e}")
+            if chunks:
+                events.put(("error", AIGatewayError(f"AI {use_case} stream interrupted: {e}")))
+                return
+            last_error = e
+            continue
+        finally:
+            _AI_SEMAPHORE.release()
+
+        if cache_key:
+            set_cached_ai_response(cache_key, use_case, "".join(chunks).strip(), model=model, ttl=ttl)
+        events.put(("done", None))
+        return
+
+    events.put(("error", AIGatewayError(f"AI {use_case} unavailable: {last_error}")))
+
+def stream_text(prompt, use_case, models=None, config=None, timeout=None, cache=True, ttl=None):
+    """
+    Streaming variant of generate_text(): yields text chunks as the model
+    produces them. A model is only abandoned for the next one if it fails
+    before its first chunk; after that a failure raises AIGatewayError. The
+    complete answer is cached, and a cache hit is yielded as a single chunk.
+    """
+    models = models or AI_MODELS
+    cache_key = ai_cache_key(models[0], prompt, config) if cache else None
+    if cache_key:
+        cached = get_cached_ai_response(cache_key)
+        if cached is not None:
+            yield cached
+            return
+
+    client = get_ai_client()
+    events = queue.Queue()
+    threading.Thread(
+        target=_pump_stream,
+        args=(client, prompt, use_case, models, config, timeout, cache_key, ttl, events),
+        name="ai-stream", daemon=True
+    ).start()
+
+    while True:
+        kind, value = events.get()
+        if kind == "chunk":
+            yield value
+        elif kind == "error":
+            raise value
+        else:
+            return
@@ -0,0 +1,163 @@
+import re
+import json
+import logging
+import sqlite3
+import functools
+from datetime import datetime
+import numpy as np
+from app.database import get_db
+from app.utils.ai_cache import stable_digest
+
+logger = logging.getLogger(__name__)
+
+SENT_ALERT_RETENTION = 7 * 86400 # ledger rows outlive their alert by this much before pruning
+
+# Alert categories a subscriber can choose on the subscribe page, matched against the event name
+ALERT_CATEGORIES = {
+    "severe": ("severe", "storm", "tornado", "hurricane", "warning"),
+    "rain": ("rain", "flood", "shower"),
+    "temp": ("heat", "cold", "freeze", "chill"),
+    "air": ("quality", "pollution", "smoke", "dust"),
+}
+ALERT_CATEGORY_BITS = {name: 1 << i for i, name in enumerate(ALERT_CATEGORIES)}
+UNCATEGORIZED_ALERT = 1 << len(ALERT_CATEGORIES) # events matching no category
+ALL_ALERTS_MASK = (UNCATEGORIZED_ALERT << 1) - 1
+DEFAULT_PREFERENCE_MASK = ALL_ALERTS_MASK ^ UNCATEGORIZED_ALERT # subscribers who never saved preferences
+
+# Only alerts explicitly marked as low priority may wait for a digest; warnings
+# and anything unrecognised are sent at once, and these terms always win
+_LOW_PRIORITY_RE = re.compile(r"advisory|statement|outlook", re.IGNORECASE)
+_CRITICAL_RE = re.compile(r"warning|extreme|emergency|tornado|hurricane|cyclone|tsunami", re.IGNORECASE)
+
+_CATEGORY_PATTERNS = {
+    name: re.compile("|".join(re.escape(word) for word in words))
+    for name, words in ALERT_CATEGORIES.items()
+}
+
+def alert_identity(alert):
+    """Stable identity of an alert across cells and polling cycles: event, issuer and start time."""
+    return stable_digest(alert.get('event'), alert.get('sender_name'), alert.get('start'))
+
+def alert_fingerprint(alert):
+    """Changes whenever the issuer updates the alert (new end time or wording)."""
+    return stable_digest(alert_identity(alert), alert.get('end'), alert.get('description'))
+
+@functools.lru_cache(maxsize=1024)
+def _event_category_mask(event):
+    mask = 0
+    for name, pattern in _CATEGORY_PATTERNS.items():
+        if pattern.search(event):
+            mask |= ALERT_CATEGORY_BITS[name]
+    return mask or UNCATEGORIZED_ALERT
+
+def alert_category_mask(alert):
+    """Bitmask of the categories an alert belongs to; each distinct event name is classified once."""
+    return _event_category_mask((alert.get('event') or '').lower())
+
+def is_low_priority_alert(alert):
+    text = f"{alert.get('severity') or ''} {alert.get('event') or ''}"
+    return bool(_LOW_PRIORITY_RE.search(text)) and not _CRITICAL_RE.search(text)
+
+def preferences_mask(prefs):
+    """Bitmask of the categories a preferences dict subscribes to. No preferences means everything."""
+    if not prefs:
+        return ALL_ALERTS_MASK
+    types = prefs.get('types') or []
+    if not types:
+        return ALL_ALERTS_MASK
+    mask = 0
+    for name in types:
+        mask |= ALERT_CATEGORY_BITS.get(name, 0)
+    return mask
+
+@functools.lru_cache(maxsize=4096)
+def parse_stored_preferences(prefs_json):
+    """
+    Preferences dict for a raw `alert_thresholds` column value, or None if
+    nothing usable is stored. Subscribers share a handful of distinct values,
+    so each one is parsed once per process; treat the result as read-only.
+    """
+    if not prefs_json:
+        return None
+    try:
+        prefs = json.loads(prefs_json)
+        if isinstance(prefs, str):
+            # Written through the JSON column as an already-encoded string
+            prefs = json.loads(prefs)
+    except ValueError:
+        logger.warning("Unparsable alert preferences, using defaults")
+        return None
+    return prefs if isinstance(prefs, dict) else None
+
+@functools.lru_cache(maxsize=4096)
+def stored_preferences_mask(prefs_json):
+    """Bitmask for a raw `alert_thresholds` column value."""
+    prefs = parse_stored_preferences(prefs_json)
+    if prefs is None:
+        return DEFAULT_PREFERENCE_MASK
+    return preferences_mask(prefs)
+
+def index_subscribers_by_cell(subscribers):
+    """
+    Groups (subscriber, lat, lon, prefs_json) rows by 0.1° cell into
+    {"lat,lon": (subscribers, preference masks array)}.
+    """
+    cells = {}
+    for subscriber, lat, lon, prefs_json in subscribers:
+        loc_key = f"{round(lat, 1)},{round(lon, 1)}"
+        names, masks = cells.setdefault(loc_key, ([], []))
+        names.append(subscriber)
+        masks.append(stored_preferences_mask(prefs_json))
+    return {
+        loc_key: (names, np.array(masks, dtype=np.uint16))
+        for loc_key, (names, masks) in cells.items()
+    }
+
+def subscribers_for_alert(names, masks, alert):
+    """Subscribers of one cell whose preferences cover the alert, using one bitwise AND over the cell."""
+    return [names[i] for i in np.flatnonzero(masks & alert_category_mask(alert))]
+
+def load_sent_alerts(channel):
+    """Returns {(subscriber, alert_key): fingerprint} of everything already delivered on a channel."""
+    try:
+        with get_db() as conn:
+            rows = conn.execute(
+                "SELECT subscriber, alert_key, fingerprint FROM sent_alerts WHERE channel = ?",
+                (channel,)
+            ).fetchall()
+        return {(subscriber, alert_key): fingerprint for subscriber, alert_key, fingerprint in rows}
+    except sqlite3.Error as e:
+        logger.error(f"Sent alert ledger read failed: {e}")
+        return {}
+
+def is_alert_unsent(ledger, subscriber, alert):
+    """True if this subscriber has not received this alert, or only an older version of it."""
+    return ledger.get((subscriber, alert_identity(alert))) != alert_fingerprint(alert)
+
+def record_sent_alerts(channel, deliveries):
+    """
+    Records delivered (subscriber, alert) pairs in one transaction and prunes
+    rows for alerts that ended long ago.
+    """
+    now_ts = datetime.utcnow().timestamp()
+    rows = [
+        (subscriber, channel, alert_identity(alert), alert_fingerprint(alert), now_ts, alert.get('end') or now_ts)
+        for subscriber, alert in deliveries
+    ]
+    try:
+        with get_db() as conn:
+            conn.executemany(
+                """
+                INSERT INTO sent_alerts (subscriber, channel, alert_key, fingerprint, sent_at, alert_end)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(subscriber, channel, alert_key) DO UPDATE SET
+                    fingerprint = excluded.fingerprint,
+                    sent_at = excluded.sent_at,
+                    alert_end = excluded.alert_end
+                """,
+                rows
+            )
+            conn.execute("DELETE FROM sent_alerts WHERE alert_end < ?", (now_ts - SENT_ALERT_RETENTION,))
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Sent alert ledger write failed: {e}")
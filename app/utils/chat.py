@@ -0,0 +1,119 @@
+import os
+import re
+import math
+import time
+import logging
+import requests
+import threading
+from app.utils.ai_cache import stable_digest, get_cached_ai_response, set_cached_ai_response
+
+logger = logging.getLogger(__name__)
+
+CHAT_CACHE_TTL = 600 # seconds a shared chat answer stays valid
+CHAT_CACHE_MAX_CHARS = 120 # longer messages are too specific to share an answer
+CHAT_WEATHER_TTL = 600
+CHAT_CELL_PRECISION = 1 # decimal places of lat/lon, roughly an 11 km cell
+CHAT_WEATHER_CACHE_MAX = 1024
+
+# Weather context per location cell: {(lat, lon): (fetched_at, context, bucket)}
+CHAT_WEATHER_CACHE = {}
+_CHAT_WEATHER_LOCK = threading.Lock()
+
+_CONTRACTIONS = {
+    "what's": "what is", "whats": "what is", "how's": "how is", "hows": "how is",
+    "it's": "it is", "gonna": "going to", "today's": "today",
+}
+_CONTRACTIONS_RE = re.compile(r"\b(" + "|".join(re.escape(k) for k in _CONTRACTIONS) + r")\b")
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+# Messages about the user themselves must never be answered from someone else's reply
+_PERSONAL_RE = re.compile(
+    r"\b(i|i'm|im|i've|me|my|mine|myself|we|our|us|remember|name|email|password|account)\b",
+    re.IGNORECASE
+)
+
+def normalize_chat_message(message):
+    """Canonical form of a chat question used for cache lookups."""
+    text = _WHITESPACE_RE.sub(" ", message.casefold()).strip()
+    text = _CONTRACTIONS_RE.sub(lambda m: _CONTRACTIONS[m.group(1)], text)
+    text = _PUNCTUATION_RE.sub("", text)
+    return _WHITESPACE_RE.sub(" ", text).strip()
+
+def is_shareable_chat_message(message):
+    return len(message) <= CHAT_CACHE_MAX_CHARS and not _PERSONAL_RE.search(message)
+
+def chat_location_cell(lat, lon):
+    """Rounded (lat, lon) cell, or None for anything that isn't a real coordinate."""
+    try:
+        lat, lon = float(lat), float(lon)
+    except (TypeError, ValueError):
+        return None
+    if not (math.isfinite(lat) and math.isfinite(lon) and abs(lat) <= 90 and abs(lon) <= 180):
+        return None
+    return (round(lat, CHAT_CELL_PRECISION), round(lon, CHAT_CELL_PRECISION))
+
+def _store_weather_context(cell, context, bucket, now_ts):
+    """Caches a cell's context, dropping expired cells first and then the oldest beyond the cap."""
+    with _CHAT_WEATHER_LOCK:
+        CHAT_WEATHER_CACHE[cell] = (now_ts, context, bucket)
+        if len(CHAT_WEATHER_CACHE) <= CHAT_WEATHER_CACHE_MAX:
+            return
+        for stale in [c for c, entry in CHAT_WEATHER_CACHE.items() if now_ts - entry[0] >= CHAT_WEATHER_TTL]:
+            del CHAT_WEATHER_CACHE[stale]
+        overflow = len(CHAT_WEATHER_CACHE) - CHAT_WEATHER_CACHE_MAX
+        for oldest in sorted(CHAT_WEATHER_CACHE, key=lambda c: CHAT_WEATHER_CACHE[c][0])[:max(0, overflow)]:
+            del CHAT_WEATHER_CACHE[oldest]
+
+def weather_condition_bucket(w_data):
+    """Coarse weather state, e.g. 'rain:25' (condition group and 5-degree band)."""
+    condition = w_data["weather"][0]["main"].lower()
+    band = int(w_data["main"]["temp"] // 5) * 5
+    return f"{condition}:{band}"
+
+def get_chat_weather_context(lat, lon):
+    """
+    Returns (context, bucket) describing the weather at the user's location
+    cell. Fetched once per cell every CHAT_WEATHER_TTL seconds, so nearby
+    users share both the OpenWeatherMap call and the prompt text.
+    """
+    cell = chat_location_cell(lat, lon)
+    if cell is None:
+        return "User location is unknown.", "unknown"
+
+    cached = CHAT_WEATHER_CACHE.get(cell)
+    if cached and time.time() - cached[0] < CHAT_WEATHER_TTL:
+        return cached[1], cached[2]
+
+    try:
+        api_key = os.environ.get("OPENWEATHER_API_KEY")
+        url = f"https://api.openweathermap.org/data/2.5/weather?lat={cell[0]}&lon={cell[1]}&units=metric&appid={api_key}"
+        w_res = requests.get(url, timeout=3)
+        w_res.raise_for_status()
+        w_data = w_res.json()
+        context = (
+            f"User Location: {w_data.get('name', 'Unknown')}. "
+            f"Current Weather: {round(w_data['main']['temp'])}C, "
+            f"{w_data['weather'][0]['description']}. "
+            f"Humidity: {w_data['main']['humidity']}%. "
+            f"Wind: {round(w_data['wind']['speed'])} m/s."
+        )
+        bucket = weather_condition_bucket(w_data)
+    except Exception as e:
+        logger.warning(f"Chat weather context failed: {e}")
+        return "User location is unknown.", "unknown"
+
+    _store_weather_context(cell, context, bucket, time.time())
+    return context, bucket
+
+def chat_cache_key(message, lat, lon, bucket):
+    """Cache key for a shareable message, or None if it must be answered fresh."""
+    if not is_shareable_chat_message(message):
+        return None
+    return "chat_answer:" + stable_digest(normalize_chat_message(message), chat_location_cell(lat, lon), bucket)
+
+def get_cached_chat_answer(key):
+    return get_cached_ai_response(key) if key else None
+
+def store_chat_answer(key, answer):
+    if key and answer:
+        set_cached_ai_response(key, "chat", answer, ttl=CHAT_CACHE_TTL)
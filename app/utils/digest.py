@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+import functools
+from app.database import get_db
+from app.utils.alerts import alert_identity, is_low_priority_alert, parse_stored_preferences
+
+logger = logging.getLogger(__name__)
+
+# Seconds a subscriber's first queued alert waits before the digest goes out; 0 sends every alert at once
+ALERT_DIGEST_WINDOW = int(os.environ.get("ALERT_DIGEST_WINDOW", 3 * 3600))
+# Digests are flushed once per alert poll, so one holding an alert that ends
+# before the next poll goes out now instead of after the alert is over
+DIGEST_FLUSH_LEAD = 3600
+
+@functools.lru_cache(maxsize=4096)
+def digest_settings(prefs_json):
+    """
+    (digest enabled, all alerts digested) for a raw `alert_thresholds` value.
+    Digests are opt-in with "digest": true and then only hold low-priority
+    alerts (advisories, statements); "digest_critical": true adds the rest.
+    """
+    prefs = parse_stored_preferences(prefs_json) or {}
+    return (ALERT_DIGEST_WINDOW > 0 and prefs.get("digest") is True, prefs.get("digest_critical") is True)
+
+def should_digest_alert(alert, prefs_json=None):
+    """
+    True if the alert waits for the subscriber's digest rather than being sent
+    now. Alerts that end before the window would elapse are always sent now.
+    """
+    enabled, include_all = digest_settings(prefs_json)
+    if not enabled or not (include_all or is_low_priority_alert(alert)):
+        return False
+    return not alert.get('end') or alert['end'] > time.time() + ALERT_DIGEST_WINDOW
+
+def queue_digest_alerts(channel, entries):
+    """
+    Queues [(subscriber, alert, target)] for the next digest. A queued alert
+    that was updated is replaced, keeping its place in the window.
+    """
+    now_ts = time.time()
+    rows = [
+        (subscriber, channel, alert_identity(alert), json.dumps(alert), json.dumps(target) if target else None, now_ts)
+        for subscriber, alert, target in entries
+    ]
+    try:
+        with get_db() as conn:
+            conn.executemany(
+                """
+                INSERT INTO alert_digest_queue (subscriber, channel, alert_key, alert, target, queued_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(subscriber, channel, alert_key) DO UPDATE SET
+                    alert = excluded.alert,
+                    target = excluded.target
+                """,
+                rows
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Alert digest queue write failed: {e}")
+
+def due_digests(channel, window=None):
+    """
+    Returns {subscriber: {"target": ..., "alerts": [...]}} for subscribers whose
+    oldest queued alert has waited a full window, or sooner if a queued alert
+    would otherwise end before the digest goes out. Alerts that already ended
+    are left out.
+    """
+    window = ALERT_DIGEST_WINDOW if window is None else window
+    now_ts = time.time()
+    try:
+        with get_db() as conn:
+            rows = conn.execute(
+                """
+                SELECT subscriber, alert, target, queued_at FROM alert_digest_queue
+                WHERE channel = ?
+                ORDER BY subscriber, queued_at
+                """,
+                (channel,)
+            ).fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Alert digest queue read failed: {e}")
+        return {}
+
+    queued = {}
+    for subscriber, alert_json, target_json, queued_at in rows:
+        digest = queued.setdefault(subscriber, {"target": None, "alerts": [], "due_at": queued_at + window})
+        alert = json.loads(alert_json)
+        if not alert.get('end') or alert['end'] > now_ts:
+            digest["alerts"].append(alert)
+            if alert.get('end'):
+                digest["due_at"] = min(digest["due_at"], alert['end'] - DIGEST_FLUSH_LEAD)
+        if target_json:
+            digest["target"] = json.loads(target_json)
+
+    return {
+        subscriber: {"target": digest["target"], "alerts": digest["alerts"]}
+        for subscriber, digest in queued.items()
+        if digest["due_at"] <= now_ts
+    }
+
+def clear_digests(channel, subscribers):
+    """Removes the queued alerts of subscribers whose digest was delivered (or had nothing left to send)."""
+    subscribers = list(subscribers)
+    if not subscribers:
+        return
+    try:
+        with get_db() as conn:
+            conn.executemany(
+                "DELETE FROM alert_digest_queue WHERE channel = ? AND subscriber = ?",
+                [(channel, subscriber) for subscriber in subscribers]
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Alert digest queue clear failed: {e}")
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import logging
+import sqlite3
+from app.database import get_db
+from app.utils.ai_cache import stable_digest
+from app.utils.alerts import alert_fingerprint
+
+logger = logging.getLogger(__name__)
+
+FORECAST_TEMP_SWING = float(os.environ.get("FORECAST_TEMP_SWING", 3)) # °C change at the same hour that is worth telling
+FORECAST_WET_MM = 0.5 # hourly rain + snow that makes an hour wet
+FORECAST_CHANGE_HOURS = 24 # how far ahead the summary looks
+FORECAST_BASELINE_MAX_AGE = 12 * 3600 # rebase quietly once the stored forecast barely overlaps the new one
+
+def _precipitation(hour):
+    return (hour.get('rain') or {}).get('1h', 0) + (hour.get('snow') or {}).get('1h', 0)
+
+def forecast_summary(alerts, hourly, subscribers=None):
+    """
+    Compact digest of everything a cell's notifications depend on.
+    `subscribers` is a fingerprint of the cell's subscribers and their
+    preferences, so sign-ups, removals and edits count as changes.
+    """
+    hours = hourly[:FORECAST_CHANGE_HOURS]
+    return {
+        "alerts": sorted(alert_fingerprint(alert) for alert in alerts),
+        "temps": {str(hour['dt']): round(hour['temp'], 1) for hour in hours if 'temp' in hour},
+        "wet": sorted(hour['dt'] for hour in hours if _precipitation(hour) >= FORECAST_WET_MM),
+        "subscribers": subscribers,
+    }
+
+def diff_forecast(previous, current, temp_swing=FORECAST_TEMP_SWING):
+    """Names of the significant changes from `previous` to `current` summary; empty if none."""
+    if previous is None:
+        return ["new_cell"]
+    changes = []
+    if set(current["alerts"]) - set(previous["alerts"]):
+        changes.append("alert_added")
+    if set(previous["alerts"]) - set(current["alerts"]):
+        changes.append("alert_removed")
+    if set(current["wet"]) - set(previous["wet"]):
+        changes.append("precipitation_window")
+    swings = [
+        abs(temp - previous["temps"][hour])
+        for hour, temp in current["temps"].items()
+        if hour in previous["temps"]
+    ]
+    if swings and max(swings) >= temp_swing:
+        changes.append("temperature_swing")
+    if current["subscribers"] != previous["subscribers"]:
+        changes.append("subscribers_changed")
+    return changes
+
+def detect_forecast_changes(summaries):
+    """
+    Diffs {"lat,lon": summary} against the stored baselines. Returns
+    (changed, baselines): {"lat,lon": [changes]} for cells that changed
+    significantly, and the new baselines to save with save_forecast_baselines()
+    once their notifications went out. A baseline is replaced when its cell
+    changes (or once it is too old to overlap), so slow drift still adds up.
+    """
+    now_ts = time.time()
+    try:
+        with get_db() as conn:
+            rows = conn.execute("SELECT cell, fingerprint, summary, updated_at FROM forecast_fingerprints").fetchall()
+    except sqlite3.Error as e:
+        logger.error(f"Forecast fingerprint read failed: {e}")
+        rows = []
+    stored = {cell: (fingerprint, summary, updated_at) for cell, fingerprint, summary, updated_at in rows}
+
+    changed, baselines = {}, {}
+    for cell, summary in summaries.items():
+        fingerprint = stable_digest(summary)
+        baseline = stored.get(cell)
+        if baseline and baseline[0] == fingerprint:
+            continue
+        changes = diff_forecast(json.loads(baseline[1]) if baseline else None, summary)
+        if changes:
+            changed[cell] = changes
+        if changes or now_ts - baseline[2] > FORECAST_BASELINE_MAX_AGE:
+            baselines[cell] = (fingerprint, json.dumps(summary), now_ts)
+    return changed, baselines
+
+def save_forecast_baselines(baselines):
+    """Stores baselines from detect_forecast_changes(); cells left out are diffed against their old one again."""
+    try:
+        with get_db() as conn:
+            conn.executemany(
+                """
+                INSERT INTO forecast_fingerprints (cell, fingerprint, summary, updated_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(cell) DO UPDATE SET
+                    fingerprint = excluded.fingerprint,
+                    summary = excluded.summary,
+                    updated_at = excluded.updated_at
+                """,
+                [(cell, fingerprint, summary, updated_at) for cell, (fingerprint, summary, updated_at) in baselines.items()]
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Forecast fingerprint write failed: {e}")
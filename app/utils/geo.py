@@ -1,121 +1,350 @@
-import os
 import re
+import math
+import json
 import requests
 import logging
+import sqlite3
+import threading
 from datetime import datetime, timedelta, timezone
 from flask import request, session
+from app.database import get_db
+from app.utils.ai_gateway import ai_available, generate_json, generate_text
 
 logger = logging.getLogger(__name__)
 
+# Common replacements for locations in Pakistan to keep it natural and correct
+URDU_TO_ENGLISH = {
+    "اسلام آباد": "Islamabad",
+    "راولپنڈی": "Rawalpindi",
+    "کراچی": "Karachi",
+    "لاہور": "Lahore",
+    "پشاور": "Peshawar",
+    "کوئٹہ": "Quetta",
+    "ملتان": "Multan",
+    "فیصل آباد": "Faisalabad",
+    "سیالکوٹ": "Sialkot",
+    "گوجرانوالہ": "Gujranwala",
+    "حیدرآباد": "Hyderabad",
+    "سکردو": "Skardu",
+    "گلگت": "Gilgit",
+    "مظفر آباد": "Muzaffarabad",
+    "کشمیر": "Kashmir",
+    "پاکستان": "Pakistan",
+    "پنجاب": "Punjab",
+    "سندھ": "Sindh",
+    "خیبر پختونخوا": "Khyber Pakhtunkhwa",
+    "بلوچستان": "Balochistan",
+    "وفاقی دارالحکومت": "Federal Capital Territory",
+    "آئی-10": "I-10",
+    "آئی-11": "I-11",
+    "آئی-12": "I-12",
+    "آئی-8": "I-8",
+    "آئی-9": "I-9",
+    "ایچ-8": "H-8",
+    "ایچ-9": "H-9",
+    "ایچ-10": "H-10",
+    "ایچ-11": "H-11",
+    "جی-6": "G-6",
+    "جی-7": "G-7",
+    "جی-8": "G-8",
+    "جی-9": "G-9",
+    "جی-10": "G-10",
+    "جی-11": "G-11",
+    "جی-13": "G-13",
+    "جی-15": "G-15",
+    "جی-12": "G-12",
+    "جی-14": "G-14",
+    "ایف-6": "F-6",
+    "ایف-7": "F-7",
+    "ایف-8": "F-8",
+    "ایف-9": "F-9",
+    "ایف-10": "F-10",
+    "ایف-11": "F-11",
+    "ایف-15": "F-15",
+    "ای-7": "E-7",
+    "ای-8": "E-8",
+    "ای-9": "E-9",
+    "ای-11": "E-11",
+    "ڈی-12": "D-12",
+    "ڈی-17": "D-17",
+    "ڈی-18": "D-18",
+    "سی-15": "C-15",
+    "سی-16": "C-16",
+    "بی-17": "B-17",
+    "گلی": "Gali",
+    "سڑک": "Road",
+    "چوک": "Chowk",
+    "مارکیٹ": "Market",
+    "سیکٹر": "Sector"
+}
+
+# Compiled once into a single alternation, longest keys first so a longer name
+# always wins over a shorter entry it contains. One scan replaces the old
+# per-entry str.replace loop.
+_URDU_PATTERN = re.compile(
+    "|".join(re.escape(k) for k in sorted(URDU_TO_ENGLISH, key=len, reverse=True))
+)
+_ARABIC_RE = re.compile(r'[\u0600-\u06FF]')
+
+# Fallback dictionary for basic English -> Urdu translation
+ENGLISH_TO_URDU = {
+    "Islamabad": "اسلام آباد",
+    "Rawalpindi": "راولپنڈی",
+    "Karachi": "کراچی",
+    "Lahore": "لاہور",
+    "Peshawar": "پشاور",
+    "Quetta": "کوئٹہ",
+    "Multan": "ملتان",
+    "Faisalabad": "فیصل آباد",
+    "Sialkot": "سیالکوٹ",
+    "Gujranwala": "گوجرانوالہ",
+    "Hyderabad": "حیدرآباد",
+    "Skardu": "سکردو",
+    "Gilgit": "گلگت",
+    "Muzaffarabad": "مظفر آباد",
+    "Kashmir": "کشمیر",
+    "Pakistan": "پاکستان",
+    "Punjab": "پنجاب",
+    "Sindh": "سندھ",
+    "Khyber Pakhtunkhwa": "خیبر پختونخوا",
+    "Balochistan": "بلوچستان",
+    "Federal Capital Territory": "وفاقی دارالحکومت",
+    "Sector": "سیکٹر",
+    "Road": "روڈ",
+    "Gali": "گلی",
+    "Street": "گلی",
+    "Chowk": "چوک",
+    "Market": "مارکیٹ"
+}
+_ENGLISH_LOOKUP = {k.lower(): v for k, v in ENGLISH_TO_URDU.items()}
+_ENGLISH_PATTERN = re.compile(
+    "|".join(re.escape(k) for k in sorted(ENGLISH_TO_URDU, key=len, reverse=True)),
+    re.IGNORECASE
+)
+
+# --- Translation memory ---
+# Persistent (source, direction) -> translation table so repeat sector, road and
+# city strings never go back to Gemini. Directions are "ur-en" and "en-ur".
+
+# In-process LRU in front of the table: {(direction, source): translation or
+# None if the table has none}. Insertion order is recency order.
+TRANSLATION_CACHE_MAX = 4096
+_TRANSLATION_CACHE = {}
+_TRANSLATION_CACHE_LOCK = threading.Lock()
+# Directions with rows beyond the built-in dictionaries (which the dictionary
+# pass already applies), i.e. where a lookup can find something new
+_LEARNED_DIRECTIONS = set()
+
+def _normalize_source(text):
+    return " ".join(text.split()).casefold()
+
+def _remember_translations(entries):
+    """Caches {(direction, source): translation or None}, evicting the least recently used."""
+    with _TRANSLATION_CACHE_LOCK:
+        for key, translated in entries.items():
+            _TRANSLATION_CACHE.pop(key, None)
+            _TRANSLATION_CACHE[key] = translated
+        while len(_TRANSLATION_CACHE) > TRANSLATION_CACHE_MAX:
+            del _TRANSLATION_CACHE[next(iter(_TRANSLATION_CACHE))]
+
+def lookup_translations(texts, direction):
+    """Returns {text: translation} for every text already in the translation memory."""
+    if not texts:
+        return {}
+
+    by_key = {}
+    for text in texts:
+        by_key.setdefault(_normalize_source(text), []).append(text)
+
+    found, missing = {}, []
+    with _TRANSLATION_CACHE_LOCK:
+        for source in by_key:
+            key = (direction, source)
+            if key in _TRANSLATION_CACHE:
+                found[source] = _TRANSLATION_CACHE.pop(key)
+                _TRANSLATION_CACHE[key] = found[source] # most recently used
+            else:
+                missing.append(source)
+
+    if missing:
+        stored = {}
+        try:
+            with get_db() as conn:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    stored.update(conn.execute(
+                        f"SELECT source_text, translated_text FROM translation_memory "
+                        f"WHERE direction = ? AND source_text IN ({placeholders})",
+                        [direction] + chunk
+                    ).fetchall())
+        except sqlite3.Error as e:
+            logger.warning(f"Translation memory lookup failed: {e}")
+        else:
+            _remember_translations({(direction, source): stored.get(source) for source in missing})
+        found.update(stored)
+
+    return {text: translated for source, translated in found.items() if translated for text in by_key[source]}
+
+def store_translations(pairs, direction, origin="gemini"):
+    """Records {source: translation} pairs in the translation memory."""
+    if not pairs:
+        return
+    now = datetime.utcnow().isoformat()
+    rows = [(_normalize_source(src), direction, dst, origin, now) for src, dst in pairs.items()]
+    _remember_translations({(direction, source): dst for source, _, dst, _, _ in rows})
+    _LEARNED_DIRECTIONS.add(direction)
+    try:
+        with get_db() as conn:
+            conn.executemany(
+                """
+                INSERT OR REPLACE INTO translation_memory
+                    (source_text, direction, translated_text, origin, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                rows
+            )
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.warning(f"Translation memory store failed: {e}")
+
+def preload_translation_memory():
+    """
+    Seeds the translation memory with the built-in dictionaries (existing rows
+    win) and resets the in-process cache in front of it.
+    """
+    now = datetime.utcnow().isoformat()
+    rows = [(_normalize_source(src), "ur-en", dst, "dictionary", now) for src, dst in URDU_TO_ENGLISH.items()]
+    rows += [(_normalize_source(src), "en-ur", dst, "dictionary", now) for src, dst in ENGLISH_TO_URDU.items()]
+    with get_db() as conn:
+        conn.executemany(
+            """
+            INSERT OR IGNORE INTO translation_memory
+                (source_text, direction, translated_text, origin, created_at)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            rows
+        )
+        conn.commit()
+        learned = conn.execute("SELECT DISTINCT direction FROM translation_memory WHERE origin != 'dictionary'").fetchall()
+    with _TRANSLATION_CACHE_LOCK:
+        _TRANSLATION_CACHE.clear()
+    _LEARNED_DIRECTIONS.clear()
+    _LEARNED_DIRECTIONS.update(direction for direction, in learned)
+
+def _replace_known_urdu(text):
+    """Dictionary pass only: swaps known Urdu place names for their English form."""
+    # Nominatim is queried with accept-language=en, so most fields are plain ASCII
+    if not text or text.isascii():
+        return text
+    return _URDU_PATTERN.sub(lambda m: URDU_TO_ENGLISH[m.group(0)], text)
+
+def _strip_arabic(text):
+    """Fallback when no translation is available: remove any Arabic characters."""
+    text = _ARABIC_RE.sub('', text).strip()
+    # Clean up multiple spaces or trailing commas
+    text = re.sub(r'\s+', ' ', text)
+    return re.sub(r',\s*,', ',', text).strip(' ,')
+
+def translate_urdu_batch(texts):
+    """
+    Translates a list of Urdu/mixed location strings to English. Strings already
+    in the translation memory are served from it; the rest go to Gemini in a
+    single request. Returns a dict of {original: translation} holding only the
+    strings that have a clean English translation.
+    """
+    if not texts:
+        return {}
+
+    use_ai = ai_available()
+    # What is left after the dictionary pass can only be in the table as a learned row
+    if not use_ai and "ur-en" not in _LEARNED_DIRECTIONS:
+        return {}
+
+    results = lookup_translations(texts, "ur-en")
+    texts = [t for t in texts if t not in results]
+    if not texts or not use_ai:
+        return results
+
+    try:
+        prompt = (
+            "Translate each of the following location/address strings to English. "
+            "Return ONLY a JSON array of strings with the translations, in the same order "
+            "and with the same length as the input, without explanations.\n"
+            f"Input: {json.dumps(texts, ensure_ascii=False)}"
+        )
+        translated = generate_json(prompt, "translation")
+    except Exception as e:
+        logger.error(f"Gemini batch translation error: {e}")
+        return results
+
+    if not isinstance(translated, list) or len(translated) != len(texts):
+        logger.warning("Gemini batch translation returned a mismatched result, ignoring it")
+        return results
+
+    fresh = {}
+    for original, english in zip(texts, translated):
+        if isinstance(english, str):
+            english = english.strip().strip("'\"")
+            if english and not _ARABIC_RE.search(english):
+                fresh[original] = english
+    store_translations(fresh, "ur-en")
+    results.update(fresh)
+    return results
+
 def clean_urdu_text(text):
     if not text:
         return text
-    
-    # Common replacements for locations in Pakistan to keep it natural and correct
-    replacements = {
-        "اسلام آباد": "Islamabad",
-        "راولپنڈی": "Rawalpindi",
-        "کراچی": "Karachi",
-        "لاہور": "Lahore",
-        "پشاور": "Peshawar",
-        "کوئٹہ": "Quetta",
-        "ملتان": "Multan",
-        "فیصل آباد": "Faisalabad",
-        "سیالکوٹ": "Sialkot",
-        "گوجرانوالہ": "Gujranwala",
-        "حیدرآباد": "Hyderabad",
-        "سکردو": "Skardu",
-        "گلگت": "Gilgit",
-        "مظفر آباد": "Muzaffarabad",
-        "کشمیر": "Kashmir",
-        "پاکستان": "Pakistan",
-        "پنجاب": "Punjab",
-        "سندھ": "Sindh",
-        "خیبر پختونخوا": "Khyber Pakhtunkhwa",
-        "بلوچستان": "Balochistan",
-        "وفاقی دارالحکومت": "Federal Capital Territory",
-        "آئی-10": "I-10",
-        "آئی-11": "I-11",
-        "آئی-12": "I-12",
-        "آئی-8": "I-8",
-        "آئی-9": "I-9",
-        "ایچ-8": "H-8",
-        "ایچ-9": "H-9",
-        "ایچ-10": "H-10",
-        "ایچ-11": "H-11",
-        "جی-6": "G-6",
-        "جی-7": "G-7",
-        "جی-8": "G-8",
-        "جی-9": "G-9",
-        "جی-10": "G-10",
-        "جی-11": "G-11",
-        "جی-13": "G-13",
-        "جی-15": "G-15",
-        "جی-12": "G-12",
-        "جی-14": "G-14",
-        "ایف-6": "F-6",
-        "ایف-7": "F-7",
-        "ایف-8": "F-8",
-        "ایف-9": "F-9",
-        "ایف-10": "F-10",
-        "ایف-11": "F-11",
-        "ایف-15": "F-15",
-        "ای-7": "E-7",
-        "ای-8": "E-8",
-        "ای-9": "E-9",
-        "ای-11": "E-11",
-        "ڈی-12": "D-12",
-        "ڈی-17": "D-17",
-        "ڈی-18": "D-18",
-        "سی-15": "C-15",
-        "سی-16": "C-16",
-        "بی-17": "B-17",
-        "گلی": "Gali",
-        "سڑک": "Road",
-        "چوک": "Chowk",
-        "مارکیٹ": "Market",
-        "سیکٹر": "Sector"
-    }
-    
-    for urdu, eng in replacements.items():
-        text = text.replace(urdu, eng)
-        
+
+    text = _replace_known_urdu(text)
+
     # Check if still contains Urdu/Arabic characters
-    if re.search(r'[\u0600-\u06FF]', text):
-        gemini_key = os.environ.get("GEMINI_API_KEY")
-        if gemini_key:
-            try:
-                from google import genai
-                client = genai.Client(api_key=gemini_key.strip())
-                prompt = f"Translate the following location/address string to English. Return ONLY the English translation without quotes or explanations: '{text}'"
-                response = client.models.generate_content(
-                    model="gemini-2.0-flash-exp",
-                    contents=prompt
-                )
-                translated = response.text.strip()
-                if translated and not re.search(r'[\u0600-\u06FF]', translated):
-                    return translated
-            except Exception:
-                pass
-                
-        # Fallback: remove any Arabic characters
-        text = re.sub(r'[\u0600-\u06FF]', '', text).strip()
-        # Clean up multiple spaces or trailing commas
-        text = re.sub(r'\s+', ' ', text)
-        text = re.sub(r',\s*,', ',', text).strip(' ,')
-        
+    if _ARABIC_RE.search(text):
+        translated = translate_urdu_batch([text]).get(text)
+        if translated:
+            return translated
+        return _strip_arabic(text)
+
     return text
 
-def clean_dict_values(data):
+def _collect_untranslated(data, pending):
+    """Applies the dictionary pass to every string and gathers the ones still in Urdu."""
     if isinstance(data, dict):
-        return {k: clean_dict_values(v) for k, v in data.items()}
+        return {k: _collect_untranslated(v, pending) for k, v in data.items()}
     elif isinstance(data, list):
-        return [clean_dict_values(x) for x in data]
+        return [_collect_untranslated(x, pending) for x in data]
     elif isinstance(data, str):
-        return clean_urdu_text(data)
+        text = _replace_known_urdu(data)
+        if _ARABIC_RE.search(text):
+            pending.add(text)
+        return text
+    else:
+        return data
+
+def _substitute_translations(data, translations):
+    if isinstance(data, dict):
+        return {k: _substitute_translations(v, translations) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [_substitute_translations(x, translations) for x in data]
+    elif isinstance(data, str) and _ARABIC_RE.search(data):
+        return translations.get(data) or _strip_arabic(data)
     else:
         return data
 
+def clean_dict_values(data):
+    """
+    Cleans every string in a (nested) geocoder response. Strings the dictionary
+    can't fully translate are sent to Gemini together, so a whole payload costs
+    at most one model round trip.
+    """
+    pending = set()
+    data = _collect_untranslated(data, pending)
+    if not pending:
+        return data
+
+    translations = translate_urdu_batch(sorted(pending))
+    return _substitute_translations(data, translations)
+
 def get_client_ip():
     """Get user IP address, handling proxies."""
     return request.headers.get("X-Forwarded-For", request.remote_addr).split(",")[0]
@@ -187,59 +416,54 @@ def get_local_time_string():
 def translate_to_urdu(text):
     if not text:
         return text
+
+    remembered = lookup_translations([text], "en-ur").get(text)
+    if remembered:
+        return remembered
         
-    gemini_key = os.environ.get("GEMINI_API_KEY")
-    if gemini_key:
+    if ai_available():
         try:
-            from google import genai
-            client = genai.Client(api_key=gemini_key.strip())
             prompt = (
                 f"Translate the following English or mixed location/address string to Urdu script. "
                 f"Ensure it is natural, correct, and in Urdu script. "
                 f"Return ONLY the Urdu translation, without quotes, prefix, suffix, or explanation. "
                 f"Input: '{text}'"
             )
-            response = client.models.generate_content(
-                model="gemini-2.0-flash-exp",
-                contents=prompt
-            )
-            translated = response.text.strip()
+            translated = generate_text(prompt, "translation")
             if translated:
+                store_translations({text: translated}, "en-ur")
                 return translated
         except Exception as e:
             logger.error(f"Gemini Urdu Translation Error: {e}")
 
     # Fallback dictionary for basic translation
-    replacements = {
-        "Islamabad": "اسلام آباد",
-        "Rawalpindi": "راولپنڈی",
-        "Karachi": "کراچی",
-        "Lahore": "لاہور",
-        "Peshawar": "پشاور",
-        "Quetta": "کوئٹہ",
-        "Multan": "ملتان",
-        "Faisalabad": "فیصل آباد",
-        "Sialkot": "سیالکوٹ",
-        "Gujranwala": "گوجرانوالہ",
-        "Hyderabad": "حیدرآباد",
-        "Skardu": "سکردو",
-        "Gilgit": "گلگت",
-        "Muzaffarabad": "مظفر آباد",
-        "Kashmir": "کشمیر",
-        "Pakistan": "پاکستان",
-        "Punjab": "پنجاب",
-        "Sindh": "سندھ",
-        "Khyber Pakhtunkhwa": "خیبر پختونخوا",
-        "Balochistan": "بلوچستان",
-        "Federal Capital Territory": "وفاقی دارالحکومت",
-        "Sector": "سیکٹر",
-        "Road": "روڈ",
-        "Gali": "گلی",
-        "Street": "گلی",
-        "Chowk": "چوک",
-        "Market": "مارکیٹ"
-    }
-    for eng, urdu in replacements.items():
-        pattern = re.compile(re.escape(eng), re.IGNORECASE)
-        text = pattern.sub(urdu, text)
-    return text
+    return _ENGLISH_PATTERN.sub(lambda m: _ENGLISH_LOOKUP[m.group(0).lower()], text)
+
+EARTH_RADIUS_KM = 6371.0
+GRID_CELLS_PER_DEGREE = 10 # matches the cell_lat/cell_lon columns (0.1 degree cells)
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometres."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+def grid_cell(value):
+    """Grid cell index of a coordinate, rounded half away from zero like SQL round()."""
+    return int(math.copysign(math.floor(abs(value) * GRID_CELLS_PER_DEGREE + 0.5), value))
+
+def grid_cell_bounds(lat, lon, radius_km):
+    """
+    Inclusive (min_cell_lat, max_cell_lat, min_cell_lon, max_cell_lon) covering
+    a circle, for an indexed range query before the exact distance check.
+    """
+    dlat = radius_km / 111.0
+    dlon = radius_km / (111.0 * max(math.cos(math.radians(lat)), 0.01))
+    return (
+        math.floor((lat - dlat) * GRID_CELLS_PER_DEGREE),
+        math.ceil((lat + dlat) * GRID_CELLS_PER_DEGREE),
+        math.floor((lon - dlon) * GRID_CELLS_PER_DEGREE),
+        math.ceil((lon + dlon) * GRID_CELLS_PER_DEGREE),
+    )
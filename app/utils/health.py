@@ -0,0 +1,167 @@
+import re
+import json
+import math
+import logging
+import threading
+import concurrent.futures
+from datetime import datetime, timezone
+from app.utils.ai_cache import stable_digest, get_cached_ai_response, set_cached_ai_response
+from app.utils.ai_gateway import ai_available, generate_json
+
+logger = logging.getLogger(__name__)
+
+HEALTH_CATEGORIES = ("migraine", "arthritis", "respiratory", "uv_skin")
+HEALTH_ENRICHMENT_TTL = 24 * 3600 # wording only depends on the risk levels and causes, so it can live long
+
+# Enrichment never blocks a request: it runs here and is picked up by later requests
+_ENRICH_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="health-ai")
+_ENRICH_IN_FLIGHT = set()
+_ENRICH_LOCK = threading.Lock()
+
+def pressure_trend(current_pressure, forecast_list, hours=6):
+    """Change in hPa from now to the forecast slot about `hours` ahead (negative = falling)."""
+    if current_pressure is None or not forecast_list:
+        return 0
+    slot = forecast_list[min(len(forecast_list), max(1, hours // 3)) - 1]
+    return slot['main']['pressure'] - current_pressure
+
+def estimate_uv_index(lat, timestamp, sunrise, sunset, clouds=0):
+    """
+    Clear-sky UV index from solar elevation, damped by cloud cover. The
+    current-weather endpoint has no UV field, and this is close enough to
+    place the value in the right risk band.
+    """
+    if not sunrise or not sunset or not (sunrise < timestamp < sunset):
+        return 0
+    day_of_year = datetime.fromtimestamp(timestamp, tz=timezone.utc).timetuple().tm_yday
+    declination = 23.44 * math.sin(math.radians(360 / 365 * (284 + day_of_year)))
+    noon_elevation = 90 - abs(lat - declination)
+    # Elevation follows a half sine between sunrise and sunset
+    day_fraction = (timestamp - sunrise) / (sunset - sunrise)
+    elevation = max(0, noon_elevation * math.sin(math.pi * day_fraction))
+    clear_sky = 12.5 * math.sin(math.radians(elevation)) ** 2.42
+    return round(clear_sky * (1 - 0.75 * (clouds / 100) ** 3.4), 1)
+
+def _risk(level, reason):
+    return {"risk": level, "reason": reason}
+
+def assess_migraine(temperature, humidity, pressure_change):
+    if pressure_change <= -6:
+        return _risk("High", "Sharp pressure drop expected.")
+    if abs(pressure_change) >= 3:
+        return _risk("Medium", "Noticeable pressure change ahead.")
+    if temperature >= 32 and humidity >= 60:
+        return _risk("Medium", "Hot, humid air can trigger headaches.")
+    return _risk("Low", "Stable pressure.")
+
+def assess_arthritis(temperature, humidity, pressure_change):
+    if temperature < 10 and humidity >= 75:
+        return _risk("High", "Cold, damp conditions.")
+    if pressure_change <= -3 or (temperature < 15 and humidity >= 70):
+        return _risk("Medium", "Cool air or falling pressure may stiffen joints.")
+    return _risk("Low", "Mild, dry conditions.")
+
+def assess_respiratory(temperature, humidity, wind_speed, aqi=None):
+    if aqi is not None and aqi > 150:
+        return _risk("High", f"Unhealthy air quality (AQI {aqi}).")
+    if aqi is not None and aqi > 100:
+        return _risk("Medium", f"Air quality is poor for sensitive groups (AQI {aqi}).")
+    if temperature <= 0:
+        return _risk("Medium", "Cold air can tighten airways.")
+    if humidity <= 25 and wind_speed >= 8:
+        return _risk("Medium", "Dry, windy air may carry dust.")
+    if temperature >= 30 and humidity >= 80:
+        return _risk("Medium", "Heavy, humid air.")
+    return _risk("Low", "Air is comfortable to breathe.")
+
+def assess_uv(uv_index):
+    if uv_index >= 6:
+        return _risk("High", f"UV index around {round(uv_index)}.")
+    if uv_index >= 3:
+        return _risk("Medium", f"Moderate UV (around {round(uv_index)}).")
+    return _risk("Low", "Low UV.")
+
+_GENERAL_ADVICE = {
+    "migraine": "Pressure is shifting today, so stay hydrated and keep any medication handy.",
+    "arthritis": "Keep joints warm and moving in today's cold, damp weather.",
+    "respiratory": "Limit strenuous outdoor activity and keep inhalers close.",
+    "uv_skin": "Wear sunscreen and seek shade around midday.",
+}
+
+def calculate_health_risks(temperature, humidity, pressure_change=0, wind_speed=0, uv_index=0, aqi=None):
+    """
+    Rule-based health risk levels from current conditions. Returns the
+    /api/weather/health payload: one {"risk", "reason"} per category plus
+    general_advice.
+    """
+    risks = {
+        "migraine": assess_migraine(temperature, humidity, pressure_change),
+        "arthritis": assess_arthritis(temperature, humidity, pressure_change),
+        "respiratory": assess_respiratory(temperature, humidity, wind_speed, aqi),
+        "uv_skin": assess_uv(uv_index),
+    }
+    rank = {"Low": 0, "Medium": 1, "High": 2}
+    worst = max(HEALTH_CATEGORIES, key=lambda c: rank[risks[c]["risk"]])
+    if risks[worst]["risk"] == "Low":
+        risks["general_advice"] = "Conditions look comfortable for most people today."
+    else:
+        risks["general_advice"] = _GENERAL_ADVICE[worst]
+    return risks
+
+_NUMBER_RE = re.compile(r"\d+(?:\.\d+)?")
+
+def _risk_causes(risks):
+    """
+    Level and rule reason per category, with the numbers taken out: the
+    wording must name the right cause, but live AQI/UV values would defeat
+    the cache.
+    """
+    return {c: [risks[c]["risk"], _NUMBER_RE.sub("#", risks[c]["reason"])] for c in HEALTH_CATEGORIES}
+
+def _enrichment_key(risks):
+    return "health_enrichment:" + stable_digest(_risk_causes(risks))
+
+def _enrich_in_background(key, risks):
+    try:
+        prompt = f"""
+        These health risk levels and their causes were computed from today's
+        weather ("#" stands for a number): {json.dumps(_risk_causes(risks))}.
+        Write a friendly explanation under 12 words for each level that names
+        the same cause, without quoting any numbers, and add one sentence of
+        general advice.
+        Return ONLY valid JSON:
+        {{"migraine": "reason", "arthritis": "reason", "respiratory": "reason", "uv_skin": "reason", "general_advice": "sentence"}}
+        """
+        wording = generate_json(prompt, "weather_health", cache=False)
+        if isinstance(wording, dict):
+            set_cached_ai_response(key, "weather_health", json.dumps(wording), ttl=HEALTH_ENRICHMENT_TTL)
+    except Exception as e:
+        logger.warning(f"Health enrichment failed: {e}")
+    finally:
+        with _ENRICH_LOCK:
+            _ENRICH_IN_FLIGHT.discard(key)
+
+def enrich_health_risks(risks):
+    """
+    Applies cached AI wording to rule-based risks if available; otherwise
+    schedules it in the background and returns the risks unchanged. Risk
+    levels always come from the rules.
+    """
+    key = _enrichment_key(risks)
+    cached = get_cached_ai_response(key)
+    if cached:
+        try:
+            wording = json.loads(cached)
+            enriched = {c: dict(risks[c], reason=wording.get(c) or risks[c]["reason"]) for c in HEALTH_CATEGORIES}
+            enriched["general_advice"] = wording.get("general_advice") or risks["general_advice"]
+            return enriched
+        except (ValueError, AttributeError):
+            logger.warning("Discarding unparsable health enrichment")
+
+    if ai_available():
+        with _ENRICH_LOCK:
+            if key in _ENRICH_IN_FLIGHT:
+                return risks
+            _ENRICH_IN_FLIGHT.add(key)
+        _ENRICH_EXECUTOR.submit(_enrich_in_background, key, risks)
+    return risks
@@ -1,15 +1,36 @@
 import requests
 import json
+import os
 import logging
+import threading
 from datetime import datetime
-from google import genai
+from urllib.parse import urlsplit, urlunsplit
+from flask import current_app
+from markupsafe import Markup
+from app.utils.ai_gateway import generate_json
+from app.utils.ai_cache import stable_digest, get_cached_ai_responses, set_cached_ai_responses
 
 logger = logging.getLogger(__name__)
 
 NEWS_CACHE = {}
 AI_NEWS_CACHE = {}
 NEWS_CACHE_DURATION = 3600
-AI_CACHE_DURATION = 300 # 5 minutes for AI categorization
+AI_CACHE_DURATION = 6 * 3600 # per-article categorization results
+AI_NEWS_CACHE_MAX = 1000 # articles kept in process; the persistent cache holds the rest
+_AI_NEWS_LOCK = threading.Lock()
+
+# Ready-to-render article lists published by the background ingestion worker
+NEWS_SNAPSHOTS = {}
+NEWS_SNAPSHOT_MAX_AGE = 3 * 3600 # rebuild on request if ingestion has stalled
+NEWS_INGEST_INTERVAL = int(os.environ.get("NEWS_INGEST_INTERVAL", 900))
+DEFAULT_NEWS_FEEDS = [("latest", None), ("world", None), ("news", None), ("weather", "Pakistan")]
+NEWS_FEED_IDLE_TTL = 6 * 3600 # requested feeds nobody read for this long stop being refreshed
+NEWS_MAX_REQUESTED_FEEDS = 30 # most recently read requested feeds kept on top of the defaults
+NEWS_FEED_READS = {} # {feed_key: last read timestamp}
+_SNAPSHOT_LOCK = threading.Lock()
+
+# Rendered news sections: {feed_key: {(fragment, locale): (snapshot_version, html)}}
+NEWS_FRAGMENT_CACHE = {}
 
 def get_dummy_news():
     """Helper to return high-quality dummy weather news when API fails."""
@@ -60,7 +81,7 @@ def fetch_weather_news(query="weather", country=None, page_size=10, api_key=None
     if not api_key:
         return get_dummy_news()
         
-    cache_key = f"{query}_{country}_{page_size}"
+    cache_key = stable_digest("newsapi", (query or "").strip().lower(), country, page_size)
     if cache_key in NEWS_CACHE:
         cached = NEWS_CACHE[cache_key]
         if datetime.now().timestamp() - cached["timestamp"] < NEWS_CACHE_DURATION:
@@ -131,7 +152,7 @@ def fetch_gnews_weather(query="weather", page_size=10, api_key=None):
         logger.warning("No GNews API key provided.")
         return get_dummy_news()
 
-    cache_key = f"gnews_{query}_{page_size}"
+    cache_key = stable_digest("gnews", (query or "").strip().lower(), page_size)
     if cache_key in NEWS_CACHE:
         cached = NEWS_CACHE[cache_key]
         if datetime.now().timestamp() - cached["timestamp"] < NEWS_CACHE_DURATION:
@@ -188,19 +209,127 @@ def fetch_gnews_weather(query="weather", page_size=10, api_key=None):
         logger.error(f"GNews fetch error: {e}")
         return get_dummy_news()
 
+NEWS_CATEGORIES = [
+    "Severe Weather Alerts",
+    "Climate Events",
+    "Air Quality and Heat Index Reports",
+    "Weather Impact News",
+    "Hydrological Updates"
+]
+
+def _article_cache_key(article):
+    """
+    Per-article key over the normalized URL and title. Deterministic, so one
+    worker's categorization is reused by every other worker and after restarts.
+    """
+    # Scheme and host are case-insensitive; path and query are not
+    parts = urlsplit((article.get("url") or "").strip())
+    url = urlunsplit(parts._replace(scheme=parts.scheme.lower(), netloc=parts.netloc.lower()))
+    title = " ".join((article.get("title") or "").split()).casefold()
+    return "news_article:" + stable_digest(url, title)
+
+def _fallback_article(a, summary_default="Check the full story for more details."):
+    pub_date = a.get("publishedAt")
+    if not pub_date:
+        pub_date = datetime.now().isoformat()
+    return {
+        "category": "Weather News",
+        "title": a.get("title") or "Weather Update",
+        "summary": (a.get("description")[:200] + "...") if a.get("description") else summary_default,
+        "urgency": "Medium",
+        "location": "Global",
+        "url": a.get("url") or "#",
+        "urlToImage": a.get("urlToImage"),
+        "publishedAt": str(pub_date)
+    }
+
+def _categorize_batch(articles):
+    """
+    Sends only the given articles to Gemini. Returns {article_key: result}, where
+    result is None for articles the model discarded as not weather-related.
+    """
+    article_summaries = []
+    for i, a in enumerate(articles):
+        article_summaries.append({
+            "id": str(i),
+            "title": a.get("title"),
+            "description": a.get("description"),
+            "url": a.get("url"),
+            "urlToImage": a.get("urlToImage"),
+            "publishedAt": a.get("publishedAt"),
+            "source": a.get("source", {}).get("name")
+        })
+
+    prompt = f"""
+    You are a strict weather news filter. Analyze the following news articles. 
+    Discard ANY article that is not explicitly about:
+    - Weather phenomena (rain, snow, wind, storms, etc.)
+    - Climate change or global warming
+    - Natural disasters (floods, droughts, earthquakes, wildfires)
+    - Meteorological forecasts or reports
+    - Environmental climate impact
+    
+    If an article is about politics, entertainment, general technology, or sports (unless directly weather-impacted), DISCARD it.
+    
+    Categorize the remaining articles into ONE of these categories: {', '.join(NEWS_CATEGORIES)}.
+    
+    For each valid weather article, provide:
+    - id: The original article id.
+    - category: One of the five categories listed above.
+    - title: The original headline.
+    - summary: A 2-3 sentence engaging summary.
+    - urgency: One of [Critical, High, Medium, Low].
+    - location: The primary geographic area affected (City, Country, or Region).
+    - url: The original URL.
+    - urlToImage: The original image URL.
+    - publishedAt: The original timestamp.
+    
+    Return the result as a STRICT JSON list of objects. Do not include any other text.
+    
+    Articles:
+    {json.dumps(article_summaries)}
+    """
+
+    categorized_articles = generate_json(prompt, "news_categorization")
+    if isinstance(categorized_articles, dict) and "articles" in categorized_articles:
+        categorized_articles = categorized_articles["articles"]
+    if not isinstance(categorized_articles, list):
+        raise ValueError("AI response is not a valid list")
+
+    by_id = {str(i): a for i, a in enumerate(articles)}
+    by_url = {a.get("url"): a for a in articles if a.get("url")}
+    results = {_article_cache_key(a): None for a in articles}
+    for item in categorized_articles:
+        if not isinstance(item, dict):
+            continue
+        source = by_id.get(str(item.pop("id", ""))) or by_url.get(item.get("url"))
+        if source is None:
+            continue
+        for field in ("title", "url", "urlToImage", "publishedAt"):
+            if not item.get(field):
+                item[field] = source.get(field)
+        results[_article_cache_key(source)] = item
+    return results
+
+def _remember_articles(results, now_ts):
+    """
+    Caches {article_key: categorization} in process. Expired entries are
+    dropped on every insert, then the oldest beyond AI_NEWS_CACHE_MAX.
+    """
+    with _AI_NEWS_LOCK:
+        for key, data in results.items():
+            AI_NEWS_CACHE[key] = {"timestamp": now_ts, "data": data}
+        for key in [k for k, entry in AI_NEWS_CACHE.items() if now_ts - entry["timestamp"] >= AI_CACHE_DURATION]:
+            del AI_NEWS_CACHE[key]
+        overflow = len(AI_NEWS_CACHE) - AI_NEWS_CACHE_MAX
+        if overflow > 0:
+            for key in sorted(AI_NEWS_CACHE, key=lambda k: AI_NEWS_CACHE[k]["timestamp"])[:overflow]:
+                del AI_NEWS_CACHE[key]
+
 def categorize_news_with_ai(articles, api_key):
     if not articles:
         return []
 
-    titles_hash = hash(tuple(a.get('title', '') for a in articles[:15]))
-    now_ts = datetime.now().timestamp()
-    
-    if titles_hash in AI_NEWS_CACHE:
-        cached = AI_NEWS_CACHE[titles_hash]
-        if now_ts - cached["timestamp"] < AI_CACHE_DURATION:
-            logger.info("Serving categorized news from AI cache")
-            return cached["data"]
-
     if not api_key:
         weather_terms = ['weather', 'forecast', 'storm', 'rain', 'snow', 'temp', 'climate', 'flood', 
                          'drought', 'heat', 'cold', 'wind', 'degree', 'celsius', 'fahrenheit', 'monsoon', 'cyclone']
@@ -210,114 +339,179 @@ def categorize_news_with_ai(articles, api_key):
             text = (a.get('title', '') + ' ' + a.get('description', '')).lower()
             if not any(term in text for term in weather_terms):
                 continue
-
-            pub_date = a.get("publishedAt") or datetime.now().isoformat()
-            fallback_results.append({
-                "category": "Weather News",
-                "title": a.get("title") or "Weather Update",
-                "summary": (a.get("description")[:200] + "...") if a.get("description") else "No summary available.",
-                "urgency": "Medium",
-                "location": "Global",
-                "url": a.get("url") or "#",
-                "urlToImage": a.get("urlToImage"),
-                "publishedAt": str(pub_date)
-            })
+            fallback_results.append(_fallback_article(a, "No summary available."))
         return fallback_results
 
-    try:
-        client = genai.Client(api_key=api_key)
-        
-        article_summaries = []
-        for a in articles[:15]:
-            article_summaries.append({
-                "title": a.get("title"),
-                "description": a.get("description"),
-                "url": a.get("url"),
-                "urlToImage": a.get("urlToImage"),
-                "publishedAt": a.get("publishedAt"),
-                "source": a.get("source", {}).get("name")
-            })
+    feed = articles[:15]
+    now_ts = datetime.now().timestamp()
 
-        categories = [
-            "Severe Weather Alerts",
-            "Climate Events",
-            "Air Quality and Heat Index Reports",
-            "Weather Impact News",
-            "Hydrological Updates"
-        ]
-
-        prompt = f"""
-        You are a strict weather news filter. Analyze the following news articles. 
-        Discard ANY article that is not explicitly about:
-        - Weather phenomena (rain, snow, wind, storms, etc.)
-        - Climate change or global warming
-        - Natural disasters (floods, droughts, earthquakes, wildfires)
-        - Meteorological forecasts or reports
-        - Environmental climate impact
-        
-        If an article is about politics, entertainment, general technology, or sports (unless directly weather-impacted), DISCARD it.
-        
-        Categorize the remaining articles into ONE of these categories: {', '.join(categories)}.
-        
-        For each valid weather article, provide:
-        - category: One of the five categories listed above.
-        - title: The original headline.
-        - summary: A 2-3 sentence engaging summary.
-        - urgency: One of [Critical, High, Medium, Low].
-        - location: The primary geographic area affected (City, Country, or Region).
-        - url: The original URL.
-        - urlToImage: The original image URL.
-        - publishedAt: The original timestamp.
-        
-        Return the result as a STRICT JSON list of objects. Do not include any other text.
-        
-        Articles:
-        {json.dumps(article_summaries)}
-        """
-
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=prompt
-        )
-        content = response.text.strip()
-        
-        if content.startswith("```json"):
-            content = content[7:-3].strip()
-        elif content.startswith("```"):
-            content = content[3:-3].strip()
-
-        categorized_articles = json.loads(content)
-        results = []
-        if isinstance(categorized_articles, list):
-            results = categorized_articles
-        elif isinstance(categorized_articles, dict) and "articles" in categorized_articles:
-            results = categorized_articles["articles"]
-        
-        if results:
-            AI_NEWS_CACHE[titles_hash] = {
-                "timestamp": now_ts,
-                "data": results
-            }
-            return results
-        
-        raise ValueError("AI response is not a valid list")
+    # In-process results first, then the shared persistent cache
+    known = {}
+    unseen = {}
+    for a in feed:
+        key = _article_cache_key(a)
+        entry = AI_NEWS_CACHE.get(key)
+        if entry and now_ts - entry["timestamp"] < AI_CACHE_DURATION:
+            known[key] = entry["data"]
+        else:
+            unseen.setdefault(key, a)
 
-    except Exception as e:
-        logger.error(f"AI categorization error: {e}")
-        fallback_results = []
-        for a in (articles or [])[:8]:
-            pub_date = a.get("publishedAt")
-            if not pub_date:
-                pub_date = datetime.now().isoformat()
-            
-            fallback_results.append({
-                "category": "Weather News",
-                "title": a.get("title") or "Weather Update",
-                "summary": (a.get("description")[:200] + "...") if a.get("description") else "Check the full story for more details.",
-                "urgency": "Medium",
-                "location": "Global",
-                "url": a.get("url") or "#",
-                "urlToImage": a.get("urlToImage"),
-                "publishedAt": str(pub_date)
-            })
-        return fallback_results
+    for key, raw in get_cached_ai_responses(unseen).items():
+        try:
+            known[key] = json.loads(raw)
+        except ValueError:
+            continue
+        _remember_articles({key: known[key]}, now_ts)
+
+    # Only articles nobody has classified yet go to the model
+    missing = [a for key, a in unseen.items() if key not in known]
+    if missing:
+        try:
+            fresh = _categorize_batch(missing)
+            _remember_articles(fresh, now_ts)
+            set_cached_ai_responses(
+                {key: json.dumps(data) for key, data in fresh.items()},
+                "news_categorization", ttl=AI_CACHE_DURATION
+            )
+            known.update(fresh)
+        except Exception as e:
+            logger.error(f"AI categorization error: {e}")
+            if not known:
+                return [_fallback_article(a) for a in feed[:8]]
+            # Show the uncategorized remainder as plain items rather than dropping it
+            known.update({_article_cache_key(a): _fallback_article(a) for a in missing})
+    else:
+        logger.info("Serving categorized news from AI cache")
+
+    # Merge cached and fresh results back in feed order
+    results = []
+    seen = set()
+    for a in feed:
+        key = _article_cache_key(a)
+        if key in seen:
+            continue
+        seen.add(key)
+        if known.get(key):
+            results.append(known[key])
+
+    if not results:
+        logger.error("AI categorization error: no weather articles in feed")
+        return [_fallback_article(a) for a in feed[:8]]
+    return results
+
+# --- Feed snapshots ---
+# Page handlers read the latest snapshot; the ingestion worker in app.tasks keeps
+# every known feed fresh so news APIs and Gemini stay off the request path.
+
+def news_feed_key(feed, country=None):
+    return f"{feed}:{country}" if country else feed
+
+def build_news_feed(feed, country=None):
+    """Fetches and categorizes one feed. Returns the ready-to-render article list."""
+    gemini_key = os.environ.get("GEMINI_API_KEY")
+    news_key = os.environ.get("NEWS_API_KEY")
+    gnews_key = os.environ.get("GNEWS_API_KEY")
+
+    if feed == "latest":
+        # Latest Headlines - Specifically Pakistan Weather via GNews
+        raw = fetch_gnews_weather(query="Pakistan weather", page_size=10, api_key=gnews_key)
+        if not raw:
+            raw = fetch_weather_news(query="weather news headlines breaking", page_size=10, api_key=news_key)
+    elif feed == "world":
+        raw = fetch_weather_news(query="global weather news headlines", page_size=10, api_key=news_key)
+    elif feed == "news":
+        raw = fetch_gnews_weather(query="Pakistan weather", page_size=15, api_key=gnews_key)
+        if not raw or (raw and raw[0].get('source', {}).get('name') == 'SynoNews'):
+            raw = fetch_weather_news(query="weather news headlines breaking global", page_size=20, api_key=news_key)
+    elif feed == "weather":
+        raw = fetch_weather_news(query="local weather forecast updates", country=country, page_size=10, api_key=news_key)
+    else:
+        raise ValueError(f"Unknown news feed: {feed}")
+
+    return categorize_news_with_ai(raw, gemini_key)
+
+def publish_news_snapshot(key, articles):
+    snapshot = {
+        "articles": articles,
+        "version": stable_digest([(a.get("url"), a.get("title"), a.get("category"), a.get("urgency")) for a in articles]),
+        "published_at": datetime.now().timestamp()
+    }
+    with _SNAPSHOT_LOCK:
+        NEWS_SNAPSHOTS[key] = snapshot
+        # Fragments of the previous version can never be served again
+        NEWS_FRAGMENT_CACHE.pop(key, None)
+    return snapshot
+
+def get_news_snapshot(key):
+    return NEWS_SNAPSHOTS.get(key)
+
+def get_news_feed_snapshot(feed, country=None):
+    """
+    Returns the latest published snapshot for a feed. Only a cold start (or a
+    stalled worker) builds the feed inline; the key is then kept fresh by ingestion.
+    """
+    key = news_feed_key(feed, country)
+    NEWS_FEED_READS[key] = datetime.now().timestamp()
+    snapshot = get_news_snapshot(key)
+    if snapshot and datetime.now().timestamp() - snapshot["published_at"] < NEWS_SNAPSHOT_MAX_AGE:
+        return snapshot
+    return publish_news_snapshot(key, build_news_feed(feed, country))
+
+def get_news_feed(feed, country=None):
+    return get_news_feed_snapshot(feed, country)["articles"]
+
+def render_news_fragments(feed, fragments, country=None, locale="en"):
+    """
+    Renders news sections of one feed snapshot. `fragments` maps a fragment name
+    to (template, select), where select optionally picks the articles to show.
+    HTML is cached per snapshot version and locale, so the card loops are only
+    rendered once per published snapshot. Returns {name: Markup}.
+    """
+    key = news_feed_key(feed, country)
+    snapshot = get_news_feed_snapshot(feed, country)
+    cached = NEWS_FRAGMENT_CACHE.get(key, {})
+
+    results = {}
+    for name, (template, select) in fragments.items():
+        entry = cached.get((name, locale))
+        if entry and entry[0] == snapshot["version"]:
+            results[name] = entry[1]
+            continue
+
+        articles = select(snapshot["articles"]) if select else snapshot["articles"]
+        html = Markup(current_app.jinja_env.get_template(template).render(articles=articles)) if articles else Markup("")
+        with _SNAPSHOT_LOCK:
+            # Don't resurrect entries for a snapshot that was replaced meanwhile
+            if NEWS_SNAPSHOTS.get(key) is snapshot:
+                NEWS_FRAGMENT_CACHE.setdefault(key, {})[(name, locale)] = (snapshot["version"], html)
+        results[name] = html
+    return results
+
+def refresh_news_feeds():
+    """
+    Rebuilds the default feeds plus feeds pages have read recently. Requested
+    feeds idle for NEWS_FEED_IDLE_TTL (or beyond the NEWS_MAX_REQUESTED_FEEDS
+    most recent) are dropped, so news API usage stays bounded.
+    """
+    feeds = {news_feed_key(f, c): (f, c) for f, c in DEFAULT_NEWS_FEEDS}
+    now_ts = datetime.now().timestamp()
+    requested = sorted(
+        (key for key in list(NEWS_SNAPSHOTS) if key not in feeds),
+        key=lambda key: NEWS_FEED_READS.get(key, 0),
+        reverse=True
+    )
+    for rank, key in enumerate(requested):
+        if rank >= NEWS_MAX_REQUESTED_FEEDS or now_ts - NEWS_FEED_READS.get(key, 0) > NEWS_FEED_IDLE_TTL:
+            with _SNAPSHOT_LOCK:
+                NEWS_SNAPSHOTS.pop(key, None)
+                NEWS_FRAGMENT_CACHE.pop(key, None)
+            NEWS_FEED_READS.pop(key, None)
+            continue
+        feed, _, country = key.partition(":")
+        feeds[key] = (feed, country or None)
+
+    for key, (feed, country) in feeds.items():
+        try:
+            publish_news_snapshot(key, build_news_feed(feed, country))
+        except Exception as e:
+            logger.error(f"News ingestion failed for {key}: {e}")
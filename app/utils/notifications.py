@@ -5,100 +5,111 @@ import logging
 
 import json
 import logging
-from google import genai
+import threading
+from datetime import datetime
 from flask import render_template_string, current_app
+from app.utils.ai_gateway import generate_text
+from app.utils.ai_cache import stable_digest, get_cached_ai_response, set_cached_ai_response
+from app.utils.alerts import alert_identity, alert_fingerprint, alert_category_mask, preferences_mask
+from app.utils.outbox import (
+    PRIORITY_BULK, PRIORITY_TRANSACTIONAL, RESEND_EMAILS_URL,
+    enqueue_email, resend_configured, resend_headers, resend_message
+)
 
 logger = logging.getLogger(__name__)
 
+# Advice per unique alert, reused by every recipient and polling cycle:
+# {alert_key: (expires_at, advice)}
+ALERT_ADVICE_CACHE = {}
+ALERT_ADVICE_MIN_TTL = 3600 # alerts without an end time (or ending soon) keep advice this long
+ALERT_ADVICE_CACHE_MAX = 512
+_ADVICE_LOCK = threading.Lock() # guards the two dicts, never held across a model call
+_ADVICE_KEY_LOCKS = {} # {alert_key: lock} while advice for that alert is being generated
+
 def is_alert_relevant(alert, prefs):
     """
     Determines if an alert matches the user's preferences.
     """
-    if not prefs:
-        return True # Default to all if no prefs
-        
-    event = alert.get('event', '').lower()
-    desc = alert.get('description', '').lower()
-    
-    # Check severity
-    # OpenWeather alerts doesn't always have standard severity field, often it's in description or tags
-    # We'll assume 'severity' key exists or infer from event name
-    # For now, simplistic matching
-    
-    pref_types = prefs.get('types', [])
-    if not pref_types: return True
-    
-    relevant = False
-    if 'severe' in pref_types:
-        if any(x in event for x in ['severe', 'storm', 'tornado', 'hurricane', 'warning']):
-            relevant = True
-    if 'rain' in pref_types:
-        if any(x in event for x in ['rain', 'flood', 'shower']):
-            relevant = True
-    if 'temp' in pref_types:
-        if any(x in event for x in ['heat', 'cold', 'freeze', 'chill']):
-            relevant = True
-    if 'air' in pref_types:
-        if any(x in event for x in ['quality', 'pollution', 'smoke', 'dust']):
-            relevant = True
-            
-    return relevant
+    return bool(alert_category_mask(alert) & preferences_mask(prefs))
+
+def alert_advice_key(alert):
+    return "alert_advice:" + alert_identity(alert)
 
 def get_ai_advice(alert):
     """
-    Uses Gemini to generate safety advice for the alert.
+    Uses Gemini to generate safety advice for the alert. Advice is generated
+    once per unique alert and cached until the alert ends.
     """
     api_key = os.environ.get("GEMINI_API_KEY")
     if not api_key:
         return "Stay safe and follow local authority guidelines."
-        
-    try:
-        client = genai.Client(api_key=api_key)
-        prompt = f"""
-        Provide concise, actionable safety advice (max 3 sentences) for this weather alert:
-        Event: {alert.get('event')}
-        Description: {alert.get('description')}
-        """
-        
-        response = client.models.generate_content(
-            model="gemini-2.0-flash-exp",
-            contents=prompt
-        )
-        return response.text.strip()
-    except Exception as e:
-        logger.error(f"AI advice error: {e}")
-        return "Stay indoors and monitor local news."
 
+    key = alert_advice_key(alert)
+    now_ts = datetime.utcnow().timestamp()
+    with _ADVICE_LOCK:
+        cached = ALERT_ADVICE_CACHE.get(key)
+        if cached and cached[0] > now_ts:
+            return cached[1]
+        key_lock = _ADVICE_KEY_LOCKS.setdefault(key, threading.Lock())
+
+    # Concurrent senders of the same alert wait for one answer; other alerts proceed
+    with key_lock:
+        with _ADVICE_LOCK:
+            cached = ALERT_ADVICE_CACHE.get(key)
+            if cached and cached[0] > now_ts:
+                return cached[1]
+
+        ttl = max(ALERT_ADVICE_MIN_TTL, (alert.get('end') or 0) - now_ts)
+        advice = get_cached_ai_response(key)
+        if advice is None:
+            try:
+                prompt = f"""
+                Provide concise, actionable safety advice (max 3 sentences) for this weather alert:
+                Event: {alert.get('event')}
+                Description: {alert.get('description')}
+                """
+                advice = generate_text(prompt, "alert_advice", cache=False)
+            except Exception as e:
+                logger.error(f"AI advice error: {e}")
+                with _ADVICE_LOCK:
+                    _ADVICE_KEY_LOCKS.pop(key, None)
+                return "Stay indoors and monitor local news."
+            set_cached_ai_response(key, "alert_advice", advice, ttl=ttl)
+
+        with _ADVICE_LOCK:
+            _store_advice(key, now_ts + ttl, advice, now_ts)
+            _ADVICE_KEY_LOCKS.pop(key, None)
+        return advice
 
-def send_email(to_email, subject, text_content=None, html_content=None):
+def _store_advice(key, expires_at, advice, now_ts):
+    """Caches advice, evicting expired entries and then the soonest to expire beyond the cap."""
+    ALERT_ADVICE_CACHE[key] = (expires_at, advice)
+    if len(ALERT_ADVICE_CACHE) <= ALERT_ADVICE_CACHE_MAX:
+        return
+    for stale in [k for k, (expires, _) in ALERT_ADVICE_CACHE.items() if expires <= now_ts]:
+        del ALERT_ADVICE_CACHE[stale]
+    overflow = len(ALERT_ADVICE_CACHE) - ALERT_ADVICE_CACHE_MAX
+    if overflow > 0:
+        for stale in sorted(ALERT_ADVICE_CACHE, key=lambda k: ALERT_ADVICE_CACHE[k][0])[:overflow]:
+            del ALERT_ADVICE_CACHE[stale]
+
+def send_email(to_email, subject, text_content=None, html_content=None, idempotency_key=None):
     """
     Sends an email using the Resend API.
     """
-    api_key = os.environ.get("RESEND_API_KEY")
-    sender_email = os.environ.get("SENDER_EMAIL", "onboarding@resend.dev") # Default Resend testing email
-    
-    if not api_key:
+    if not resend_configured():
         logger.warning(f"RESEND_API_KEY not set. Email to {to_email} suppressed.")
         logger.info(f"Subject: {subject}")
         logger.info(f"Body: {text_content}")
         return False
 
-    url = "https://api.resend.com/emails"
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    payload = {
-        "from": "SynoCast <" + sender_email + ">",
-        "to": [to_email],
-        "subject": subject,
-        "text": text_content or "",
-        "html": html_content or text_content or ""
-    }
-
     try:
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
+        response = requests.post(
+            RESEND_EMAILS_URL,
+            json=resend_message(to_email, subject, text_content, html_content),
+            headers=resend_headers(idempotency_key),
+            timeout=10
+        )
         if response.ok:
             return True
         else:
@@ -108,6 +119,17 @@ def send_email(to_email, subject, text_content=None, html_content=None):
         logger.error(f"Failed to send email: {e}")
         return False
 
+def queue_email(to_email, subject, text_content=None, html_content=None, idempotency_key=None, priority=PRIORITY_BULK):
+    """
+    Hands an email to the outbox workers and returns without waiting for
+    Resend. Falls back to sending inline if the outbox can't be written.
+    """
+    if not resend_configured():
+        return send_email(to_email, subject, text_content, html_content)
+    if enqueue_email(to_email, subject, text_content, html_content, idempotency_key, priority):
+        return True
+    return send_email(to_email, subject, text_content, html_content, idempotency_key)
+
 def send_otp_email(to_email, otp):
     """
     Sends a verification OTP email.
@@ -134,7 +156,12 @@ def send_otp_email(to_email, otp):
     </div>
     """
     
-    return send_email(to_email, subject, text_body, html_body)
+    idempotency_key = f"otp:{to_email}:{otp}"
+    if os.environ.get("VERCEL"):
+        # Serverless: the outbox workers don't outlive the request, so send inline
+        return send_email(to_email, subject, text_body, html_body, idempotency_key)
+    # Queued ahead of bulk alert mail; /otp returns as soon as it is stored
+    return queue_email(to_email, subject, text_body, html_body, idempotency_key, PRIORITY_TRANSACTIONAL)
 
 def send_alert_email(to_email, alert, advice):
     """
@@ -182,5 +209,57 @@ def send_alert_email(to_email, alert, advice):
     </div>
     """
     
-    return send_email(to_email, subject, text_body, html_body)
+    return queue_email(to_email, subject, text_body, html_body, f"alert:{to_email}:{alert_fingerprint(alert)}")
+
+def send_alert_digest_email(to_email, alerts):
+    """
+    Sends one email summarizing several alerts, each with its safety advice.
+    A single alert is sent as a regular alert email.
+    """
+    if len(alerts) == 1:
+        return send_alert_email(to_email, alerts[0], get_ai_advice(alerts[0]))
+
+    subject = f"⚠️ {len(alerts)} weather alerts for your area"
+    unsub_url = f"https://syno-cast.vercel.app/unsubscribe?email={to_email}"
+
+    text_sections, html_sections = [], []
+    for alert in alerts:
+        severity = alert.get('severity', 'Unknown')
+        description = alert.get('description', 'No details available.')
+        advice = get_ai_advice(alert)
+        text_sections.append(f"""
+    Event: {alert.get('event')}
+    Severity: {severity}
+
+    {description}
+
+    AI Advice:
+    {advice}
+    """)
+        html_sections.append(f"""
+        <h2 style="color: #d32f2f;">{alert.get('event')}</h2>
+        <p><strong>Severity:</strong> {severity}</p>
+        <p style="background-color: #fff3f3; padding: 10px; border-radius: 4px;">{description}</p>
+        <p><strong style="color: #3f5e96;">AI Safety Advice:</strong> {advice}</p>
+        """)
+
+    text_body = f"""
+    SynoCast Weather Alerts
+    {"".join(text_sections)}
+    Stay safe!
+
+    To unsubscribe, visit: {unsub_url}
+    """
+
+    html_body = f"""
+    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto; padding: 20px; border-left: 5px solid #ff4444;">
+        {"<hr style='border: 0; border-top: 1px solid #eee;'>".join(html_sections)}
+        <hr style="border: 0; border-top: 1px solid #eee; margin: 20px 0;">
+        <p style="font-size: 12px; color: #888; text-align: center;">
+            <a href="{unsub_url}" style="color: #888;">Unsubscribe from alerts</a>
+        </p>
+    </div>
+    """
 
+    digest_key = stable_digest(*sorted(alert_fingerprint(alert) for alert in alerts))
+    return queue_email(to_email, subject, text_body, html_body, f"digest:{to_email}:{digest_key}")
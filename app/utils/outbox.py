@@ -0,0 +1,235 @@
+import os
+import time
+import logging
+import sqlite3
+import threading
+import requests
+from app.database import get_db
+from app.utils.ai_cache import stable_digest
+
+logger = logging.getLogger(__name__)
+
+RESEND_EMAILS_URL = "https://api.resend.com/emails"
+RESEND_BATCH_URL = "https://api.resend.com/emails/batch"
+RESEND_BATCH_LIMIT = 100 # Resend accepts at most 100 messages per batch call
+
+EMAIL_OUTBOX_WORKERS = int(os.environ.get("EMAIL_OUTBOX_WORKERS", 2))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 6))
+EMAIL_OUTBOX_POLL_INTERVAL = 5 # seconds an idle worker waits before looking again
+EMAIL_OUTBOX_CLAIM_TIMEOUT = 300 # a 'sending' row older than this was abandoned by a dead worker
+EMAIL_RETRY_BASE = 30 # seconds, doubled per attempt
+EMAIL_RETRY_MAX = 3600
+EMAIL_OUTBOX_RETENTION = 7 * 86400 # sent and dead rows are deleted this long after they were queued
+EMAIL_OUTBOX_PRUNE_INTERVAL = 3600
+
+PRIORITY_TRANSACTIONAL = 10 # OTPs jump ahead of bulk alert mail
+PRIORITY_BULK = 0
+
+_OUTBOX_WAKE = threading.Event()
+
+def resend_configured():
+    return bool(os.environ.get("RESEND_API_KEY"))
+
+def resend_message(to_email, subject, text_content=None, html_content=None):
+    """Resend API payload for one message."""
+    sender_email = os.environ.get("SENDER_EMAIL", "onboarding@resend.dev") # Default Resend testing email
+    return {
+        "from": "SynoCast <" + sender_email + ">",
+        "to": [to_email],
+        "subject": subject,
+        "text": text_content or "",
+        "html": html_content or text_content or ""
+    }
+
+def resend_headers(idempotency_key=None):
+    headers = {
+        "Authorization": f"Bearer {os.environ.get('RESEND_API_KEY')}",
+        "Content-Type": "application/json"
+    }
+    if idempotency_key:
+        # Resend drops a repeated request with the same key for 24 hours
+        headers["Idempotency-Key"] = idempotency_key
+    return headers
+
+def enqueue_email(to_email, subject, text_content=None, html_content=None, idempotency_key=None, priority=PRIORITY_BULK):
+    """
+    Stores a message in the durable outbox for the delivery workers. A key
+    that is already pending or sent is not queued twice; a dead-lettered one
+    is queued again with the new content. Returns False if the message could
+    not be stored.
+    """
+    now_ts = time.time()
+    key = idempotency_key or stable_digest(to_email, subject, text_content, now_ts)
+    try:
+        with get_db() as conn:
+            stored = conn.execute(
+                """
+                INSERT INTO email_outbox
+                    (idempotency_key, to_email, subject, text_content, html_content, priority,
+                     status, attempts, next_attempt_at, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, 'pending', 0, ?, ?)
+                ON CONFLICT(idempotency_key) DO UPDATE SET
+                    subject = excluded.subject,
+                    text_content = excluded.text_content,
+                    html_content = excluded.html_content,
+                    status = 'pending',
+                    attempts = 0,
+                    next_attempt_at = excluded.next_attempt_at,
+                    last_error = NULL,
+                    created_at = excluded.created_at
+                WHERE email_outbox.status = 'dead'
+                """,
+                (key, to_email, subject, text_content, html_content, priority, now_ts, now_ts)
+            ).rowcount
+            conn.commit()
+    except sqlite3.Error as e:
+        logger.error(f"Email outbox enqueue failed: {e}")
+        return False
+    if not stored:
+        logger.info(f"Email {key} is already queued or sent, not queuing it again")
+        return True
+    _OUTBOX_WAKE.set()
+    return True
+
+def claim_outbox_batch(limit=RESEND_BATCH_LIMIT):
+    """Atomically moves up to `limit` due messages to 'sending' and returns them."""
+    now_ts = time.time()
+    with get_db() as conn:
+        conn.row_factory = sqlite3.Row
+        conn.isolation_level = None
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                """
+                SELECT * FROM email_outbox
+                WHERE (status = 'pending' AND next_attempt_at <= ?)
+                   OR (status = 'sending' AND claimed_at < ?)
+                ORDER BY priority DESC, id
+                LIMIT ?
+                """,
+                (now_ts, now_ts - EMAIL_OUTBOX_CLAIM_TIMEOUT, limit)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE email_outbox SET status = 'sending', claimed_at = ? WHERE id = ?",
+                [(now_ts, row["id"]) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+    return [dict(row) for row in rows]
+
+def _is_permanent(status_code):
+    # Validation and auth errors won't succeed on retry; rate limits and 5xx might
+    return 400 <= status_code < 500 and status_code != 429
+
+def _send_one(message):
+    """Returns (delivered, permanent_failure, error)."""
+    try:
+        response = requests.post(
+            RESEND_EMAILS_URL,
+            json=resend_message(message["to_email"], message["subject"], message["text_content"], message["html_content"]),
+            headers=resend_headers(message["idempotency_key"]),
+            timeout=10
+        )
+        if response.ok:
+            return True, False, None
+        return False, _is_permanent(response.status_code), f"{response.status_code} {response.text[:200]}"
+    except Exception as e:
+        return False, False, str(e)
+
+def _send_batch(messages):
+    """Sends messages with one batch call. Returns {id: (delivered, permanent_failure, error)}."""
+    try:
+        response = requests.post(
+            RESEND_BATCH_URL,
+            json=[
+                resend_message(m["to_email"], m["subject"], m["text_content"], m["html_content"])
+                for m in messages
+            ],
+            headers=resend_headers("batch-" + stable_digest(*[m["idempotency_key"] for m in messages])),
+            timeout=30
+        )
+    except Exception as e:
+        return {m["id"]: (False, False, str(e)) for m in messages}
+
+    if response.ok:
+        return {m["id"]: (True, False, None) for m in messages}
+    if _is_permanent(response.status_code):
+        # One bad message fails the whole batch; send individually to isolate it
+        return {m["id"]: _send_one(m) for m in messages}
+    return {m["id"]: (False, False, f"{response.status_code} {response.text[:200]}") for m in messages}
+
+def deliver_outbox_batch(messages):
+    """
+    Sends claimed messages and records the outcome: sent, retried with
+    exponential backoff, or dead-lettered after EMAIL_OUTBOX_MAX_ATTEMPTS
+    (or at once for a permanent failure).
+    """
+    if not messages:
+        return {}
+    results = _send_batch(messages) if len(messages) > 1 else {messages[0]["id"]: _send_one(messages[0])}
+
+    now_ts = time.time()
+    updates = []
+    for message in messages:
+        delivered, permanent, error = results[message["id"]]
+        attempts = message["attempts"] + 1
+        if delivered:
+            updates.append(("sent", attempts, message["next_attempt_at"], None, now_ts, message["id"]))
+        elif permanent or attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+            logger.error(f"Email {message['id']} to {message['to_email']} dead-lettered: {error}")
+            updates.append(("dead", attempts, message["next_attempt_at"], error, None, message["id"]))
+        else:
+            delay = min(EMAIL_RETRY_MAX, EMAIL_RETRY_BASE * 2 ** (attempts - 1))
+            updates.append(("pending", attempts, now_ts + delay, error, None, message["id"]))
+
+    with get_db() as conn:
+        conn.executemany(
+            """
+            UPDATE email_outbox
+            SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?, sent_at = ?, claimed_at = NULL
+            WHERE id = ?
+            """,
+            updates
+        )
+        # Delivered bodies (which may hold personal data) aren't kept around
+        conn.executemany(
+            "UPDATE email_outbox SET text_content = NULL, html_content = NULL WHERE id = ?",
+            [(message["id"],) for message in messages if results[message["id"]][0]]
+        )
+        conn.commit()
+    return results
+
+def prune_email_outbox(retention=EMAIL_OUTBOX_RETENTION):
+    """Deletes sent and dead-lettered messages queued longer than `retention` ago. Returns how many."""
+    with get_db() as conn:
+        removed = conn.execute(
+            "DELETE FROM email_outbox WHERE status IN ('sent', 'dead') AND created_at < ?",
+            (time.time() - retention,)
+        ).rowcount
+        conn.commit()
+    if removed:
+        logger.info(f"Pruned {removed} old outbox messages")
+    return removed
+
+_LAST_PRUNE = {"at": 0}
+
+def process_email_outbox():
+    """
+    Claims and delivers one batch, pruning old rows about once an hour.
+    Returns the number of messages handled.
+    """
+    if not resend_configured():
+        return 0
+    if time.time() - _LAST_PRUNE["at"] > EMAIL_OUTBOX_PRUNE_INTERVAL:
+        _LAST_PRUNE["at"] = time.time()
+        prune_email_outbox()
+    messages = claim_outbox_batch()
+    deliver_outbox_batch(messages)
+    return len(messages)
+
+def wait_for_outbox_work(timeout=EMAIL_OUTBOX_POLL_INTERVAL):
+    """Blocks until a message is enqueued or the timeout passes."""
+    _OUTBOX_WAKE.wait(timeout)
+    _OUTBOX_WAKE.clear()
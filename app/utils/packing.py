@@ -0,0 +1,145 @@
+import re
+import logging
+from app.utils.ai_gateway import ai_available, generate_json
+
+logger = logging.getLogger(__name__)
+
+_TEMP_RE = re.compile(r"(-?\d+(?:\.\d+)?)\s*°?\s*([CF])?", re.IGNORECASE)
+_SNOW_WORDS = ("snow", "sleet", "blizzard", "ice")
+_RAIN_WORDS = ("rain", "drizzle", "shower", "thunder", "storm")
+
+# Always packed, whatever the trip
+BASE_ITEMS = [
+    {"category": "Essentials", "item": "Passport / ID", "icon": "fa-passport"},
+    {"category": "Gadgets", "item": "Phone charger & power bank", "icon": "fa-plug"},
+    {"category": "Health", "item": "Basic medicines", "icon": "fa-kit-medical"},
+]
+
+CLIMATE_ITEMS = {
+    "freezing": [
+        {"category": "Clothing", "item": "Insulated winter coat", "icon": "fa-vest"},
+        {"category": "Clothing", "item": "Thermal base layers", "icon": "fa-tshirt"},
+        {"category": "Clothing", "item": "Gloves, scarf & warm hat", "icon": "fa-mitten"},
+    ],
+    "cold": [
+        {"category": "Clothing", "item": "Warm jacket", "icon": "fa-vest"},
+        {"category": "Clothing", "item": "Sweaters for layering", "icon": "fa-tshirt"},
+    ],
+    "mild": [
+        {"category": "Clothing", "item": "Light jacket", "icon": "fa-vest"},
+        {"category": "Clothing", "item": "Long-sleeve shirts", "icon": "fa-tshirt"},
+    ],
+    "warm": [
+        {"category": "Clothing", "item": "Breathable T-shirts", "icon": "fa-tshirt"},
+        {"category": "Essentials", "item": "Sunglasses", "icon": "fa-glasses"},
+    ],
+    "hot": [
+        {"category": "Clothing", "item": "Lightweight cotton clothes", "icon": "fa-tshirt"},
+        {"category": "Health", "item": "Sunscreen SPF 50", "icon": "fa-sun"},
+        {"category": "Essentials", "item": "Reusable water bottle", "icon": "fa-bottle-water"},
+        {"category": "Clothing", "item": "Sun hat", "icon": "fa-hat-cowboy"},
+    ],
+    "unknown": [
+        {"category": "Clothing", "item": "Layered clothing", "icon": "fa-tshirt"},
+    ],
+}
+
+PRECIPITATION_ITEMS = {
+    "rain": [
+        {"category": "Clothing", "item": "Raincoat or umbrella", "icon": "fa-umbrella"},
+        {"category": "Clothing", "item": "Waterproof shoes", "icon": "fa-shoe-prints"},
+    ],
+    "snow": [
+        {"category": "Clothing", "item": "Waterproof snow boots", "icon": "fa-shoe-prints"},
+    ],
+    "dry": [],
+}
+
+DURATION_ITEMS = {
+    "weekend": [],
+    "week": [{"category": "Essentials", "item": "Laundry bag", "icon": "fa-bag-shopping"}],
+    "extended": [
+        {"category": "Essentials", "item": "Laundry bag", "icon": "fa-bag-shopping"},
+        {"category": "Essentials", "item": "Travel-size detergent", "icon": "fa-soap"},
+    ],
+}
+
+def _climate_band(temp_c):
+    if temp_c is None: return "unknown"
+    if temp_c < 0: return "freezing"
+    if temp_c < 10: return "cold"
+    if temp_c < 20: return "mild"
+    if temp_c < 28: return "warm"
+    return "hot"
+
+def _duration_band(days):
+    if days <= 3: return "weekend"
+    if days <= 7: return "week"
+    return "extended"
+
+def packing_bucket(days, weather_summary):
+    """
+    Reduces a trip to (climate, duration, precipitation), e.g. ("hot", "week", "rain").
+    `weather_summary` is the free-text "Condition, 31°C" string sent by the travel page.
+    """
+    try:
+        days = max(1, int(days))
+    except (TypeError, ValueError):
+        days = 3
+
+    summary = (weather_summary or "").lower()
+    temp_c = None
+    match = _TEMP_RE.search(summary)
+    if match:
+        temp_c = float(match.group(1))
+        if (match.group(2) or "").upper() == "F":
+            temp_c = (temp_c - 32) * 5 / 9
+
+    if any(word in summary for word in _SNOW_WORDS):
+        precipitation = "snow"
+    elif any(word in summary for word in _RAIN_WORDS):
+        precipitation = "rain"
+    else:
+        precipitation = "dry"
+
+    return (_climate_band(temp_c), _duration_band(days), precipitation)
+
+def build_packing_list(bucket):
+    """Rule-generated list for a bucket, used when the model is unavailable."""
+    climate, duration, precipitation = bucket
+    items = CLIMATE_ITEMS[climate] + PRECIPITATION_ITEMS[precipitation] + DURATION_ITEMS[duration] + BASE_ITEMS
+    return {"items": items}
+
+def get_packing_list(days, weather_summary):
+    """
+    Packing list for a trip bucket. The model prompt depends only on the bucket,
+    so the AI cache answers every trip in the same bucket after the first; the
+    rule list covers a missing key or a failed call.
+    """
+    bucket = packing_bucket(days, weather_summary)
+    if not ai_available():
+        return build_packing_list(bucket)
+
+    climate, duration, precipitation = bucket
+    prompt = f"""
+    Generate a smart packing list for a {duration}-length trip to a destination
+    with {climate} temperatures and {precipitation} weather.
+
+    Return JSON with a list of items grouped by category.
+    Format:
+    {{
+        "items": [
+            {{"category": "Clothing", "item": "Raincoat (Heavy rain expected)", "icon": "fa-tshirt"}},
+            {{"category": "Gadgets", "item": "Universal Adapter", "icon": "fa-plug"}},
+            ...
+        ]
+    }}
+    Limit to 10-12 most important items.
+    """
+    try:
+        result = generate_json(prompt, "packing_list")
+        if isinstance(result, dict) and result.get("items"):
+            return result
+    except Exception as e:
+        logger.error(f"Packing List AI Error: {e}")
+    return build_packing_list(bucket)
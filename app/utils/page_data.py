@@ -0,0 +1,95 @@
+import os
+import time
+import logging
+import concurrent.futures
+from flask import current_app
+from markupsafe import Markup
+
+logger = logging.getLogger(__name__)
+
+PAGE_DATA_TIMEOUT = float(os.environ.get("PAGE_DATA_TIMEOUT", 8))  # seconds, shared by all dependencies
+
+# Shared across requests; a dependency that misses the deadline keeps running
+# here and still publishes its result (e.g. a news snapshot) for the next request.
+_PAGE_DATA_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix="page-data")
+
+def _run_in_app_context(app, fn):
+    def run():
+        with app.app_context():
+            return fn()
+    return run
+
+def submit_page_data(dependencies):
+    """Starts every dependency concurrently. Returns {name: future}."""
+    app = current_app._get_current_object()
+    return {
+        name: _PAGE_DATA_EXECUTOR.submit(_run_in_app_context(app, fn))
+        for name, fn in dependencies.items()
+    }
+
+class LazySection:
+    """
+    A page section whose data is resolved only when the template first touches
+    it. Used with streamed templates, everything rendered before the section
+    (head, CSS, navigation) reaches the browser while the data is still loading.
+    """
+    def __init__(self, resolve, placeholder=None, name="section"):
+        self._resolve = resolve
+        self._placeholder = placeholder
+        self._name = name
+        self._resolved = False
+        self._value = None
+
+    def _get(self):
+        if not self._resolved:
+            try:
+                self._value = self._resolve()
+            except concurrent.futures.TimeoutError:
+                logger.warning(f"Page data '{self._name}' missed the deadline, rendering placeholder")
+                self._value = self._placeholder
+            except Exception as e:
+                logger.error(f"Page data '{self._name}' failed: {e}")
+                self._value = self._placeholder
+            self._resolved = True
+        return self._value
+
+    def derive(self, fn, placeholder=None, name=None):
+        """A section computed from this one's data once it is available."""
+        return LazySection(lambda: fn(self._get()), placeholder, name or self._name)
+
+    def __iter__(self):
+        return iter(self._get() or [])
+
+    def __len__(self):
+        return len(self._get() or [])
+
+    def __bool__(self):
+        return bool(self._get())
+
+    def __getitem__(self, index):
+        return self._get()[index]
+
+    def __html__(self):
+        return Markup(self._get() or "")
+
+    def __str__(self):
+        return str(self._get() or "")
+
+def stream_page_data(dependencies, placeholders=None, timeout=None):
+    """
+    Starts independent page data dependencies ({name: callable}) concurrently
+    and returns {name: LazySection} without waiting. All sections share one
+    deadline measured from this call; anything that fails or misses it renders
+    its placeholder (default None) instead of blocking the page.
+    """
+    placeholders = placeholders or {}
+    deadline = time.monotonic() + (timeout or PAGE_DATA_TIMEOUT)
+    futures = submit_page_data(dependencies)
+
+    def resolver(future):
+        return lambda: future.result(timeout=max(0, deadline - time.monotonic()))
+
+    return {
+        name: LazySection(resolver(future), placeholders.get(name), name)
+        for name, future in futures.items()
+    }
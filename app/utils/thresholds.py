@@ -0,0 +1,113 @@
+import math
+import logging
+import functools
+from datetime import datetime, timezone
+import numpy as np
+from app.utils.alerts import parse_stored_preferences
+
+logger = logging.getLogger(__name__)
+
+# Optional numeric limits a subscriber can store in `alert_thresholds`, in metric units
+THRESHOLD_FIELDS = ("temp_max", "temp_min", "rain_mm", "wind_speed")
+THRESHOLD_FORECAST_STEPS = 8 # 3-hour forecast steps, i.e. the next 24 hours
+
+# temp_min triggers when the forecast falls to or below it, the rest when it reaches or exceeds them
+_DIRECTION = np.array([1, -1, 1, 1])
+
+THRESHOLD_EVENTS = {
+    "temp_max": ("Extreme Heat Alert", "Temperatures are forecast to reach your {limit:g}°C limit on {day}."),
+    "temp_min": ("Freeze Alert", "Temperatures are forecast to drop to your {limit:g}°C limit on {day}."),
+    "rain_mm": ("Heavy Rain Alert", "At least your {limit:g} mm of rain in three hours is forecast on {day}."),
+    "wind_speed": ("High Wind Warning", "Winds are forecast to reach your {limit:g} m/s limit on {day}."),
+}
+
+@functools.lru_cache(maxsize=4096)
+def stored_thresholds(prefs_json):
+    """Tuple of limits in THRESHOLD_FIELDS order (NaN where unset), or None if the subscriber set none."""
+    prefs = parse_stored_preferences(prefs_json) or {}
+    limits = []
+    for field in THRESHOLD_FIELDS:
+        try:
+            limits.append(float(prefs[field]))
+        except (KeyError, TypeError, ValueError):
+            limits.append(math.nan)
+    if all(math.isnan(limit) for limit in limits):
+        return None
+    return tuple(limits)
+
+def forecast_matrix(forecast_list, steps=THRESHOLD_FORECAST_STEPS):
+    """
+    Values compared against each threshold, shape (steps, fields), plus the
+    step timestamps. Missing steps are NaN and never trigger.
+    """
+    values = np.full((steps, len(THRESHOLD_FIELDS)), np.nan)
+    times = np.zeros(steps, dtype=np.int64)
+    for i, item in enumerate(forecast_list[:steps]):
+        temp = item.get('main', {}).get('temp', np.nan)
+        rain = item.get('rain', {}).get('3h', 0)
+        wind = item.get('wind', {}).get('speed', np.nan)
+        values[i] = (temp, temp, rain, wind)
+        times[i] = item.get('dt', 0)
+    return values, times
+
+def evaluate_thresholds(limits, forecasts):
+    """Exceedances of limits (N, fields) over forecasts (N, steps, fields), as a bool (N, steps, fields) array."""
+    with np.errstate(invalid="ignore"):
+        return forecasts * _DIRECTION >= (limits * _DIRECTION)[:, None, :]
+
+def threshold_alert(field, limit, timestamp, utc_offset=0):
+    """
+    Alert in the OpenWeatherMap alert shape. It spans the cell's local day of
+    the first exceedance, so the sent-alert ledger delivers it once per day
+    per threshold.
+    """
+    event, description = THRESHOLD_EVENTS[field]
+    day_start = timestamp - (timestamp + utc_offset) % 86400
+    day = datetime.fromtimestamp(day_start + utc_offset, tz=timezone.utc).strftime("%A")
+    return {
+        "event": event,
+        "sender_name": "SynoCast",
+        "start": day_start,
+        "end": day_start + 86400,
+        "severity": "Moderate",
+        "description": description.format(limit=limit, day=day),
+        "tags": ["threshold", field],
+    }
+
+def threshold_alerts(subscribers, forecasts_by_cell, utc_offsets=None):
+    """
+    Evaluates every subscriber's thresholds against its cell's forecast in one
+    vectorized pass. `subscribers` is [(subscriber, loc_key, prefs_json)],
+    `forecasts_by_cell` is {loc_key: forecast list} and `utc_offsets` is
+    {loc_key: seconds east of UTC}. Returns {subscriber: [alert]}.
+    """
+    utc_offsets = utc_offsets or {}
+    rows = [
+        (subscriber, loc_key, stored_thresholds(prefs_json))
+        for subscriber, loc_key, prefs_json in subscribers
+        if loc_key in forecasts_by_cell
+    ]
+    rows = [row for row in rows if row[2] is not None]
+    if not rows:
+        return {}
+
+    cells = sorted({loc_key for _, loc_key, _ in rows})
+    matrices = [forecast_matrix(forecasts_by_cell[loc_key]) for loc_key in cells]
+    values = np.stack([m[0] for m in matrices]) # (cells, steps, fields)
+    times = np.stack([m[1] for m in matrices]) # (cells, steps)
+
+    cell_index = {loc_key: i for i, loc_key in enumerate(cells)}
+    cell_of = np.array([cell_index[loc_key] for _, loc_key, _ in rows])
+    limits = np.array([row[2] for row in rows])
+
+    hits = evaluate_thresholds(limits, values[cell_of])
+    first_step = hits.argmax(axis=1)
+
+    alerts = {}
+    for n, f in zip(*np.nonzero(hits.any(axis=1))):
+        subscriber, loc_key, _ = rows[n]
+        timestamp = int(times[cell_of[n], first_step[n, f]])
+        alerts.setdefault(subscriber, []).append(
+            threshold_alert(THRESHOLD_FIELDS[f], limits[n, f], timestamp, utc_offsets.get(loc_key, 0))
+        )
+    return alerts
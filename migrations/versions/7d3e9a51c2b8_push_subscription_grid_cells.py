@@ -0,0 +1,45 @@
+"""Push subscription grid cells
+
+Revision ID: 7d3e9a51c2b8
+Revises: 018087050552
+Create Date: 2026-10-19 10:12:44.518302
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3e9a51c2b8'
+down_revision = '018087050552'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The raw SQLite schema (init_db) may already have added these
+    inspector = sa.inspect(op.get_bind())
+    columns = {column['name'] for column in inspector.get_columns('push_subscriptions')}
+    indexes = {index['name'] for index in inspector.get_indexes('push_subscriptions')}
+
+    with op.batch_alter_table('push_subscriptions', schema=None) as batch_op:
+        if 'cell_lat' not in columns:
+            batch_op.add_column(sa.Column('cell_lat', sa.Integer(), nullable=True))
+        if 'cell_lon' not in columns:
+            batch_op.add_column(sa.Column('cell_lon', sa.Integer(), nullable=True))
+        if 'idx_push_subscriptions_cell' not in indexes:
+            batch_op.create_index('idx_push_subscriptions_cell', ['cell_lat', 'cell_lon'], unique=False)
+
+    # 0.1 degree cells, rounded like app.utils.geo.grid_cell
+    op.execute(
+        "UPDATE push_subscriptions "
+        "SET cell_lat = CAST(round(lat * 10) AS INTEGER), cell_lon = CAST(round(lon * 10) AS INTEGER) "
+        "WHERE lat IS NOT NULL AND lon IS NOT NULL"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('push_subscriptions', schema=None) as batch_op:
+        batch_op.drop_index('idx_push_subscriptions_cell')
+        batch_op.drop_column('cell_lon')
+        batch_op.drop_column('cell_lat')
@@ -0,0 +1,184 @@
+"""
+Micro-benchmark for clean_urdu_text / clean_dict_values.
+
+Compares the old sequential str.replace loop against the compiled single-pass
+matcher on reverse-geocode payloads shaped like real Nominatim responses. The
+translation memory lives in a throwaway database seeded like app start-up, so
+the run never reads or writes the app's real one.
+
+Usage: python scripts/bench_clean_urdu_text.py [iterations]
+"""
+import os
+import re
+import sys
+import timeit
+import tempfile
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Never hit Gemini from a benchmark, and don't start the app's background threads
+os.environ.pop("GEMINI_API_KEY", None)
+os.environ["WERKZEUG_RUN_MAIN"] = "true"
+
+from app import database
+from app.utils.geo import URDU_TO_ENGLISH, clean_dict_values, preload_translation_memory
+
+# Representative /reverse?format=json&accept-language=en responses. Nominatim
+# falls back to the local (Urdu) name whenever no name:en tag exists.
+NOMINATIM_PAYLOADS = [
+    {
+        "place_id": 213574829,
+        "licence": "Data © OpenStreetMap contributors, ODbL 1.0. http://osm.org/copyright",
+        "osm_type": "way",
+        "osm_id": 227846503,
+        "lat": "33.6844202",
+        "lon": "73.0478848",
+        "class": "highway",
+        "type": "residential",
+        "place_rank": 26,
+        "importance": 0.0533,
+        "addresstype": "road",
+        "name": "Street 12",
+        "display_name": "Street 12, G-9/2, G-9, Islamabad, Islamabad Capital Territory, 44000, Pakistan",
+        "address": {
+            "road": "Street 12",
+            "neighbourhood": "G-9/2",
+            "suburb": "G-9",
+            "city": "Islamabad",
+            "state": "Islamabad Capital Territory",
+            "ISO3166-2-lvl4": "PK-IS",
+            "postcode": "44000",
+            "country": "Pakistan",
+            "country_code": "pk",
+        },
+        "boundingbox": ["33.6839588", "33.6848814", "73.0466020", "73.0491677"],
+    },
+    {
+        "place_id": 214012388,
+        "licence": "Data © OpenStreetMap contributors, ODbL 1.0. http://osm.org/copyright",
+        "osm_type": "way",
+        "osm_id": 311209873,
+        "lat": "33.5973",
+        "lon": "73.0479",
+        "class": "highway",
+        "type": "tertiary",
+        "place_rank": 26,
+        "importance": 0.0533,
+        "addresstype": "road",
+        "name": "مری روڈ",
+        "display_name": "مری روڈ, سیٹلائٹ ٹاؤن, راولپنڈی, پنجاب, 46000, پاکستان",
+        "address": {
+            "road": "مری روڈ",
+            "suburb": "سیٹلائٹ ٹاؤن",
+            "city": "راولپنڈی",
+            "state": "پنجاب",
+            "postcode": "46000",
+            "country": "پاکستان",
+            "country_code": "pk",
+        },
+        "boundingbox": ["33.5931", "33.6012", "73.0440", "73.0512"],
+    },
+    {
+        "place_id": 215598301,
+        "licence": "Data © OpenStreetMap contributors, ODbL 1.0. http://osm.org/copyright",
+        "osm_type": "node",
+        "osm_id": 4489562211,
+        "lat": "31.5497",
+        "lon": "74.3436",
+        "class": "place",
+        "type": "neighbourhood",
+        "place_rank": 20,
+        "importance": 0.1201,
+        "addresstype": "neighbourhood",
+        "name": "Anarkali",
+        "display_name": "Anarkali, لاہور, پنجاب, 54000, پاکستان",
+        "address": {
+            "neighbourhood": "Anarkali",
+            "city": "لاہور",
+            "state": "پنجاب",
+            "postcode": "54000",
+            "country": "پاکستان",
+            "country_code": "pk",
+        },
+        "boundingbox": ["31.5297", "31.5697", "74.3236", "74.3636"],
+    },
+    {
+        "place_id": 198877120,
+        "licence": "Data © OpenStreetMap contributors, ODbL 1.0. http://osm.org/copyright",
+        "osm_type": "way",
+        "osm_id": 154211092,
+        "lat": "51.5007",
+        "lon": "-0.1246",
+        "class": "highway",
+        "type": "primary",
+        "place_rank": 26,
+        "importance": 0.0533,
+        "addresstype": "road",
+        "name": "Bridge Street",
+        "display_name": "Bridge Street, Westminster, London, Greater London, England, SW1A 2JR, United Kingdom",
+        "address": {
+            "road": "Bridge Street",
+            "quarter": "Westminster",
+            "city": "London",
+            "state_district": "Greater London",
+            "state": "England",
+            "postcode": "SW1A 2JR",
+            "country": "United Kingdom",
+            "country_code": "gb",
+        },
+        "boundingbox": ["51.5005", "51.5010", "-0.1264", "-0.1230"],
+    },
+]
+
+
+def legacy_clean_urdu_text(text):
+    """The pre-compiled implementation, kept here only as the baseline."""
+    if not text:
+        return text
+    for urdu, eng in URDU_TO_ENGLISH.items():
+        text = text.replace(urdu, eng)
+    if re.search(r'[\u0600-\u06FF]', text):
+        text = re.sub(r'[\u0600-\u06FF]', '', text).strip()
+        text = re.sub(r'\s+', ' ', text)
+        text = re.sub(r',\s*,', ',', text).strip(' ,')
+    return text
+
+
+def legacy_clean_dict_values(data):
+    if isinstance(data, dict):
+        return {k: legacy_clean_dict_values(v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [legacy_clean_dict_values(x) for x in data]
+    elif isinstance(data, str):
+        return legacy_clean_urdu_text(data)
+    else:
+        return data
+
+
+def run_all(fn):
+    for payload in NOMINATIM_PAYLOADS:
+        fn(payload)
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    database.DATABASE = os.path.join(tempfile.mkdtemp(prefix="bench-urdu-"), "bench.db")
+    database.init_db()
+    preload_translation_memory()
+
+    for payload in NOMINATIM_PAYLOADS:
+        assert clean_dict_values(payload) == legacy_clean_dict_values(payload), payload["display_name"]
+
+    legacy = min(timeit.repeat(lambda: run_all(legacy_clean_dict_values), number=iterations, repeat=5))
+    compiled = min(timeit.repeat(lambda: run_all(clean_dict_values), number=iterations, repeat=5))
+
+    per_payload = 1e6 / (iterations * len(NOMINATIM_PAYLOADS))
+    print(f"payloads: {len(NOMINATIM_PAYLOADS)}, iterations: {iterations}")
+    print(f"legacy replace loop : {legacy * per_payload:8.1f} us/payload")
+    print(f"compiled matcher    : {compiled * per_payload:8.1f} us/payload")
+    print(f"speedup             : {legacy / compiled:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
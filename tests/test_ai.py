@@ -0,0 +1,190 @@
+import os
+import sys
+
+# Add the project root to sys.path to allow imports from app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Ensure we aren't starting background threads during test initialization
+os.environ["WERKZEUG_RUN_MAIN"] = "true"
+
+import pytest
+from app import database
+from app.utils import ai_cache, ai_gateway, chat
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+class FakeModels:
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def generate_content(self, **kwargs):
+        self.calls.append(kwargs)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return FakeResponse(reply)
+
+    def generate_content_stream(self, **kwargs):
+        self.calls.append(kwargs)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return (FakeResponse(chunk) for chunk in reply)
+
+class FakeClient:
+    def __init__(self, *replies):
+        self.models = FakeModels(replies)
+
+@pytest.fixture
+def temp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "ai.db"))
+    database.init_db()
+
+def test_ai_cache_key_is_stable():
+    a = ("gemini-2.0-flash-exp", "prompt", {"b": 1, "a": 2})
+    assert ai_cache.ai_cache_key(*a) == ai_cache.ai_cache_key("gemini-2.0-flash-exp", "prompt", {"a": 2, "b": 1})
+    assert ai_cache.ai_cache_key(*a) != ai_cache.ai_cache_key("gemini-1.5-flash", "prompt", {"a": 2, "b": 1})
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    def install(*replies):
+        client = FakeClient(*replies)
+        monkeypatch.setattr(ai_gateway, "get_ai_client", lambda: client)
+        return client
+    return install
+
+def test_generate_json_hits_cache(temp_db, fake_client):
+    client = fake_client('{"items": [1]}')
+    first = ai_gateway.generate_json("p", "packing_list")
+    second = ai_gateway.generate_json("p", "packing_list")
+    assert first == second == {"items": [1]}
+    assert len(client.models.calls) == 1
+    assert client.models.calls[0]["config"]["response_mime_type"] == "application/json"
+
+def test_generate_json_falls_back_and_skips_unparsable(temp_db, fake_client):
+    client = fake_client(RuntimeError("quota"), "not json", '```json\n{"ok": true}\n```')
+    models = ["primary", "secondary", "tertiary"]
+    assert ai_gateway.generate_json("p", "weather_health", models=models) == {"ok": True}
+    assert [c["model"] for c in client.models.calls] == models
+
+def test_generate_text_raises_when_all_models_fail(temp_db, fake_client):
+    fake_client(RuntimeError("down"), RuntimeError("down"))
+    with pytest.raises(ai_gateway.AIGatewayError):
+        ai_gateway.generate_text("p", "chat", models=["a", "b"])
+
+def test_parse_json_response_strips_fences():
+    assert ai_gateway.parse_json_response('```json\n[1, 2]\n```') == [1, 2]
+    assert ai_gateway.parse_json_response('```\n{"a": 1}\n```') == {"a": 1}
+    assert ai_gateway.parse_json_response(' {"a": 1} ') == {"a": 1}
+
+def test_expired_entries_are_ignored(temp_db):
+    key = ai_cache.ai_cache_key("m", "p")
+    ai_cache.set_cached_ai_response(key, "chat", "hello", ttl=-1)
+    assert ai_cache.get_cached_ai_response(key) is None
+    ai_cache.set_cached_ai_response(key, "chat", "hello")
+    assert ai_cache.get_cached_ai_response(key) == "hello"
+
+def test_stream_text_falls_back_before_first_chunk_and_caches(temp_db, fake_client):
+    client = fake_client(RuntimeError("quota"), ["Sunny ", "today."])
+    chunks = list(ai_gateway.stream_text("p", "chat", models=["a", "b"]))
+    assert chunks == ["Sunny ", "today."]
+    assert [c["model"] for c in client.models.calls] == ["a", "b"]
+
+    # The full answer is cached and replayed as one chunk
+    assert list(ai_gateway.stream_text("p", "chat", models=["a", "b"])) == ["Sunny today."]
+    assert len(client.models.calls) == 2
+
+def test_stream_text_frees_its_slot_before_the_client_reads(temp_db, fake_client, monkeypatch):
+    import threading
+    monkeypatch.setattr(ai_gateway, "_AI_SEMAPHORE", threading.BoundedSemaphore(1))
+    fake_client(["Sunny ", "today."], ["Rain."])
+
+    slow_reader = ai_gateway.stream_text("p", "chat", models=["a"], cache=False)
+    assert next(slow_reader) == "Sunny "
+    # The model finished on its own thread, so a stalled client holds no slot
+    assert list(ai_gateway.stream_text("q", "chat", models=["a"], cache=False, timeout=2)) == ["Rain."]
+    assert list(slow_reader) == ["today."]
+
+def test_chat_cache_key_shares_similar_questions():
+    key = chat.chat_cache_key("What's the weather?", 24.861, 67.001, "clear:30")
+    assert key == chat.chat_cache_key("whats the  WEATHER", 24.87, 67.04, "clear:30")
+    assert key != chat.chat_cache_key("What's the weather?", 24.861, 67.001, "rain:25")
+    # Personal or long messages always bypass the shared cache
+    assert chat.chat_cache_key("Will it rain at my house?", 24.86, 67.0, "clear:30") is None
+    assert chat.chat_cache_key("rain " * 40, 24.86, 67.0, "clear:30") is None
+
+def test_chat_weather_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(chat, "CHAT_WEATHER_CACHE", {})
+    monkeypatch.setattr(chat, "CHAT_WEATHER_CACHE_MAX", 3)
+    assert chat.chat_location_cell("nan", 0) is None
+    assert chat.chat_location_cell(0, "inf") is None
+    assert chat.chat_location_cell(91, 0) is None
+
+    chat._store_weather_context((1.0, 1.0), "old", "clear:20", 0)
+    for i in range(2, 5):
+        chat._store_weather_context((float(i), 1.0), "fresh", "clear:20", 10_000 + i)
+    # The expired cell goes first, then the oldest once over the cap
+    assert sorted(chat.CHAT_WEATHER_CACHE) == [(2.0, 1.0), (3.0, 1.0), (4.0, 1.0)]
+    chat._store_weather_context((5.0, 1.0), "fresh", "clear:20", 10_005)
+    assert sorted(chat.CHAT_WEATHER_CACHE) == [(3.0, 1.0), (4.0, 1.0), (5.0, 1.0)]
+
+def test_packing_list_shared_per_bucket(temp_db, fake_client, monkeypatch):
+    from app.utils import packing
+    assert packing.packing_bucket(5, "Light rain, 31°C") == ("hot", "week", "rain")
+    assert packing.packing_bucket("2", "Snow, 28°F") == ("freezing", "weekend", "snow")
+
+    monkeypatch.setattr(packing, "ai_available", lambda: True)
+    client = fake_client('{"items": [{"category": "Clothing", "item": "Umbrella"}]}')
+    first = packing.get_packing_list(5, "Light rain, 31°C")
+    second = packing.get_packing_list(6, "Moderate rain, 33°C")
+    assert first == second
+    assert len(client.models.calls) == 1
+
+def test_alert_advice_generated_once_per_alert(temp_db, fake_client, monkeypatch):
+    from app.utils import notifications
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setattr(notifications, "ALERT_ADVICE_CACHE", {})
+    client = fake_client("Stay indoors.", "Avoid rivers.")
+    storm = {"event": "Storm Warning", "sender_name": "PMD", "start": 1000, "end": 9999999999, "description": "Winds"}
+
+    assert notifications.get_ai_advice(storm) == "Stay indoors."
+    assert notifications.get_ai_advice(dict(storm, description="Winds (updated cell)")) == "Stay indoors."
+    # Another process shares the persisted advice
+    monkeypatch.setattr(notifications, "ALERT_ADVICE_CACHE", {})
+    assert notifications.get_ai_advice(storm) == "Stay indoors."
+    assert notifications.get_ai_advice(dict(storm, event="Flood Warning")) == "Avoid rivers."
+    assert len(client.models.calls) == 2
+
+def test_alert_advice_runs_concurrently_per_alert_and_is_capped(temp_db, monkeypatch):
+    import threading
+    from app.utils import notifications
+    monkeypatch.setenv("GEMINI_API_KEY", "test")
+    monkeypatch.setattr(notifications, "ALERT_ADVICE_CACHE", {})
+    monkeypatch.setattr(notifications, "ALERT_ADVICE_CACHE_MAX", 2)
+    # Both calls must be in flight at once to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def slow_generate(prompt, use_case, cache=True):
+        barrier.wait()
+        return "Advice for " + prompt.split("Event: ")[1].split("\n")[0]
+
+    monkeypatch.setattr(notifications, "generate_text", slow_generate)
+    alerts = [{"event": f"Storm {i}", "sender_name": "PMD", "start": i, "end": 9999999999} for i in range(2)]
+    results = {}
+    threads = [
+        threading.Thread(target=lambda a=a: results.__setitem__(a["event"], notifications.get_ai_advice(a)))
+        for a in alerts
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"Storm 0": "Advice for Storm 0", "Storm 1": "Advice for Storm 1"}
+
+    monkeypatch.setattr(notifications, "generate_text", lambda prompt, use_case, cache=True: "Later advice")
+    notifications.get_ai_advice({"event": "Storm 2", "sender_name": "PMD", "start": 2, "end": 9999999999})
+    assert len(notifications.ALERT_ADVICE_CACHE) == 2
+    assert not notifications._ADVICE_KEY_LOCKS
@@ -30,6 +30,9 @@ def test_endpoints():
             try:
                 # Follow redirects to catch final status
                 response = client.get(route, follow_redirects=True)
+                # Streamed pages render lazily; consume and close them inside the request
+                response.get_data()
+                response.close()
                 if response.status_code == 200:
                     print(f"[PASS] GET {route}")
                 else:
@@ -0,0 +1,105 @@
+import os
+import sys
+
+# Add the project root to sys.path to allow imports from app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Ensure we aren't starting background threads or calling Gemini
+os.environ["WERKZEUG_RUN_MAIN"] = "true"
+os.environ.pop("GEMINI_API_KEY", None)
+
+from app.utils.geo import clean_urdu_text, clean_dict_values
+
+def test_clean_urdu_text_replacements():
+    assert clean_urdu_text("اسلام آباد") == "Islamabad"
+    assert clean_urdu_text("جی-9, اسلام آباد, پاکستان") == "G-9, Islamabad, Pakistan"
+    # Longer keys win over entries they contain
+    assert clean_urdu_text("فیصل آباد") == "Faisalabad"
+    assert clean_urdu_text("آئی-10 مارکیٹ") == "I-10 Market"
+
+def test_clean_urdu_text_ascii_passthrough():
+    assert clean_urdu_text("Street 12, G-9/2, Islamabad") == "Street 12, G-9/2, Islamabad"
+    assert clean_urdu_text("") == ""
+    assert clean_urdu_text(None) is None
+
+def test_clean_urdu_text_strips_unknown_script():
+    assert clean_urdu_text("مری روڈ, راولپنڈی") == "Rawalpindi"
+
+def test_clean_dict_values_nested():
+    payload = {
+        "place_id": 1,
+        "address": {"city": "لاہور", "country": "پاکستان", "postcode": "54000"},
+        "boundingbox": ["31.5", "31.6"],
+    }
+    assert clean_dict_values(payload) == {
+        "place_id": 1,
+        "address": {"city": "Lahore", "country": "Pakistan", "postcode": "54000"},
+        "boundingbox": ["31.5", "31.6"],
+    }
+
+def test_clean_dict_values_translates_in_one_batch(monkeypatch):
+    from app.utils import geo
+    calls = []
+
+    def fake_batch(texts):
+        calls.append(texts)
+        return {"مری روڈ": "Murree Road"}
+
+    monkeypatch.setattr(geo, "translate_urdu_batch", fake_batch)
+    payload = {
+        "name": "مری روڈ",
+        "display_name": "مری روڈ, سیٹلائٹ ٹاؤن, راولپنڈی",
+        "address": {"road": "مری روڈ", "suburb": "سیٹلائٹ ٹاؤن", "city": "راولپنڈی"},
+    }
+    cleaned = geo.clean_dict_values(payload)
+
+    assert len(calls) == 1
+    assert sorted(calls[0]) == sorted(["مری روڈ", "مری روڈ, سیٹلائٹ ٹاؤن, Rawalpindi", "سیٹلائٹ ٹاؤن"])
+    assert cleaned["name"] == "Murree Road"
+    assert cleaned["address"]["road"] == "Murree Road"
+    assert cleaned["address"]["city"] == "Rawalpindi"
+    # Untranslated strings still fall back to stripping
+    assert cleaned["display_name"] == "Rawalpindi"
+    assert cleaned["address"]["suburb"] == ""
+
+def test_translation_memory_round_trip(tmp_path, monkeypatch):
+    from app.utils import geo
+    from app import database
+
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "tm.db"))
+    database.init_db()
+    geo.preload_translation_memory()
+
+    # Dictionary entries are preloaded, lookups are normalized
+    assert geo.lookup_translations(["  lahore "], "en-ur") == {"  lahore ": "لاہور"}
+    assert geo.translate_to_urdu("Karachi") == "کراچی"
+
+    geo.store_translations({"مری روڈ": "Murree Road"}, "ur-en")
+    assert geo.translate_urdu_batch(["مری روڈ"]) == {"مری روڈ": "Murree Road"}
+    assert geo.clean_urdu_text("مری روڈ") == "Murree Road"
+
+def test_translation_memory_is_cached_in_process(tmp_path, monkeypatch):
+    from app.utils import geo
+    from app import database
+
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "tm.db"))
+    database.init_db()
+    geo.preload_translation_memory()
+    connections = []
+    real_get_db = geo.get_db
+    monkeypatch.setattr(geo, "get_db", lambda: connections.append(1) or real_get_db())
+
+    # Without a model, and with nothing learned, the table can't help the leftovers
+    assert geo.translate_urdu_batch(["مری روڈ"]) == {}
+    assert connections == []
+
+    # Misses and hits are both remembered, so repeat lookups stay in process
+    assert geo.lookup_translations(["سیٹلائٹ ٹاؤن"], "ur-en") == {}
+    assert geo.lookup_translations(["سیٹلائٹ ٹاؤن", " لاہور"], "ur-en") == {" لاہور": "Lahore"}
+    assert geo.lookup_translations(["لاہور", "سیٹلائٹ ٹاؤن"], "ur-en") == {"لاہور": "Lahore"}
+    assert len(connections) == 2
+
+    geo.store_translations({"مری روڈ": "Murree Road"}, "ur-en")
+    connections.clear()
+    assert geo.translate_urdu_batch(["مری روڈ"]) == {"مری روڈ": "Murree Road"}
+    assert connections == []
@@ -0,0 +1,60 @@
+import os
+import sys
+
+# Add the project root to sys.path to allow imports from app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Ensure we aren't starting background threads during test initialization
+os.environ["WERKZEUG_RUN_MAIN"] = "true"
+
+from app import database
+from app.utils import health
+
+def test_health_rules():
+    calm = health.calculate_health_risks(22, 50, pressure_change=0, wind_speed=2, uv_index=1, aqi=30)
+    assert {calm[c]["risk"] for c in health.HEALTH_CATEGORIES} == {"Low"}
+
+    stormy = health.calculate_health_risks(8, 85, pressure_change=-7, wind_speed=12, uv_index=0, aqi=160)
+    assert stormy["migraine"]["risk"] == "High"
+    assert stormy["arthritis"]["risk"] == "High"
+    assert stormy["respiratory"]["risk"] == "High"
+    assert stormy["uv_skin"]["risk"] == "Low"
+
+def test_uv_estimate_is_zero_at_night_and_high_at_tropical_noon():
+    sunrise, sunset = 1781400000, 1781400000 + 12 * 3600
+    assert health.estimate_uv_index(10, sunrise - 60, sunrise, sunset) == 0
+    assert health.estimate_uv_index(10, sunrise + 6 * 3600, sunrise, sunset) >= 8
+
+def test_enrichment_runs_in_background_and_keeps_levels(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "health.db"))
+    database.init_db()
+    monkeypatch.setattr(health, "ai_available", lambda: True)
+    monkeypatch.setattr(health, "generate_json", lambda prompt, use_case, cache=True: {
+        "migraine": "Pressure is steady.", "general_advice": "Enjoy the day."
+    })
+    jobs = []
+    monkeypatch.setattr(health._ENRICH_EXECUTOR, "submit", lambda fn, *args: jobs.append((fn, args)))
+    risks = health.calculate_health_risks(22, 50)
+
+    # First call answers from the rules immediately
+    assert health.enrich_health_risks(risks) == risks
+    assert health.enrich_health_risks(risks) == risks
+    assert len(jobs) == 1
+    fn, args = jobs.pop()
+    fn(*args)
+
+    enriched = health.enrich_health_risks(risks)
+    assert enriched["migraine"] == {"risk": "Low", "reason": "Pressure is steady."}
+    assert enriched["arthritis"] == risks["arthritis"]
+    assert enriched["general_advice"] == "Enjoy the day."
+
+    # Same causes with different live numbers share one enrichment
+    uv7 = health.calculate_health_risks(22, 50, uv_index=7)
+    uv9 = health.calculate_health_risks(22, 50, uv_index=9)
+    assert uv7["uv_skin"]["reason"] != uv9["uv_skin"]["reason"]
+    assert health._enrichment_key(uv7) == health._enrichment_key(uv9)
+    # ...but the same level from a different rule does not
+    pressure = health.calculate_health_risks(22, 50, pressure_change=4)
+    muggy = health.calculate_health_risks(33, 65)
+    assert pressure["migraine"]["risk"] == muggy["migraine"]["risk"] == "Medium"
+    assert health._enrichment_key(pressure) != health._enrichment_key(muggy)
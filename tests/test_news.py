@@ -0,0 +1,141 @@
+import os
+import sys
+
+# Add the project root to sys.path to allow imports from app
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+# Ensure we aren't starting background threads during test initialization
+os.environ["WERKZEUG_RUN_MAIN"] = "true"
+
+import json
+import pytest
+from app import database
+from app.utils import news
+
+def make_article(i, title=None):
+    return {
+        "title": title or f"Storm headline {i}",
+        "description": f"Heavy rain expected in region {i}.",
+        "url": f"https://example.com/{i}",
+        "urlToImage": None,
+        "publishedAt": "2026-10-19T00:00:00Z",
+        "source": {"name": "Example"},
+    }
+
+@pytest.fixture
+def fake_model(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "news.db"))
+    database.init_db()
+    monkeypatch.setattr(news, "AI_NEWS_CACHE", {})
+    sent = []
+
+    def fake_generate_json(prompt, use_case):
+        batch = json.loads(prompt.split("Articles:")[1])
+        sent.append([a["url"] for a in batch])
+        # Discard every article whose title mentions politics
+        return [
+            {"id": a["id"], "category": "Climate Events", "summary": "s", "urgency": "High", "location": "X"}
+            for a in batch if "politics" not in a["title"]
+        ]
+
+    monkeypatch.setattr(news, "generate_json", fake_generate_json)
+    return sent
+
+def test_categorization_is_incremental_per_article(fake_model):
+    feed = [make_article(i) for i in range(3)]
+    first = news.categorize_news_with_ai(feed, "key")
+    assert [a["url"] for a in first] == [a["url"] for a in feed]
+
+    # One new article at the front: only it goes to the model, order is kept
+    feed = [make_article(9)] + feed
+    second = news.categorize_news_with_ai(feed, "key")
+    assert fake_model[-1] == ["https://example.com/9"]
+    assert [a["url"] for a in second] == [a["url"] for a in feed]
+
+def test_discarded_articles_are_remembered(fake_model):
+    feed = [make_article(1), make_article(2, title="Election politics update")]
+    assert [a["url"] for a in news.categorize_news_with_ai(feed, "key")] == ["https://example.com/1"]
+    assert [a["url"] for a in news.categorize_news_with_ai(feed, "key")] == ["https://example.com/1"]
+    assert len(fake_model) == 1
+
+def test_changed_title_is_reclassified(fake_model):
+    news.categorize_news_with_ai([make_article(1)], "key")
+    news.categorize_news_with_ai([make_article(1, title="Storm headline 1 (updated)")], "key")
+    assert len(fake_model) == 2
+
+def test_categorization_is_shared_through_persistent_cache(fake_model, monkeypatch):
+    feed = [make_article(1), make_article(2)]
+    news.categorize_news_with_ai(feed, "key")
+
+    # A fresh process has an empty in-memory cache but the same database
+    monkeypatch.setattr(news, "AI_NEWS_CACHE", {})
+    results = news.categorize_news_with_ai(feed, "key")
+    assert [a["url"] for a in results] == [a["url"] for a in feed]
+    assert len(fake_model) == 1
+
+def test_in_process_categorization_cache_is_pruned(monkeypatch):
+    monkeypatch.setattr(news, "AI_NEWS_CACHE", {})
+    monkeypatch.setattr(news, "AI_NEWS_CACHE_MAX", 2)
+    news._remember_articles({"old": {}}, 0)
+    news._remember_articles({"a": {}}, news.AI_CACHE_DURATION + 1)
+    # The expired entry is dropped on insert, then the oldest beyond the cap
+    assert list(news.AI_NEWS_CACHE) == ["a"]
+    news._remember_articles({"b": {}, "c": {}}, news.AI_CACHE_DURATION + 2)
+    assert sorted(news.AI_NEWS_CACHE) == ["b", "c"]
+
+def test_news_feed_snapshots(monkeypatch):
+    monkeypatch.setattr(news, "NEWS_SNAPSHOTS", {})
+    builds = []
+
+    def fake_build(feed, country=None):
+        builds.append((feed, country))
+        return [make_article(len(builds))]
+
+    monkeypatch.setattr(news, "build_news_feed", fake_build)
+
+    # Cold start builds inline, later reads are served from the snapshot
+    first = news.get_news_feed("weather", country="Germany")
+    assert news.get_news_feed("weather", country="Germany") == first
+    assert builds == [("weather", "Germany")]
+
+    # Ingestion refreshes the defaults and every feed pages have asked for
+    version = news.get_news_snapshot("weather:Germany")["version"]
+    news.refresh_news_feeds()
+    assert ("weather", "Germany") in builds[1:]
+    assert ("latest", None) in builds[1:]
+    assert news.get_news_snapshot("weather:Germany")["version"] != version
+
+    # Feeds nobody has read for a while are dropped instead of refreshed forever
+    monkeypatch.setitem(news.NEWS_FEED_READS, "weather:Germany", 0)
+    builds.clear()
+    news.refresh_news_feeds()
+    assert ("weather", "Germany") not in builds
+    assert news.get_news_snapshot("weather:Germany") is None
+
+def test_news_fragments_cached_per_snapshot_version(monkeypatch):
+    from flask import Flask
+    from jinja2 import DictLoader
+
+    monkeypatch.setattr(news, "NEWS_SNAPSHOTS", {})
+    monkeypatch.setattr(news, "NEWS_FRAGMENT_CACHE", {})
+    renders = []
+    app = Flask(__name__)
+    app.jinja_env.loader = DictLoader({"cards.html": "{% for a in articles %}{{ a.title }};{% endfor %}"})
+
+    original_render = app.jinja_env.get_template
+    def counting_get_template(name):
+        renders.append(name)
+        return original_render(name)
+    monkeypatch.setattr(app.jinja_env, "get_template", counting_get_template)
+
+    news.publish_news_snapshot("world", [make_article(1)])
+    with app.app_context():
+        first = news.render_news_fragments("world", {"cards": ("cards.html", None)})
+        second = news.render_news_fragments("world", {"cards": ("cards.html", None)})
+        assert first == second == {"cards": "Storm headline 1;"}
+        assert len(renders) == 1
+
+        # A new snapshot drops the cached HTML
+        news.publish_news_snapshot("world", [make_article(2)])
+        assert news.render_news_fragments("world", {"cards": ("cards.html", None)})["cards"] == "Storm headline 2;"
+        assert len(renders) == 2
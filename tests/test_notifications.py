@@ -5,6 +5,9 @@ import sys
 # Add the project root to sys.path to allow imports from app
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+# Ensure we aren't starting background threads during test initialization
+os.environ["WERKZEUG_RUN_MAIN"] = "true"
+
 from flask import Flask
 from app.utils.notifications import send_alert_email, send_otp_email
 
@@ -41,5 +44,427 @@ def test_flows():
     except Exception as e:
         print(f"FAILED: {e}")
 
+def test_sent_alert_ledger(tmp_path, monkeypatch):
+    from app import database
+    from app.utils import alerts
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "ledger.db"))
+    database.init_db()
+
+    storm = {"event": "Storm Warning", "sender_name": "PMD", "start": 1000, "end": 9999999999, "description": "Winds"}
+    alerts.record_sent_alerts("email", [("a@example.com", storm)])
+    ledger = alerts.load_sent_alerts("email")
+
+    assert not alerts.is_alert_unsent(ledger, "a@example.com", storm)
+    assert alerts.is_alert_unsent(ledger, "b@example.com", storm)
+    # An updated alert is sent again, and only the push channel is unaffected
+    assert alerts.is_alert_unsent(ledger, "a@example.com", dict(storm, description="Winds and hail"))
+    assert alerts.is_alert_unsent(alerts.load_sent_alerts("push"), "a@example.com", storm)
+
+def test_alert_preference_masks_match_per_cell():
+    import json
+    from app.utils import alerts
+    from app.utils.notifications import is_alert_relevant
+
+    rows = [
+        ("rain@example.com", 31.52, 74.36, json.dumps({"types": ["rain"]})),
+        ("air@example.com", 31.54, 74.37, json.dumps(json.dumps({"types": ["air"]}))),
+        ("default@example.com", 31.51, 74.36, None),
+        ("all@example.com", 31.53, 74.36, json.dumps({"types": []})),
+    ]
+    names, masks = alerts.index_subscribers_by_cell(rows)["31.5,74.4"]
+
+    flood = {"event": "Urban Flood Warning"}
+    assert alerts.subscribers_for_alert(names, masks, flood) == ["rain@example.com", "default@example.com", "all@example.com"]
+    assert alerts.subscribers_for_alert(names, masks, {"event": "Smoke Advisory"}) == ["air@example.com", "default@example.com", "all@example.com"]
+    assert alerts.subscribers_for_alert(names, masks, {"event": "Special Statement"}) == ["all@example.com"]
+    assert is_alert_relevant(flood, {"types": ["rain"]}) and not is_alert_relevant(flood, {"types": ["air"]})
+
+def test_threshold_alerts_evaluated_in_one_pass():
+    import json
+    from app.utils import thresholds
+
+    def step(dt, temp, rain=0, wind=2):
+        return {"dt": dt, "main": {"temp": temp}, "rain": {"3h": rain}, "wind": {"speed": wind}}
+
+    day = 1_750_000_000 - 1_750_000_000 % 86400
+    forecasts = {
+        "31.5,74.4": [step(day + 3600, 38), step(day + 14400, 43, rain=10)],
+        "33.7,73.1": [step(day + 3600, 12, wind=21)],
+    }
+    subscribers = [
+        ("hot@example.com", "31.5,74.4", json.dumps({"types": ["temp"], "temp_max": 42})),
+        ("rain@example.com", "31.5,74.4", json.dumps({"rain_mm": 10, "wind_speed": 30})),
+        ("windy@example.com", "33.7,73.1", json.dumps({"wind_speed": 20, "temp_min": 0})),
+        ("plain@example.com", "33.7,73.1", json.dumps({"types": ["rain"]})),
+    ]
+    alerts = thresholds.threshold_alerts(subscribers, forecasts)
+
+    assert sorted(alerts) == ["hot@example.com", "rain@example.com", "windy@example.com"]
+    heat, = alerts["hot@example.com"]
+    assert heat["event"] == "Extreme Heat Alert" and heat["start"] == day and "42°C" in heat["description"]
+    assert [a["event"] for a in alerts["rain@example.com"]] == ["Heavy Rain Alert"]
+    assert [a["event"] for a in alerts["windy@example.com"]] == ["High Wind Warning"]
+
+    # Days follow the cell's local time (PKT is UTC+5), and the limit itself triggers
+    local = thresholds.threshold_alerts(subscribers, forecasts, {"31.5,74.4": 5 * 3600})
+    heat, = local["hot@example.com"]
+    assert heat["start"] == day - 5 * 3600 and heat["end"] == day - 5 * 3600 + 86400
+    assert heat["description"] == "Temperatures are forecast to reach your 42°C limit on Sunday."
+    assert local["rain@example.com"][0]["description"].startswith("At least your 10 mm")
+
+def test_forecast_change_detection(tmp_path, monkeypatch):
+    from app import database
+    from app.utils import forecast_changes
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "changes.db"))
+    database.init_db()
+
+    hourly = [{"dt": 3600 * h, "temp": 30.0} for h in range(24)]
+    storm = {"event": "Storm Warning", "sender_name": "PMD", "start": 0, "end": 86400, "description": "Winds"}
+
+    members = [("email", "a@example.com", "{}"), ("push", "https://push.example/1", "")]
+
+    def detect(alerts, hours, subscribers=members, save=True):
+        summary = forecast_changes.forecast_summary(alerts, hours, forecast_changes.stable_digest(sorted(subscribers)))
+        changed, baselines = forecast_changes.detect_forecast_changes({"31.5,74.4": summary})
+        if save:
+            forecast_changes.save_forecast_baselines(baselines)
+        return changed
+
+    # Until the baseline is saved (after fan-out), the cell keeps showing as changed
+    assert detect([], hourly, save=False) == {"31.5,74.4": ["new_cell"]}
+    assert detect([], hourly) == {"31.5,74.4": ["new_cell"]}
+    assert detect([], hourly) == {}
+    # Small drifts are ignored until they add up against the stored baseline
+    assert detect([], [dict(h, temp=31.5) for h in hourly]) == {}
+    assert detect([], [dict(h, temp=33.2) for h in hourly]) == {"31.5,74.4": ["temperature_swing"]}
+    wet = [dict(h, temp=33.2, rain={"1h": 2.0}) if h["dt"] == 7200 else dict(h, temp=33.2) for h in hourly]
+    assert detect([storm], wet) == {"31.5,74.4": ["alert_added", "precipitation_window"]}
+    assert detect([], wet) == {"31.5,74.4": ["alert_removed"]}
+    # Preference edits and a same-size swap of subscribers are changes too
+    edited = [("email", "a@example.com", '{"wind": true}'), members[1]]
+    assert detect([], wet, edited) == {"31.5,74.4": ["subscribers_changed"]}
+    swapped = [edited[0], ("push", "https://push.example/2", "")]
+    assert detect([], wet, swapped) == {"31.5,74.4": ["subscribers_changed"]}
+
+def test_threshold_alerts_checked_when_forecast_summary_is_unchanged(monkeypatch):
+    import json
+    from app import tasks
+    from app.utils import forecast_changes
+
+    # A heatwave rolling into the window leaves the overlapping hours alone, so the cell is unchanged
+    mild = [{"dt": 3600 * h, "temp": 30.0} for h in range(24)]
+    rolled = [{"dt": 3600 * h, "temp": 30.0 if h < 24 else 45.0} for h in range(12, 36)]
+    assert forecast_changes.diff_forecast(
+        forecast_changes.forecast_summary([], mild), forecast_changes.forecast_summary([], rolled)
+    ) == []
+
+    # ...but thresholds are still evaluated on the new horizon hours
+    requested = []
+    def fake_forecasts(locations, api_key):
+        requested.append(locations)
+        steps = [{"dt": hour["dt"], "main": {"temp": hour["temp"]}} for hour in rolled[::3]]
+        return {"31.5,74.4": {"steps": steps, "utc_offset": 0}}, {"locations": 1, "fetched": 1, "seconds": 0}
+    monkeypatch.setattr(tasks, "fetch_location_forecasts", fake_forecasts)
+
+    subscribers = [
+        ("hot@example.com", 31.46, 74.41, json.dumps({"temp_max": 42})),
+        ("plain@example.com", 31.5, 74.4, json.dumps({"types": ["rain"]})),
+    ]
+    alerts, cells = tasks.check_threshold_alerts(subscribers, "key")
+    assert requested == [{(31.5, 74.4)}]
+    assert cells == {"hot@example.com": "31.5,74.4"}
+    assert [a["event"] for a in alerts["hot@example.com"]] == ["Extreme Heat Alert"]
+    assert tasks.check_threshold_alerts(subscribers[1:], "key") == ({}, {})
+
+def test_alert_digest_batches_per_subscriber(tmp_path, monkeypatch):
+    import json
+    import time
+    from app import database
+    from app.utils import digest
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "digest.db"))
+    database.init_db()
+
+    rain = {"event": "Heavy Rain Advisory", "sender_name": "PMD", "start": 1, "end": time.time() + 5 * 3600}
+    flood = {"event": "Flood Statement", "sender_name": "PMD", "start": 2, "end": time.time() + 5 * 3600}
+    ended = {"event": "Dust Advisory", "sender_name": "PMD", "start": 3, "end": time.time() - 60}
+    warning = {"event": "Flood Warning", "sender_name": "PMD", "start": 4}
+    cyclone = {"event": "Cyclone Emergency Statement", "sender_name": "PMD", "start": 5}
+    opted_in = json.dumps({"digest": True})
+
+    # Digests are opt-in and only hold explicitly low-priority alerts by default
+    assert not digest.should_digest_alert(rain)
+    assert digest.should_digest_alert(rain, opted_in)
+    assert not digest.should_digest_alert(warning, opted_in)
+    assert not digest.should_digest_alert(cyclone, opted_in)
+    assert digest.should_digest_alert(warning, json.dumps({"digest": True, "digest_critical": True}))
+    # An alert that would be over before the digest goes out is sent at once
+    assert not digest.should_digest_alert(dict(rain, end=time.time() + 600), opted_in)
+
+    digest.queue_digest_alerts("email", [("a@example.com", rain, None), ("a@example.com", flood, None), ("a@example.com", ended, None)])
+    # Re-queuing an updated alert replaces it instead of adding another
+    digest.queue_digest_alerts("email", [("a@example.com", dict(flood, description="Updated"), None)])
+    assert digest.due_digests("email") == {}
+
+    due = digest.due_digests("email", window=0)
+    assert [a["event"] for a in due["a@example.com"]["alerts"]] == ["Heavy Rain Advisory", "Flood Statement"]
+    assert due["a@example.com"]["alerts"][1]["description"] == "Updated"
+    digest.clear_digests("email", ["a@example.com"])
+    assert digest.due_digests("email", window=0) == {}
+
+    # A queued alert that is updated to end before the window elapses flushes the digest early
+    digest.queue_digest_alerts("email", [("b@example.com", rain, None)])
+    assert digest.due_digests("email") == {}
+    digest.queue_digest_alerts("email", [("b@example.com", dict(rain, end=time.time() + 600), None)])
+    assert list(digest.due_digests("email")) == ["b@example.com"]
+
+def test_email_outbox_batches_retries_and_dead_letters(tmp_path, monkeypatch):
+    from app import database
+    from app.utils import outbox
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "outbox.db"))
+    database.init_db()
+    monkeypatch.setenv("RESEND_API_KEY", "test")
+
+    class Response:
+        def __init__(self, status_code):
+            self.status_code = status_code
+            self.ok = status_code < 400
+            self.text = ""
+
+    posts = []
+    replies = [Response(503), Response(200)]
+    monkeypatch.setattr(outbox.requests, "post", lambda url, **kw: posts.append((url, kw)) or replies.pop(0))
+
+    assert outbox.enqueue_email("a@example.com", "s", "t", idempotency_key="k1")
+    assert outbox.enqueue_email("a@example.com", "s", "t", idempotency_key="k1") # duplicate is ignored
+    assert outbox.enqueue_email("b@example.com", "s", "t", idempotency_key="k2", priority=outbox.PRIORITY_TRANSACTIONAL)
+
+    # One batch call; a 503 schedules a retry with backoff
+    assert outbox.process_email_outbox() == 2
+    assert posts[0][0] == outbox.RESEND_BATCH_URL and len(posts[0][1]["json"]) == 2
+    assert posts[0][1]["json"][0]["to"] == ["b@example.com"]
+    assert outbox.process_email_outbox() == 0
+
+    with database.get_db() as conn:
+        conn.execute("UPDATE email_outbox SET next_attempt_at = 0")
+        conn.commit()
+    assert outbox.process_email_outbox() == 2
+
+    # A permanent failure is dead-lettered at once
+    replies.append(Response(422))
+    outbox.enqueue_email("bad", "s", "t", idempotency_key="k3")
+    outbox.process_email_outbox()
+    with database.get_db() as conn:
+        statuses = dict(conn.execute("SELECT idempotency_key, status FROM email_outbox").fetchall())
+    assert statuses == {"k1": "sent", "k2": "sent", "k3": "dead"}
+
+    # Sent bodies are dropped; a dead-lettered key can be queued again
+    with database.get_db() as conn:
+        assert conn.execute("SELECT text_content FROM email_outbox WHERE idempotency_key = 'k1'").fetchone() == (None,)
+    assert outbox.enqueue_email("bad", "s", "fixed", idempotency_key="k3")
+    with database.get_db() as conn:
+        assert conn.execute("SELECT status, text_content FROM email_outbox WHERE idempotency_key = 'k3'").fetchone() == ("pending", "fixed")
+
+    assert outbox.prune_email_outbox(retention=-1) == 2
+    with database.get_db() as conn:
+        assert [row[0] for row in conn.execute("SELECT idempotency_key FROM email_outbox")] == ["k3"]
+
+def test_otp_email_is_queued_unless_serverless(tmp_path, monkeypatch):
+    from app import database
+    from app.utils import notifications
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "otp.db"))
+    database.init_db()
+    monkeypatch.setenv("RESEND_API_KEY", "test")
+    monkeypatch.delenv("VERCEL", raising=False)
+
+    class Reply:
+        ok = True
+    posts = []
+    monkeypatch.setattr(notifications.requests, "post", lambda url, **kw: posts.append(kw) or Reply())
+
+    # With background workers the code is only stored, ahead of bulk mail
+    assert notifications.send_otp_email("a@example.com", "123456")
+    assert posts == []
+    with database.get_db() as conn:
+        assert conn.execute("SELECT idempotency_key, priority FROM email_outbox").fetchall() == [("otp:a@example.com:123456", 10)]
+
+    # On Vercel nothing would deliver the queue, so it is sent inline
+    monkeypatch.setenv("VERCEL", "1")
+    assert notifications.send_otp_email("b@example.com", "654321")
+    assert posts[0]["headers"]["Idempotency-Key"] == "otp:b@example.com:654321"
+
+def test_push_dispatcher_reuses_vapid_and_prunes_dead(tmp_path, monkeypatch):
+    from py_vapid import Vapid
+    from py_vapid.utils import b64urlencode
+    from app import database
+    from app.services import push_dispatcher
+
+    monkeypatch.setattr(database, "DATABASE", str(tmp_path / "push.db"))
+    database.init_db()
+    endpoints = ["https://fcm.googleapis.com/a", "https://fcm.googleapis.com/gone", "https://updates.push.services.mozilla.com/b"]
+    with database.get_db() as conn:
+        conn.executemany("INSERT INTO push_subscriptions (endpoint, p256dh, auth) VALUES (?, 'k', 'a')", [(e,) for e in endpoints])
+        conn.commit()
+
+    vapid = Vapid()
+    vapid.generate_keys()
+    # Same raw base64url form as the VAPID_PRIVATE_KEY env variable
+    raw_key = b64urlencode(vapid.private_key.private_numbers().private_value.to_bytes(32, "big"))
+    dispatcher = push_dispatcher.PushDispatcher(raw_key, "mailto:test@example.com", workers=4)
+    signed = []
+    original_sign = dispatcher.vapid.sign
+    monkeypatch.setattr(dispatcher.vapid, "sign", lambda claims: signed.append(claims["aud"]) or original_sign(claims))
+
+    class FakePusher:
+        def __init__(self, subscription_info, requests_session=None):
+            self.endpoint = subscription_info["endpoint"]
+
+        def send(self, data, headers, **kwargs):
+            assert headers["Authorization"].startswith("vapid ")
+            return type("Response", (), {"status_code": 410 if self.endpoint.endswith("gone") else 201})()
+
+    monkeypatch.setattr(push_dispatcher, "WebPusher", FakePusher)
+    messages = [({"endpoint": e, "keys": {}}, "{}") for e in endpoints]
+    results, stats = dispatcher.dispatch(messages)
+    dispatcher.dispatch(messages[:1])
+
+    assert results == [True, False, True]
+    assert stats["pruned"] == 1 and stats["origins"] == 2
+    assert sorted(signed) == ["https://fcm.googleapis.com", "https://updates.push.services.mozilla.com"]
+    with database.get_db() as conn:
+        remaining = [row[0] for row in conn.execute("SELECT endpoint FROM push_subscriptions")]
+    assert "https://fcm.googleapis.com/gone" not in remaining and len(remaining) == 2
+
+def test_push_subscriptions_near_uses_grid_cells(tmp_path, monkeypatch):
+    from app import database
+    from app.extensions import db
+    from app.models.user import PushSubscription
+    from app.services import notification_service
+    from app.services.notification_service import NotificationService
+
+    db_path = str(tmp_path / "spatial.db")
+    monkeypatch.setattr(database, "DATABASE", db_path)
+    database.init_db()
+    with database.get_db() as conn:
+        conn.executemany(
+            "INSERT INTO push_subscriptions (endpoint, lat, lon) VALUES (?, ?, ?)",
+            [("lahore", 31.52, 74.36), ("lahore-suburb", 31.40, 74.20), ("karachi", 24.86, 67.01)]
+        )
+        conn.execute("UPDATE push_subscriptions SET lat = -33.87, lon = 151.21 WHERE endpoint = 'karachi'")
+        conn.commit()
+        cells = dict(conn.execute("SELECT endpoint, cell_lat || ',' || cell_lon FROM push_subscriptions").fetchall())
+    assert cells == {"lahore": "315,744", "lahore-suburb": "314,742", "karachi": "-339,1512"}
+
+    spatial_app = Flask(__name__)
+    spatial_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + db_path
+    db.init_app(spatial_app)
+    with spatial_app.app_context():
+        near = NotificationService.subscriptions_near(31.55, 74.34, 30)
+        assert sorted(sub.endpoint for sub in near) == ["lahore", "lahore-suburb"]
+        assert [sub.endpoint for sub in NotificationService.subscriptions_near(31.55, 74.34, 5)] == ["lahore"]
+
+        # An explicit radius wins over the one in the alert payload
+        sent = []
+
+        class FakeDispatcher:
+            def dispatch(self, messages, prune=None):
+                sent.extend(info["endpoint"] for info, _ in messages)
+                return [True] * len(messages), {"messages": len(messages)}
+
+        monkeypatch.setattr(notification_service, "get_push_dispatcher", lambda: FakeDispatcher())
+        alert = {"event": "Flood Warning", "lat": 31.55, "lon": 74.34, "radius_km": 30}
+        NotificationService.broadcast_weather_alert(alert, radius_km=5)
+        assert sent == ["lahore"]
+        sent.clear()
+        NotificationService.broadcast_weather_alert(alert)
+        assert sorted(sent) == ["lahore", "lahore-suburb"]
+
+        # Dead endpoints reported to the service are pruned through its own session
+        assert NotificationService._remove_dead_subscriptions(["karachi", "unknown"]) == 1
+        assert sorted(sub.endpoint for sub in PushSubscription.query.all()) == ["lahore", "lahore-suburb"]
+
+    # Without the SQLite triggers (e.g. Postgres via DATABASE_URL) the model sets the cells itself
+    orm_app = Flask(__name__)
+    orm_app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///" + str(tmp_path / "orm.db")
+    db.init_app(orm_app)
+    with orm_app.app_context():
+        PushSubscription.__table__.create(db.engine)
+        sub = PushSubscription(endpoint="lahore", lat=31.52, lon=74.36)
+        db.session.add(sub)
+        db.session.commit()
+        assert (sub.cell_lat, sub.cell_lon) == (315, 744)
+        assert [s.endpoint for s in NotificationService.subscriptions_near(31.55, 74.34, 5)] == ["lahore"]
+        sub.lat = -33.87
+        db.session.commit()
+        assert sub.cell_lat == -339
+        assert [s.endpoint for s in NotificationService.subscriptions_near(31.55, 74.34, 5)] == []
+
+def test_fetch_cells_rate_limits_and_counts_failures(monkeypatch):
+    import time
+    import requests
+    from app import tasks
+
+    calls = []
+
+    class FakeResponse:
+        def __init__(self, url):
+            self.url = url
+
+        def raise_for_status(self):
+            if "lat=0.0" in self.url:
+                raise requests.HTTPError("500 Server Error")
+
+        def json(self):
+            return {"alerts": [{"event": "Storm"}] if "lat=1.0" in self.url else []}
+
+    class FakeSession:
+        def mount(self, prefix, adapter):
+            pass
+
+        def get(self, url, timeout=None):
+            calls.append(time.monotonic())
+            return FakeResponse(url)
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(tasks.requests, "Session", FakeSession)
+    cells = [(0.0, 0.0), (1.0, 1.0), (2.0, 2.0), (3.0, 3.0)]
+    results, stats = tasks.fetch_cells(
+        cells, lambda lat, lon: f"https://example.test/?lat={lat}&lon={lon}",
+        lambda data: data["alerts"], workers=4, max_rps=20
+    )
+
+    assert sorted(results) == ["1.0,1.0", "2.0,2.0", "3.0,3.0"]
+    assert results["1.0,1.0"] == [{"event": "Storm"}]
+    assert stats["locations"] == 4 and stats["fetched"] == 3 and stats["failed"] == 1
+    # 20 requests per second: four calls span at least three 50ms slots
+    assert max(calls) - min(calls) >= 3 * 0.05 - 0.005
+
+def test_rate_limiter_spaces_calls_across_threads():
+    import time
+    import threading
+    from app.tasks import RateLimiter
+
+    limiter = RateLimiter(50)
+    stamps = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(3):
+            limiter.wait()
+            with lock:
+                stamps.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stamps.sort()
+    assert len(stamps) == 9
+    assert stamps[-1] - stamps[0] >= 8 * 0.02 - 0.005
+    assert RateLimiter(0).interval == 0
+
 if __name__ == "__main__":
     test_flows()